@@ -0,0 +1,635 @@
+# This module contains the in-process fake of sly.Api that serves synthetic projects for benchmarks.
+
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Literal, Optional
+
+import supervisely as sly
+from PIL import Image
+from supervisely.api.annotation_api import AnnotationInfo
+from supervisely.api.dataset_api import DatasetInfo
+from supervisely.api.image_api import ImageInfo
+from supervisely.api.pointcloud.pointcloud_api import PointcloudInfo
+from supervisely.api.project_api import ProjectInfo
+from supervisely.api.video.video_api import VideoInfo
+from supervisely.geometry.cuboid_3d import Cuboid3d
+
+REQUEST_BATCH_SIZE = 50  # items per request of the bulk methods, as in the SDK
+PROJECT_TYPES = {
+    "image": str(sly.ProjectType.IMAGES),
+    "video": str(sly.ProjectType.VIDEOS),
+    "pointcloud": str(sly.ProjectType.POINT_CLOUDS),
+}
+ITEM_EXT = {"image": ".jpg", "video": ".mp4", "pointcloud": ".pcd"}
+# the same in every run, so incremental exports see the items of the previous run as unchanged
+UPDATED_AT = "2024-01-01T00:00:00.000Z"
+
+
+@dataclass
+class SyntheticProjectConfig:
+    """Shape of the synthetic project served by the fake API."""
+
+    item_type: Literal["image", "video", "pointcloud"] = "image"
+    datasets: int = 2
+    items_per_dataset: int = 500
+    labeled_ratio: float = 0.5
+    objects_per_item: int = 5
+    tags_per_item: int = 1
+    item_size: int = 200 * 1024  # bytes of image, video or point cloud file
+    frames: int = 30  # frames of every video
+    related_images: int = 3  # related images of every point cloud
+    related_image_size: int = 100 * 1024
+    duplicate_ratio: float = 0.0  # items with the same content as another item of the project
+    seed: int = 42
+
+
+@dataclass
+class NetworkConfig:
+    """Simulated server: every request costs latency plus transfer time of its payload."""
+
+    latency: float = 0.02  # seconds per request
+    bandwidth: float = 200 * 1024**2  # bytes per second of one request
+    failure_rate: float = 0.0  # share of item and upload requests that fail with 429
+    seed: int = 42
+
+    def request_time(self, nbytes: int = 0) -> float:
+        return self.latency + nbytes / self.bandwidth
+
+
+class FakeServerError(Exception):
+    """Error of the simulated server, like HTTP 429 Too Many Requests."""
+
+
+def _make_payload(size: int, rnd: random.Random) -> bytes:
+    """Returns valid JPEG image padded with random bytes to the given size.
+
+    The SDK validates images when they are added to the project, decoders ignore
+    the data after the end of the image.
+    """
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (128, 64, 32)).save(buffer, "JPEG")
+    image = buffer.getvalue()
+    return image + rnd.randbytes(max(0, size - len(image)))
+
+
+def _make_info(info_class, **fields):
+    """Creates SDK info named tuple, fields that are not given are set to None."""
+    values = dict.fromkeys(info_class._fields)
+    values.update({k: v for k, v in fields.items() if k in info_class._fields})
+    return info_class(**values)
+
+
+class SyntheticProject:
+    """Generates infos, annotations and payloads of a synthetic project.
+
+    Annotations and payloads are generated on request and are not kept in memory,
+    so the fake does not distort memory measurements of the export.
+    """
+
+    def __init__(self, config: SyntheticProjectConfig, project_id: int = 1):
+        self.config = config
+        self.project_id = project_id
+        self.name = f"benchmark_{config.item_type}"
+        self.updated_at = UPDATED_AT
+        rnd = random.Random(config.seed)
+        self._payload = _make_payload(max(config.item_size, config.related_image_size), rnd)
+        self.duplicate_of: Dict[int, int] = {}  # item ID -> ID of the item with the same content
+
+        self.datasets: List[DatasetInfo] = []
+        self.items: Dict[int, List] = {}  # dataset ID -> item infos
+        self.labeled = set()
+        self.dataset_of_item: Dict[int, int] = {}
+        item_id = 1
+        for ds_idx in range(config.datasets):
+            ds_id = 100 + ds_idx
+            n = config.items_per_dataset
+            self.datasets.append(
+                _make_info(
+                    DatasetInfo,
+                    id=ds_id,
+                    name=f"ds_{ds_idx}",
+                    project_id=project_id,
+                    items_count=n,
+                    parent_id=None,
+                    created_at=self.updated_at,
+                    updated_at=self.updated_at,
+                )
+            )
+            ids = list(range(item_id, item_id + n))
+            item_id += n
+            self.labeled.update(rnd.sample(ids, round(n * config.labeled_ratio)))
+            for i in ids:
+                if i > 1 and rnd.random() < config.duplicate_ratio:
+                    source = rnd.randint(1, i - 1)
+                    self.duplicate_of[i] = self.duplicate_of.get(source, source)
+            self.items[ds_id] = [self._item_info(ds_id, i) for i in ids]
+            self.dataset_of_item.update({i: ds_id for i in ids})
+
+    @property
+    def total_items(self) -> int:
+        return sum(len(infos) for infos in self.items.values())
+
+    @property
+    def total_size(self) -> int:
+        """Bytes of all item files, like size of the project reported by the server."""
+        item_size = self.config.item_size
+        if self.config.item_type == "pointcloud":
+            item_size += self.config.related_images * self.config.related_image_size
+        return self.total_items * item_size
+
+    @property
+    def labeled_items(self) -> int:
+        return len(self.labeled)
+
+    def project_info(self) -> ProjectInfo:
+        return _make_info(
+            ProjectInfo,
+            id=self.project_id,
+            name=self.name,
+            type=PROJECT_TYPES[self.config.item_type],
+            items_count=self.total_items,
+            datasets_count=len(self.datasets),
+            size=str(self.total_size),
+            updated_at=self.updated_at,
+        )
+
+    def meta_json(self) -> Dict:
+        geometry = Cuboid3d if self.config.item_type == "pointcloud" else sly.Rectangle
+        meta = sly.ProjectMeta(
+            obj_classes=[sly.ObjClass(f"class_{i}", geometry) for i in range(3)],
+            tag_metas=[sly.TagMeta(f"tag_{i}", sly.TagValueType.NONE) for i in range(3)],
+        )
+        return meta.to_json()
+
+    def _item_info(self, dataset_id: int, item_id: int):
+        cfg = self.config
+        labeled = item_id in self.labeled
+        fields = dict(
+            id=item_id,
+            name=f"item_{item_id}{ITEM_EXT[cfg.item_type]}",
+            dataset_id=dataset_id,
+            hash=f"hash_{self.duplicate_of.get(item_id, item_id)}",
+            created_at=self.updated_at,
+            updated_at=self.updated_at,
+            tags=[{"name": f"tag_{i % 3}"} for i in range(cfg.tags_per_item)] if labeled else [],
+        )
+        if cfg.item_type == "image":
+            return _make_info(
+                ImageInfo,
+                size=cfg.item_size,
+                width=1920,
+                height=1080,
+                labels_count=cfg.objects_per_item if labeled else 0,
+                ext="jpg",
+                mime="image/jpeg",
+                **fields,
+            )
+        if cfg.item_type == "video":
+            return _make_info(
+                VideoInfo,
+                frames_count=cfg.frames,
+                frame_width=1920,
+                frame_height=1080,
+                file_meta={"size": cfg.item_size},
+                **fields,
+            )
+        return _make_info(
+            PointcloudInfo, objects_count=cfg.objects_per_item if labeled else 0, **fields
+        )
+
+    def ann_json(self, item_id: int) -> Dict:
+        cfg = self.config
+        labeled = item_id in self.labeled
+        n_objects = cfg.objects_per_item if labeled else 0
+        tags = [{"name": f"tag_{i % 3}", "value": None} for i in range(cfg.tags_per_item)]
+        tags = tags if labeled else []
+        if cfg.item_type == "image":
+            objects = [
+                {
+                    "classTitle": f"class_{i % 3}",
+                    "geometryType": "rectangle",
+                    "points": {"exterior": [[i, i], [i + 100, i + 100]], "interior": []},
+                    "tags": [],
+                }
+                for i in range(n_objects)
+            ]
+            return {
+                "description": "",
+                "size": {"height": 1080, "width": 1920},
+                "tags": tags,
+                "objects": objects,
+            }
+
+        # the server returns IDs of tags, objects and figures of videos and point clouds
+        for i, tag in enumerate(tags):
+            tag.update(key=uuid.UUID(int=item_id * 1000 + 900 + i).hex, id=item_id * 1000 + i)
+        objects = [
+            {
+                "id": item_id * 1000 + i,
+                "key": uuid.UUID(int=item_id * 1000 + i).hex,
+                "classTitle": f"class_{i % 3}",
+                "tags": [],
+            }
+            for i in range(n_objects)
+        ]
+        if cfg.item_type == "video":
+            frames = [
+                {
+                    "index": frame,
+                    "figures": [
+                        {
+                            "id": (item_id * 1000 + i) * 100000 + frame,
+                            "key": uuid.UUID(int=(item_id * 1000 + i) * 100000 + frame).hex,
+                            "objectKey": obj["key"],
+                            "geometryType": "rectangle",
+                            "geometry": {
+                                "points": {
+                                    "exterior": [[frame, frame], [frame + 50, frame + 50]],
+                                    "interior": [],
+                                }
+                            },
+                        }
+                        for i, obj in enumerate(objects)
+                    ],
+                }
+                for frame in range(cfg.frames if labeled else 0)
+            ]
+            return {
+                "description": "",
+                "key": uuid.UUID(int=item_id).hex,
+                "videoId": item_id,
+                "size": {"height": 1080, "width": 1920},
+                "framesCount": cfg.frames,
+                "tags": tags,
+                "objects": objects,
+                "frames": frames,
+            }
+
+        figures = [
+            {
+                "id": (item_id * 1000 + i) * 100000,
+                "key": uuid.UUID(int=(item_id * 1000 + i) * 100000).hex,
+                "objectKey": obj["key"],
+                "geometryType": "cuboid_3d",
+                "geometry": {
+                    "position": {"x": i, "y": i, "z": 0},
+                    "rotation": {"x": 0, "y": 0, "z": 0},
+                    "dimensions": {"x": 1, "y": 2, "z": 1},
+                },
+            }
+            for i, obj in enumerate(objects)
+        ]
+        return {
+            "description": "",
+            "key": uuid.UUID(int=item_id).hex,
+            "pointCloudId": item_id,
+            "tags": tags,
+            "objects": objects,
+            "figures": figures,
+        }
+
+    def item_bytes(self, item_id: int) -> bytes:
+        return self._payload[: self.config.item_size]
+
+    def related_images(self, pcd_id: int) -> List[Dict]:
+        return [
+            {
+                "id": pcd_id * 100 + i,
+                "entityId": pcd_id,
+                "name": f"item_{pcd_id}_cam{i}.jpg",
+                "hash": f"rimage_hash_{pcd_id}_{i}",
+                "meta": {"deviceId": f"cam{i}", "sensorsData": {}},
+            }
+            for i in range(self.config.related_images)
+        ]
+
+    def related_image_bytes(self, rimage_id: int) -> bytes:
+        return self._payload[: self.config.related_image_size]
+
+
+class _FakeNetwork:
+    """Shared request accounting of the fake API.
+
+    Requests that can fail (item listing, annotations, item files and uploads) raise
+    FakeServerError with probability ``failure_rate``, after the latency of the request.
+    """
+
+    def __init__(self, config: NetworkConfig):
+        self.config = config
+        self.requests = 0
+        self.bytes_sent = 0
+        self.failures = 0
+        self._rnd = random.Random(config.seed)
+
+    def _maybe_fail(self):
+        if self._rnd.random() < self.config.failure_rate:
+            self.failures += 1
+            raise FakeServerError("429 Too Many Requests")
+
+    def request(self, nbytes: int = 0, can_fail: bool = False):
+        self.requests += 1
+        time.sleep(self.config.request_time(nbytes))
+        if can_fail:
+            self._maybe_fail()
+        self.bytes_sent += nbytes
+
+    async def request_async(self, nbytes: int = 0, semaphore: Optional[asyncio.Semaphore] = None):
+        self.requests += 1
+        if semaphore is None:
+            await asyncio.sleep(self.config.request_time(nbytes))
+            self._maybe_fail()
+        else:
+            async with semaphore:
+                await asyncio.sleep(self.config.request_time(nbytes))
+                self._maybe_fail()
+        self.bytes_sent += nbytes
+
+
+async def _gather_batches(ids: List, fetch_batch: Callable, progress_cb=None) -> List:
+    """Runs one request per batch concurrently and returns results in the order of IDs."""
+
+    async def _fetch(batch):
+        result = await fetch_batch(batch)
+        if progress_cb is not None:
+            progress_cb(len(batch))
+        return result
+
+    results = await asyncio.gather(*[_fetch(b) for b in sly.batched(ids, REQUEST_BATCH_SIZE)])
+    return [item for batch_result in results for item in batch_result]
+
+
+def _write_file(path: str, data: bytes):
+    sly.fs.ensure_base_path(path)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class _FakeAnnotationApi:
+    def __init__(self, project: SyntheticProject, net: _FakeNetwork):
+        self._project = project
+        self._net = net
+
+    async def _fetch(self, ids: List[int], semaphore) -> List[Dict]:
+        anns = [self._project.ann_json(item_id) for item_id in ids]
+        await self._net.request_async(len(json.dumps(anns)), semaphore)
+        return anns
+
+
+class _FakeImageAnnotationApi(_FakeAnnotationApi):
+    async def download_bulk_async(
+        self, dataset_id: int, image_ids: List[int], progress_cb=None, semaphore=None, **kwargs
+    ) -> List[AnnotationInfo]:
+        async def _fetch_batch(ids):
+            anns = await self._fetch(ids, semaphore)
+            return [
+                _make_info(
+                    AnnotationInfo,
+                    image_id=item_id,
+                    image_name=f"item_{item_id}.jpg",
+                    annotation=ann,
+                    created_at=self._project.updated_at,
+                    updated_at=self._project.updated_at,
+                )
+                for item_id, ann in zip(ids, anns)
+            ]
+
+        return await _gather_batches(image_ids, _fetch_batch, progress_cb)
+
+
+class _FakeEntityAnnotationApi(_FakeAnnotationApi):
+    async def download_bulk_async(
+        self, ids: List[int], semaphore=None, progress_cb=None, **kwargs
+    ) -> List[Dict]:
+        return await _gather_batches(ids, lambda b: self._fetch(b, semaphore), progress_cb)
+
+
+class _FakeItemApi:
+    def __init__(self, project: SyntheticProject, net: _FakeNetwork):
+        self._project = project
+        self._net = net
+
+    def get_list(
+        self,
+        dataset_id: int,
+        filters: Optional[List[Dict]] = None,
+        *args,
+        limit: Optional[int] = None,
+        **kwargs,
+    ) -> List:
+        infos = self._project.items.get(dataset_id, [])
+        for item_filter in filters or []:  # only "id > value" filter of paginated listing
+            if item_filter["field"] == "id" and item_filter["operator"] == ">":
+                infos = [info for info in infos if info.id > item_filter["value"]]
+        if limit is not None:
+            infos = infos[:limit]
+        for _ in sly.batched(infos, 500):  # one request per page
+            self._net.request(can_fail=True)
+        return list(infos)
+
+    def get_list_generator(self, dataset_id: int, *args, batch_size: int = 500, **kwargs):
+        for page in sly.batched(self._project.items.get(dataset_id, []), batch_size):
+            self._net.request()
+            yield list(page)
+
+    async def download_paths_async(
+        self, ids: List[int], paths: List[str], semaphore=None, progress_cb=None, **kwargs
+    ):
+        async def _download(item_id, path):
+            data = self._project.item_bytes(item_id)
+            await self._net.request_async(len(data), semaphore)
+            await asyncio.to_thread(_write_file, path, data)
+            if progress_cb is not None:
+                progress_cb(1)
+
+        await asyncio.gather(*[_download(i, p) for i, p in zip(ids, paths)])
+
+
+class _FakeImageApi(_FakeItemApi):
+    async def download_bytes_generator_async(
+        self, dataset_id: int, img_ids: List[int], semaphore=None, **kwargs
+    ):
+        for batch in sly.batched(img_ids, REQUEST_BATCH_SIZE):
+            data = [self._project.item_bytes(img_id) for img_id in batch]
+            await self._net.request_async(sum(len(d) for d in data), semaphore)
+            for img_id, img_bytes in zip(batch, data):
+                yield img_id, img_bytes
+
+
+class _FakeVideoApi(_FakeItemApi):
+    def __init__(self, project: SyntheticProject, net: _FakeNetwork):
+        super().__init__(project, net)
+        self.annotation = _FakeEntityAnnotationApi(project, net)
+
+
+class _FakePointcloudApi(_FakeItemApi):
+    def __init__(self, project: SyntheticProject, net: _FakeNetwork):
+        super().__init__(project, net)
+        self.annotation = _FakeEntityAnnotationApi(project, net)
+
+    def get_list_related_images(self, id: int) -> List[Dict]:
+        self._net.request()
+        return self._project.related_images(id)
+
+    def get_list_related_images_batch(self, dataset_id: int, ids: List[int]) -> List[Dict]:
+        self._net.request(can_fail=True)
+        return [info for pcd_id in ids for info in self._project.related_images(pcd_id)]
+
+    async def download_related_images_async(
+        self, ids: List[int], paths: List[str], semaphore=None, **kwargs
+    ):
+        async def _download(rimage_id, path):
+            data = self._project.related_image_bytes(rimage_id)
+            await self._net.request_async(len(data), semaphore)
+            await asyncio.to_thread(_write_file, path, data)
+
+        await asyncio.gather(*[_download(i, p) for i, p in zip(ids, paths)])
+
+
+class _FakeDatasetApi:
+    def __init__(self, project: SyntheticProject, net: _FakeNetwork):
+        self._project = project
+        self._net = net
+
+    def get_list(self, project_id: int, *args, **kwargs) -> List[DatasetInfo]:
+        self._net.request()
+        return list(self._project.datasets)
+
+    def tree(self, project_id: int):
+        self._net.request()
+        for dataset_info in self._project.datasets:
+            yield [], dataset_info
+
+
+class _FakeProjectApi:
+    def __init__(self, project: SyntheticProject, net: _FakeNetwork):
+        self._project = project
+        self._net = net
+
+    def get_info_by_id(self, id: int, *args, **kwargs) -> Optional[ProjectInfo]:
+        self._net.request()
+        return self._project.project_info() if id == self._project.project_id else None
+
+    def get_meta(self, id: int, *args, **kwargs) -> Dict:
+        self._net.request()
+        return self._project.meta_json()
+
+
+class FakeFileApi:
+    """Team Files kept in a local directory. Upload time is simulated with the network config."""
+
+    def __init__(self, root_dir: str, net: _FakeNetwork):
+        self.root_dir = root_dir
+        self._net = net
+        self._ids: Dict[str, int] = {}
+
+    def _local_path(self, remote_path: str) -> str:
+        return os.path.join(self.root_dir, remote_path.lstrip("/"))
+
+    def _info(self, remote_path: str):
+        local_path = self._local_path(remote_path)
+        if not os.path.exists(local_path):
+            return None
+        file_id = self._ids.setdefault(remote_path, len(self._ids) + 1)
+        return SimpleNamespace(
+            id=file_id,
+            team_id=1,
+            name=os.path.basename(remote_path),
+            path=remote_path,
+            sizeb=sly.fs.get_file_size(local_path) if os.path.isfile(local_path) else 0,
+        )
+
+    def exists(self, team_id: int, remote_path: str, *args, **kwargs) -> bool:
+        return os.path.isfile(self._local_path(remote_path))
+
+    def get_info_by_path(self, team_id: int, remote_path: str):
+        return self._info(remote_path)
+
+    def get_info_by_id(self, id: int):
+        for remote_path, file_id in self._ids.items():
+            if file_id == id:
+                return self._info(remote_path)
+        return None
+
+    def download(self, team_id: int, remote_path: str, local_save_path: str, *args, **kwargs):
+        sly.fs.ensure_base_path(local_save_path)
+        shutil.copyfile(self._local_path(remote_path), local_save_path)
+
+    def upload(self, team_id: int, src: str, dst: str, *args, can_fail: bool = True, **kwargs):
+        self._net.request(sly.fs.get_file_size(src), can_fail=can_fail)
+        local_path = self._local_path(dst)
+        sly.fs.ensure_base_path(local_path)
+        shutil.copyfile(src, local_path)
+        return self._info(dst)
+
+    def dir_exists(self, team_id: int, remote_dir: str, *args, **kwargs) -> bool:
+        return os.path.isdir(self._local_path(remote_dir))
+
+    def get_free_dir_name(self, team_id: int, remote_dir: str) -> str:
+        suffix = 1
+        while self.dir_exists(team_id, f"{remote_dir.rstrip('/')}_{suffix:03d}"):
+            suffix += 1
+        return f"{remote_dir.rstrip('/')}_{suffix:03d}"
+
+    def upload_directory(self, team_id: int, local_dir: str, remote_dir: str, *args, **kwargs):
+        for path in sly.fs.list_files_recursively(local_dir):
+            self.upload(team_id, path, os.path.join(remote_dir, os.path.relpath(path, local_dir)))
+        return remote_dir
+
+    def listdir(self, team_id: int, remote_dir: str, recursive: bool = False) -> List[str]:
+        local_dir = self._local_path(remote_dir)
+        if not os.path.isdir(local_dir):
+            return []
+        return [os.path.join(remote_dir, name) for name in sorted(os.listdir(local_dir))]
+
+    def remove(self, team_id: int, remote_path: str):
+        sly.fs.silent_remove(self._local_path(remote_path))
+
+    def get_directory_size(self, team_id: int, remote_dir: str) -> int:
+        return sly.fs.get_directory_size(self._local_path(remote_dir))
+
+
+class FakeApi:
+    """In-process stand-in for sly.Api that implements the methods used by the export."""
+
+    def __init__(self, project: SyntheticProject, team_files_dir: str, network: NetworkConfig):
+        self.network = _FakeNetwork(network)
+        self.project = _FakeProjectApi(project, self.network)
+        self.dataset = _FakeDatasetApi(project, self.network)
+        self.image = _FakeImageApi(project, self.network)
+        self.annotation = _FakeImageAnnotationApi(project, self.network)
+        self.video = _FakeVideoApi(project, self.network)
+        self.pointcloud = _FakePointcloudApi(project, self.network)
+        self.file = FakeFileApi(team_files_dir, self.network)
+        workflow = SimpleNamespace(
+            add_input_project=lambda *args, **kwargs: None,
+            add_output_file=lambda *args, **kwargs: None,
+        )
+        self.app = SimpleNamespace(workflow=workflow)
+        self.task = SimpleNamespace(
+            set_output_directory=lambda *args, **kwargs: None,
+            set_output_archive=lambda *args, **kwargs: None,
+        )
+
+    def set_download(self, local_path: str, *args, **kwargs):
+        """Replacement of sly.output.set_download that uploads the result to fake Team Files."""
+        if os.path.isdir(local_path):
+            archive_path = f"{local_path}.tar"
+            sly.fs.archive_directory(local_path, archive_path)
+            sly.fs.remove_dir(local_path)
+        else:
+            archive_path = local_path
+        remote_path = os.path.join(
+            sly.team_files.RECOMMENDED_EXPORT_PATH, "task", os.path.basename(archive_path)
+        )
+        # set_download of the SDK retries the upload itself
+        file_info = self.file.upload(1, archive_path, remote_path, can_fail=False)
+        sly.fs.silent_remove(archive_path)
+        return file_info
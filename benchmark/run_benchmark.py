@@ -0,0 +1,299 @@
+# This module runs the export end to end against the fake API and reports throughput, memory and disk usage.
+#
+# Usage:
+#   python benchmark/run_benchmark.py --item-type image --items 2000 --labeled-ratio 0.3
+#   python benchmark/run_benchmark.py --item-type pointcloud --runs 2 --incremental-mode delta
+#   python benchmark/run_benchmark.py --baseline /tmp/export_benchmark/results.jsonl  # fail on slowdown
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_DIR, "src")
+# results are kept outside of the repository, so runs do not leave changes in the working tree
+DEFAULT_RESULTS_PATH = os.path.join(tempfile.gettempdir(), "export_benchmark", "results.jsonl")
+RUN_RESULT_FILE_NAME = "run_result.json"
+
+
+class DiskUsageSampler(threading.Thread):
+    """Samples total size of the given directories in background and keeps the peak value."""
+
+    def __init__(self, dirs: List[str], interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.dirs = dirs
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def _get_size(self) -> int:
+        size = 0
+        for directory in self.dirs:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    try:
+                        size += os.path.getsize(os.path.join(root, name))
+                    except OSError:
+                        pass  # file was removed while walking
+        return size
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, self._get_size())
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, self._get_size())
+        return self.peak
+
+
+def get_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the labeled items export")
+    project = parser.add_argument_group("synthetic project")
+    project.add_argument("--item-type", choices=["image", "video", "pointcloud"], default="image")
+    project.add_argument("--datasets", type=int, default=2)
+    project.add_argument("--items", type=int, default=500, help="items per dataset")
+    project.add_argument("--labeled-ratio", type=float, default=0.5)
+    project.add_argument("--objects", type=int, default=5, help="objects per labeled item")
+    project.add_argument("--tags", type=int, default=1, help="tags per labeled item")
+    project.add_argument("--item-kb", type=int, default=200, help="size of every item file")
+    project.add_argument("--frames", type=int, default=30, help="frames of every video")
+    project.add_argument("--related-images", type=int, default=3, help="per point cloud")
+    project.add_argument("--related-image-kb", type=int, default=100)
+    project.add_argument(
+        "--duplicate-ratio", type=float, default=0.0, help="items with the content of other items"
+    )
+    project.add_argument("--seed", type=int, default=42)
+
+    network = parser.add_argument_group("simulated network")
+    network.add_argument("--latency-ms", type=float, default=20)
+    network.add_argument("--bandwidth-mbps", type=float, default=200, help="MB/s per request")
+    network.add_argument(
+        "--failure-rate", type=float, default=0.0, help="share of requests failing with 429"
+    )
+
+    export = parser.add_argument_group("export options")
+    export.add_argument("--annotations-only", action="store_true")
+    export.add_argument("--stream-archive", action="store_true")
+    export.add_argument("--incremental-mode", choices=["off", "delta", "complete"], default="off")
+    export.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app")
+
+    parser.add_argument("--runs", type=int, default=1, help="exports of the same project in a row")
+    parser.add_argument("--work-dir", help="directory for data, state and fake Team Files")
+    parser.add_argument("--output", default=DEFAULT_RESULTS_PATH, help="results JSONL to append")
+    parser.add_argument("--baseline", help="results JSONL to compare the new results with")
+    parser.add_argument("--max-slowdown", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--single-run", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def get_scenario(args: argparse.Namespace) -> Dict:
+    """Parameters that identify comparable benchmark results."""
+    return {
+        "item_type": args.item_type,
+        "datasets": args.datasets,
+        "items": args.items,
+        "labeled_ratio": args.labeled_ratio,
+        "objects": args.objects,
+        "tags": args.tags,
+        "item_kb": args.item_kb,
+        "frames": args.frames,
+        "related_images": args.related_images,
+        "related_image_kb": args.related_image_kb,
+        "duplicate_ratio": args.duplicate_ratio,
+        "seed": args.seed,
+        "latency_ms": args.latency_ms,
+        "bandwidth_mbps": args.bandwidth_mbps,
+        "failure_rate": args.failure_rate,
+        "annotations_only": args.annotations_only,
+        "stream_archive": args.stream_archive,
+        "incremental_mode": args.incremental_mode,
+        "env": sorted(args.env),
+    }
+
+
+def run_export(args: argparse.Namespace, work_dir: str) -> Dict:
+    """Runs one export in the current process. Must be called once per process,
+    because the app reads its settings from environment variables on import."""
+    os.environ.update(
+        {
+            "TEAM_ID": "1",
+            "WORKSPACE_ID": "1",
+            "PROJECT_ID": "1",
+            "SERVER_ADDRESS": "http://localhost",
+            "API_TOKEN": "benchmark",
+            "modal.state.items": str(not args.annotations_only),
+            "modal.state.streamArchive": str(args.stream_archive),
+            "modal.state.incrementalMode": args.incremental_mode,
+            "EXPORT_STATE_DIR": os.path.join(work_dir, "state"),
+        }
+    )
+    for pair in args.env:
+        key, value = pair.split("=", 1)
+        os.environ[key] = value
+    os.chdir(work_dir)
+    sys.path.insert(0, SRC_DIR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import supervisely as sly
+
+    import main
+    from fake_api import FakeApi, NetworkConfig, SyntheticProject, SyntheticProjectConfig
+
+    project = SyntheticProject(
+        SyntheticProjectConfig(
+            item_type=args.item_type,
+            datasets=args.datasets,
+            items_per_dataset=args.items,
+            labeled_ratio=args.labeled_ratio,
+            objects_per_item=args.objects,
+            tags_per_item=args.tags,
+            item_size=args.item_kb * 1024,
+            frames=args.frames,
+            related_images=args.related_images,
+            related_image_size=args.related_image_kb * 1024,
+            duplicate_ratio=args.duplicate_ratio,
+            seed=args.seed,
+        ),
+        project_id=1,
+    )
+    network = NetworkConfig(
+        args.latency_ms / 1000, args.bandwidth_mbps * 1024**2, args.failure_rate, args.seed
+    )
+    team_files_dir = os.path.join(work_dir, "team_files")
+    api = FakeApi(project, team_files_dir, network)
+    sly.output.set_download = api.set_download
+
+    sampler = DiskUsageSampler([main.DATA_DIR, os.path.join(work_dir, "state")])
+    sampler.start()
+    start = time.monotonic()
+    main.export_only_labeled_items(api)
+    wall_time = time.monotonic() - start
+    peak_disk = sampler.stop()
+
+    report = main.report.to_json()
+    mb_served = api.network.bytes_sent / 1024**2
+    return {
+        "wall_time_sec": round(wall_time, 3),
+        "items_total": project.total_items,
+        "items_labeled": project.labeled_items,
+        "items_per_sec": round(project.total_items / wall_time, 2),
+        "mb_per_sec": round(mb_served / wall_time, 2),
+        "requests": api.network.requests,
+        "failed_requests": api.network.failures,
+        "failed_items": len(report.get("failed_items", [])),
+        "duplicates": report.get("deduplication", {}).get("duplicates", 0),
+        "peak_rss_mb": report["peak_rss_mb"],
+        "peak_disk_mb": round(peak_disk / 1024**2, 2),
+        "team_files_mb": round(sly.fs.get_directory_size(team_files_dir) / 1024**2, 2),
+        "stages": report["stages"],
+    }
+
+
+def load_results(path: str) -> List[Dict]:
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_with_baseline(results: List[Dict], baseline: List[Dict], max_slowdown: float) -> bool:
+    """Prints wall time change against the last baseline result of the same scenario and run.
+
+    Returns False if any run is slower than allowed.
+    """
+    ok = True
+    for result in results:
+        previous = [
+            r for r in baseline if r["scenario"] == result["scenario"] and r["run"] == result["run"]
+        ]
+        if not previous:
+            print(f"run {result['run']}: no baseline for this scenario")
+            continue
+        base = previous[-1]
+        ratio = result["wall_time_sec"] / base["wall_time_sec"]
+        rss_delta = result["peak_rss_mb"] - base["peak_rss_mb"]
+        print(
+            f"run {result['run']}: wall time {base['wall_time_sec']}s -> "
+            f"{result['wall_time_sec']}s ({(ratio - 1) * 100:+.1f}%), "
+            f"peak RSS {rss_delta:+.1f} MB (baseline commit {base.get('commit')})"
+        )
+        if ratio > 1 + max_slowdown:
+            ok = False
+    return ok
+
+
+def main():
+    args = parse_args()
+    if args.single_run is not None:
+        result = run_export(args, args.work_dir)
+        with open(os.path.join(args.work_dir, RUN_RESULT_FILE_NAME), "w") as f:
+            json.dump(result, f)
+        return
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="export_benchmark_")
+    os.makedirs(work_dir, exist_ok=True)
+    scenario = get_scenario(args)
+    commit = get_commit()
+    results = []
+    try:
+        for run in range(args.runs):
+            # every run is a separate process: the app reads settings on import
+            # and peak RSS of the process is not reset between runs
+            # the last --work-dir argument overrides the one given by user
+            cmd = [sys.executable, os.path.abspath(__file__), *sys.argv[1:]]
+            cmd += ["--work-dir", work_dir, "--single-run", str(run)]
+            subprocess.run(cmd, check=True)
+            with open(os.path.join(work_dir, RUN_RESULT_FILE_NAME)) as f:
+                result = json.load(f)
+            result = {
+                "timestamp": datetime.now().isoformat(),
+                "commit": commit,
+                "scenario": scenario,
+                "run": run,
+                **result,
+            }
+            results.append(result)
+            print(json.dumps({k: v for k, v in result.items() if k != "stages"}, indent=4))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    ok = True
+    if args.baseline:
+        ok = compare_with_baseline(results, load_results(args.baseline), args.max_slowdown)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+    if not ok:
+        sys.exit(f"Export is slower than the baseline by more than {args.max_slowdown:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# This module contains parsing and writing of video and point cloud annotations in a process pool.
+
+import asyncio
+import json
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+
+import supervisely as sly
+from supervisely.video_annotation.key_id_map import KeyIdMap
+
+CHUNK_SIZE = 20  # annotations per task, long videos have thousands of figures each
+_broken_pools = weakref.WeakSet()  # pools which workers died, annotations are parsed in threads
+
+
+def _ping():
+    return None
+
+
+def create_pool(workers: int) -> Optional[Executor]:
+    """Creates process pool for annotations parsing. Returns None if there is one worker.
+
+    Worker processes are forked right away, before the export starts its threads,
+    and the main script is not imported again in them.
+    """
+    if workers <= 1:
+        return None
+    context = multiprocessing.get_context("fork")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    pool.submit(_ping).result()
+    return pool
+
+
+def write_annotations(
+    item_type: Literal["video", "pointcloud"],
+    meta_json: Dict,
+    ann_jsons: List[Dict],
+    ann_paths: List[str],
+) -> Dict:
+    """Parses annotations, writes them to the given paths and returns KeyIdMap as dict.
+
+    Runs in a worker process, so it gets and returns only JSON-serializable data.
+    """
+    meta = sly.ProjectMeta.from_json(meta_json)
+    key_id_map = KeyIdMap()
+    if item_type == "video":
+        ann_class = sly.VideoAnnotation
+    else:
+        ann_class = sly.PointcloudAnnotation
+    for ann_json, ann_path in zip(ann_jsons, ann_paths):
+        ann = ann_class.from_json(ann_json, meta, key_id_map)
+        sly.fs.ensure_base_path(ann_path)
+        sly.json.dump_json_file(ann.to_json(), ann_path)
+    return key_id_map.to_dict()
+
+
+class KeyIdMapSpool:
+    """KeyIdMap of the project kept in a file on disk instead of memory.
+
+    Parts of the KeyIdMap returned by the workers are appended to the spool file as JSON
+    lines, ``dump`` writes them to key_id_map.json section by section, so memory does
+    not grow with the number of annotations in the project. Parts are appended as chunks
+    of annotations are parsed, every part is added with its position in the project,
+    and ``dump`` writes them in the order of the positions, so key_id_map.json does
+    not depend on the order in which batches and datasets are finished.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sections = list(KeyIdMap().to_dict())
+        self._lock = threading.Lock()
+        sly.fs.ensure_base_path(path)
+        open(path, "w").close()
+
+    def add(self, data: Dict, order: Tuple[int, ...]):
+        """Adds part of the KeyIdMap, ``order`` is its position in the project,
+        e.g. (dataset index, batch index, chunk index), parts of positions of different
+        length are ordered as tuples."""
+        if not any(data.values()):
+            return
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"order": list(order), "data": data}) + "\n")
+
+    def _get_offsets(self) -> List[int]:
+        """Returns offsets of the lines in the spool file sorted by positions of the parts."""
+        lines = []
+        with open(self.path, "rb") as f:
+            offset = f.tell()
+            for line in iter(f.readline, b""):
+                lines.append((json.loads(line)["order"], offset))
+                offset = f.tell()
+        return [offset for _, offset in sorted(lines)]
+
+    def _iter_section(self, section: str, offsets: List[int]) -> Iterator[Tuple[str, int]]:
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                yield from json.loads(f.readline())["data"].get(section, {}).items()
+
+    def dump(self, path: str):
+        """Writes key_id_map.json in the format of ``KeyIdMap.dump_json``."""
+        with self._lock:
+            offsets = self._get_offsets()
+            with open(path, "w") as f:
+                f.write("{")
+                for section_idx, section in enumerate(self.sections):
+                    if section_idx > 0:
+                        f.write(", ")
+                    f.write(json.dumps(section) + ": {")
+                    for idx, (key, item_id) in enumerate(self._iter_section(section, offsets)):
+                        f.write((", " if idx > 0 else "") + f"{json.dumps(key)}: {item_id}")
+                    f.write("}")
+                f.write("}")
+
+
+async def _run_write_annotations(pool: Optional[Executor], *args) -> Dict:
+    """Runs ``write_annotations`` in the pool, or in a thread if there is no pool or it is broken."""
+    if pool is not None and pool not in _broken_pools:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, write_annotations, *args)
+        except BrokenProcessPool as e:
+            if pool not in _broken_pools:
+                _broken_pools.add(pool)
+                sly.logger.warning(
+                    f"Annotations parsing pool is broken: {repr(e)}. "
+                    "Annotations are parsed in the main process"
+                )
+    return await asyncio.to_thread(write_annotations, *args)
+
+
+async def write_annotations_parallel(
+    pool: Optional[Executor],
+    item_type: Literal["video", "pointcloud"],
+    meta: sly.ProjectMeta,
+    ann_jsons: List[Dict],
+    ann_paths: List[str],
+    key_id_spool: KeyIdMapSpool,
+    order: Tuple[int, ...] = (),
+    progress_cb=None,
+) -> Dict[int, Exception]:
+    """Parses and writes annotations by chunks in the process pool.
+
+    KeyIdMap parts of the chunks are added to the spool at position ``order`` of the
+    annotations in the project followed by the chunk index.
+    Without pool, or if its workers die, chunks are parsed in a thread.
+    If a chunk fails, its annotations are parsed one by one, so only the annotations
+    that can not be parsed are lost. Returns errors by indexes of these annotations.
+    """
+    meta_json = meta.to_json()
+    errors = {}
+
+    async def _write_chunk(chunk_idx: int, start: int):
+        chunk_jsons = ann_jsons[start : start + CHUNK_SIZE]
+        chunk_paths = ann_paths[start : start + CHUNK_SIZE]
+        try:
+            part = await _run_write_annotations(
+                pool, item_type, meta_json, chunk_jsons, chunk_paths
+            )
+        except Exception:
+            # annotations of the failed chunk are parsed one by one, each at its own position
+            for idx, (ann_json, ann_path) in enumerate(zip(chunk_jsons, chunk_paths)):
+                try:
+                    part = await _run_write_annotations(
+                        pool, item_type, meta_json, [ann_json], [ann_path]
+                    )
+                except Exception as e:
+                    errors[start + idx] = e
+                    continue
+                await asyncio.to_thread(key_id_spool.add, part, (*order, chunk_idx, idx))
+        else:
+            await asyncio.to_thread(key_id_spool.add, part, (*order, chunk_idx))
+        if progress_cb is not None:
+            progress_cb(len(chunk_jsons))
+
+    chunks = enumerate(range(0, len(ann_jsons), CHUNK_SIZE))
+    await asyncio.gather(*[_write_chunk(chunk_idx, start) for chunk_idx, start in chunks])
+    return errors
@@ -0,0 +1,180 @@
+# This module contains the agent-local cache of item files by content hash, shared by export runs.
+
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+import supervisely as sly
+
+BLOBS_DIR_NAME = "blobs"
+LOCK_FILE_NAME = ".lock"
+EVICT_TO_RATIO = 0.9  # eviction frees space down to this part of the size limit
+
+
+def _link_or_copy(src_path: str, dst_path: str):
+    try:
+        os.link(src_path, dst_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(src_path, dst_path)  # cache is on another file system
+
+
+class BlobCache:
+    """Content-addressed cache of item files stored outside of the task data directory.
+
+    Files are stored by item hash and evicted in least recently used order when total
+    size exceeds the limit. Several export tasks can use the same cache at once:
+    files are added with atomic rename, eviction is done by one process at a time
+    under a file lock, and a file that is evicted while being read is treated as a miss.
+    """
+
+    def __init__(self, root_dir: str, size_limit: int):
+        self.root_dir = root_dir
+        self.size_limit = size_limit
+        self.blobs_dir = os.path.join(root_dir, BLOBS_DIR_NAME)
+        self.lock_path = os.path.join(root_dir, LOCK_FILE_NAME)
+        sly.fs.mkdir(self.blobs_dir)
+        self.hits = 0
+        self.misses = 0
+        self.hit_bytes = 0
+        self._lock = threading.Lock()
+        self._size = sum(size for _, size, _ in self._list_blobs())
+
+    def _blob_path(self, item_hash: str) -> str:
+        # item hashes may contain "/" and other symbols that are not allowed in file names
+        key = hashlib.sha256(item_hash.encode("utf-8")).hexdigest()
+        return os.path.join(self.blobs_dir, key[:2], key)
+
+    def _list_blobs(self) -> List[Tuple[str, int, float]]:
+        """Returns (path, size, last access time) of all cached files."""
+        blobs = []
+        for root, _, files in os.walk(self.blobs_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # evicted by another task
+                blobs.append((path, stat.st_size, stat.st_mtime))
+        return blobs
+
+    def _count(self, hit: bool, size: int = 0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_bytes += size
+            else:
+                self.misses += 1
+
+    def _touch(self, path: str):
+        # modification time is used as the last access time, atime is often disabled
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def get_bytes(self, item_hash: Optional[str]) -> Optional[bytes]:
+        if item_hash is None:
+            return None
+        path = self._blob_path(item_hash)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        self._touch(path)
+        self._count(hit=True, size=len(data))
+        return data
+
+    def get_file(self, item_hash: Optional[str], dst_path: str) -> bool:
+        """Creates file of the item from the cache. Returns False if it is not cached."""
+        if item_hash is None:
+            return False
+        path = self._blob_path(item_hash)
+        sly.fs.ensure_base_path(dst_path)
+        sly.fs.silent_remove(dst_path)
+        try:
+            _link_or_copy(path, dst_path)
+        except FileNotFoundError:
+            self._count(hit=False)
+            return False
+        self._touch(path)
+        self._count(hit=True, size=sly.fs.get_file_size(dst_path))
+        return True
+
+    def _add(self, item_hash: str, write_tmp: Callable[[str], None]):
+        path = self._blob_path(item_hash)
+        if os.path.isfile(path):
+            return
+        sly.fs.ensure_base_path(path)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            write_tmp(tmp_path)
+            size = sly.fs.get_file_size(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            sly.fs.silent_remove(tmp_path)
+            sly.logger.debug(f"Can not add file to the cache: {repr(e)}")
+            return
+        with self._lock:
+            self._size += size
+            need_eviction = self._size > self.size_limit
+        if need_eviction:
+            self.evict()
+
+    def put_bytes(self, item_hash: Optional[str], data: bytes):
+        if item_hash is None:
+            return
+
+        def _write(tmp_path: str):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+
+        self._add(item_hash, _write)
+
+    def put_file(self, item_hash: Optional[str], src_path: str):
+        if item_hash is None or not os.path.isfile(src_path):
+            return
+
+        self._add(item_hash, lambda tmp_path: _link_or_copy(src_path, tmp_path))
+
+    def evict(self):
+        """Removes least recently used files until the cache fits into the size limit."""
+        with open(self.lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another task is evicting right now
+            try:
+                blobs = self._list_blobs()
+                size = sum(blob_size for _, blob_size, _ in blobs)
+                target = int(self.size_limit * EVICT_TO_RATIO)
+                removed = 0
+                for path, blob_size, _ in sorted(blobs, key=lambda blob: blob[2]):
+                    if size <= target:
+                        break
+                    if path.endswith(".tmp"):
+                        continue  # being written by another task
+                    sly.fs.silent_remove(path)
+                    size -= blob_size
+                    removed += 1
+                with self._lock:
+                    self._size = size
+                sly.logger.debug(f"Cache eviction removed {removed} files")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def to_json(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_bytes": self.hit_bytes,
+            "size": self._size,
+            "size_limit": self.size_limit,
+        }
@@ -0,0 +1,124 @@
+# This module contains block-parallel compression of the archive stream: gzip, zstd or no compression.
+
+import gzip
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+import supervisely as sly
+
+FORMATS = ["auto", "store", "gzip", "zstd"]
+ARCHIVE_EXTENSIONS = {"store": ".tar", "gzip": ".tar.gz", "zstd": ".tar.zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+LEVEL_RANGES = {"gzip": (1, 9), "zstd": (1, 19)}
+BLOCK_SIZE = 4 * 1024**2  # uncompressed bytes in one gzip member
+
+
+def resolve_compression(compression: str, download_items: bool) -> str:
+    """Returns compression format to use for the archive.
+
+    "auto" does not compress images, videos and point clouds, they are mostly already
+    compressed, and compresses exports of annotations only with gzip. zstd falls back
+    to gzip if zstandard package is not installed.
+    """
+    if compression not in FORMATS:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {FORMATS}")
+    if compression == "auto":
+        return "store" if download_items else "gzip"
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            sly.logger.warning("zstandard is not installed, archive is compressed with gzip")
+            return "gzip"
+    return compression
+
+
+def resolve_compression_level(compression: str, level: Optional[int]) -> Optional[int]:
+    """Returns compression level within the range of the format: gzip 1-9, zstd 1-19.
+
+    None or 0 is the default level of the format, levels out of the range are clamped
+    to the nearest valid level. Returns None if the format has no levels.
+    """
+    if compression not in LEVEL_RANGES:
+        return None
+    if not level:
+        return DEFAULT_LEVELS[compression]
+    low, high = LEVEL_RANGES[compression]
+    if not low <= level <= high:
+        clamped = min(max(level, low), high)
+        sly.logger.warning(
+            f"Compression level {level} is out of range {low}-{high} of {compression}, "
+            f"level {clamped} is used"
+        )
+        return clamped
+    return level
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Writable file object that compresses data by blocks in a thread pool, like pigz.
+
+    Every block is compressed as a separate gzip member. Concatenated members are a valid
+    gzip stream that is read by gzip, tar and Python gzip module as one file. zlib
+    releases the GIL while compressing, so blocks are compressed on all given cores.
+    Compressed blocks are written to the file object in order.
+    """
+
+    def __init__(self, fileobj: BinaryIO, level: int = DEFAULT_LEVELS["gzip"], workers: int = 1):
+        super().__init__()
+        self.fileobj = fileobj
+        self.level = level
+        self._pool = ThreadPoolExecutor(max(1, workers), thread_name_prefix="gzip")
+        self._max_pending = max(1, workers) * 2
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._blocks = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def _submit(self, block: bytes):
+        self._pending.append(self._pool.submit(gzip.compress, block, self.level, mtime=0))
+        self._blocks += 1
+        while len(self._pending) > self._max_pending:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:BLOCK_SIZE]))
+            del self._buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def close(self):
+        """Writes the rest of the data, the underlying file object stays open."""
+        if self.closed:
+            return
+        if len(self._buffer) > 0 or self._blocks == 0:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while len(self._pending) > 0:
+            self.fileobj.write(self._pending.popleft().result())
+        self._pool.shutdown()
+        super().close()
+
+
+def open_compressed(
+    fileobj: BinaryIO, compression: str, level: Optional[int] = None, workers: int = 1
+) -> BinaryIO:
+    """Returns file object that compresses written data into the given file object.
+
+    Closing the returned file object does not close the given one.
+    """
+    level = resolve_compression_level(compression, level)
+    if compression == "store":
+        return fileobj
+    if compression == "gzip":
+        return ParallelGzipWriter(fileobj, level, workers)
+    if compression == "zstd":
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=level, threads=workers)
+        return compressor.stream_writer(fileobj, closefd=False)
+    raise ValueError(f"Unknown compression {compression!r}")
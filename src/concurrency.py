@@ -0,0 +1,131 @@
+# This module contains the adaptive limiter of simultaneous requests shared by all download stages.
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import supervisely as sly
+
+
+class AdaptiveSemaphore(asyncio.Semaphore):
+    """Semaphore that tunes its limit by observed latency and errors of the requests (AIMD).
+
+    It is passed to the SDK ``*_async`` methods as a regular semaphore, every request
+    holds it for its duration. When a window of requests succeeds with latency close to
+    the best observed one, the limit grows by one (additive increase). A failed request
+    or a latency spike halves the limit (multiplicative decrease). The limit stays in
+    the [floor, ceiling] range.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        floor: int = 1,
+        ceiling: Optional[int] = None,
+        window: int = 10,
+        latency_factor: float = 2.0,
+        decrease_factor: float = 0.5,
+    ):
+        ceiling = max(ceiling or initial, initial)
+        floor = max(1, min(floor, initial))
+        super().__init__(initial)
+        self.limit = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self.window = window
+        self.latency_factor = latency_factor
+        self.decrease_factor = decrease_factor
+        self.errors = 0
+        self.requests = 0
+        self.min_limit = initial
+        self.max_limit = initial
+        self._debt = 0  # permits to take back from holders after decrease
+        self._started: Dict[asyncio.Task, List[float]] = {}
+        self._window_latencies: List[float] = []
+        self._best_latency: Optional[float] = None
+        self._last_decrease = 0.0
+
+    def release(self):
+        if self._debt > 0:
+            self._debt -= 1
+            return
+        super().release()
+
+    def _set_limit(self, limit: int):
+        limit = max(self.floor, min(self.ceiling, limit))
+        delta = limit - self.limit
+        if delta == 0:
+            return
+        sly.logger.debug(f"Concurrency limit is changed: {self.limit} -> {limit}")
+        self.limit = limit
+        self.min_limit = min(self.min_limit, limit)
+        self.max_limit = max(self.max_limit, limit)
+        if delta < 0:
+            # free permits are taken at once, the rest is taken back from holders on release
+            shrink = -delta
+            while self._value > 0 and shrink > 0:
+                self._value -= 1
+                shrink -= 1
+            self._debt += shrink
+            return
+        for _ in range(delta):
+            if self._debt > 0:
+                self._debt -= 1
+            else:
+                super().release()
+
+    def _decrease(self):
+        # one decrease per latency interval: requests that were already in flight
+        # at the moment of decrease do not decrease the limit again
+        now = time.monotonic()
+        if now - self._last_decrease < (self._best_latency or 0):
+            return
+        self._last_decrease = now
+        self._window_latencies.clear()
+        self._set_limit(int(self.limit * self.decrease_factor))
+
+    def _on_success(self, latency: float):
+        self._window_latencies.append(latency)
+        if len(self._window_latencies) < self.window:
+            return
+        avg_latency = sum(self._window_latencies) / len(self._window_latencies)
+        self._window_latencies.clear()
+        if self._best_latency is None or avg_latency < self._best_latency:
+            self._best_latency = avg_latency
+        if avg_latency > self._best_latency * self.latency_factor:
+            self._decrease()
+        else:
+            self._set_limit(self.limit + 1)
+
+    async def __aenter__(self):
+        await self.acquire()
+        task = asyncio.current_task()
+        self._started.setdefault(task, []).append(time.monotonic())
+        return None
+
+    async def __aexit__(self, exc_type, exc, tb):
+        task = asyncio.current_task()
+        started = self._started.get(task)
+        start = started.pop() if started else None
+        if not started:
+            self._started.pop(task, None)
+        self.release()
+        if exc_type is None:
+            self.requests += 1
+            if start is not None:
+                self._on_success(time.monotonic() - start)
+        elif not issubclass(exc_type, asyncio.CancelledError):
+            self.requests += 1
+            self.errors += 1
+            self._decrease()
+
+    def to_json(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "floor": self.floor,
+            "ceiling": self.ceiling,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
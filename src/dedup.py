@@ -0,0 +1,96 @@
+# This module contains the index of exported item files by content hash, used to download every file once.
+
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import supervisely as sly
+
+from tar_stream import TarDataset
+
+
+class ContentIndex:
+    """Where the file of every exported content hash is stored during the export.
+
+    Source is the path of the item file in the result project, or the archive member name
+    of the item file in the streaming archive mode.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.duplicates = 0
+        self.saved_bytes = 0
+
+    def get(self, item_hash: Optional[str]) -> Optional[str]:
+        if item_hash is None:
+            return None
+        with self._lock:
+            return self._sources.get(item_hash)
+
+    def add(self, item_hash: Optional[str], source: str):
+        if item_hash is None:
+            return
+        with self._lock:
+            self._sources.setdefault(item_hash, source)
+
+    def split(
+        self, ids: List[int], hashes: Dict[int, Optional[str]]
+    ) -> Tuple[List[int], Dict[int, str]]:
+        """Splits items into the ones to download and duplicates.
+
+        Duplicates are items with the content of already exported items or of items
+        that come earlier in the given list. Items without hash are always downloaded.
+        Returns list of IDs to download and dict: duplicate ID -> content hash.
+        """
+        to_download, duplicates, seen = [], {}, set()
+        with self._lock:
+            for item_id in ids:
+                item_hash = hashes.get(item_id)
+                if item_hash is not None and (item_hash in seen or item_hash in self._sources):
+                    duplicates[item_id] = item_hash
+                    continue
+                if item_hash is not None:
+                    seen.add(item_hash)
+                to_download.append(item_id)
+        return to_download, duplicates
+
+    def count_duplicate(self, size: Optional[int] = None):
+        with self._lock:
+            self.duplicates += 1
+            self.saved_bytes += size or 0
+
+    def to_json(self) -> Dict:
+        return {
+            "unique_files": len(self._sources),
+            "duplicates": self.duplicates,
+            "saved_bytes": self.saved_bytes,
+        }
+
+
+def get_item_source(dataset_fs: sly.Dataset, item_name: str) -> str:
+    """Returns where the file of the written item is stored: path or archive member name."""
+    if isinstance(dataset_fs, TarDataset):
+        return dataset_fs.get_item_arcname(item_name)
+    return dataset_fs.generate_item_path(item_name)
+
+
+def link_duplicate_item(dataset_fs: sly.Dataset, item_name: str, source: str) -> str:
+    """Creates the item file as a hard link to the file with the same content.
+
+    In the streaming archive mode a hard link entry is written to the archive instead.
+    Returns the item path to be passed to ``dataset_fs.add_item_file`` together with the
+    annotation. Falls back to copying if hard links are not supported by the file system.
+    """
+    item_path = dataset_fs.generate_item_path(item_name)
+    if isinstance(dataset_fs, TarDataset):
+        dataset_fs.add_item_link(item_name, source)
+        return item_path
+    sly.fs.ensure_base_path(item_path)
+    sly.fs.silent_remove(item_path)
+    try:
+        os.link(source, item_path)
+    except OSError:
+        shutil.copyfile(source, item_path)
+    return item_path
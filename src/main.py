@@ -1,8 +1,21 @@
 import asyncio
 import os
+import shutil
+import time
+from concurrent.futures import Executor
 from datetime import datetime
 from distutils import util
-from typing import Dict, List, Literal, Optional, Tuple
+from typing import (
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
 import supervisely as sly
 from dotenv import load_dotenv
@@ -12,9 +25,28 @@ from supervisely.project.pointcloud_project import PointcloudDataset, Pointcloud
 from supervisely.project.project import OpenMode, Project
 from supervisely.task.progress import Progress
 from supervisely.project.video_project import VideoProject
-from supervisely.video_annotation.key_id_map import KeyIdMap
 
 import workflow as w
+from ann_pool import KeyIdMapSpool, create_pool, write_annotations_parallel
+from blob_cache import BlobCache
+from compression import ARCHIVE_EXTENSIONS, resolve_compression, resolve_compression_level
+from concurrency import AdaptiveSemaphore
+from dedup import ContentIndex, get_item_source, link_duplicate_item
+from manifest import MANIFEST_FILE_NAME, ExportManifest, dump_ann_json, get_ann_hash
+from planner import check_free_space, estimate_project_bytes, get_free_space, plan_export
+from report import PROFILES_DIR_NAME, REPORT_FILE_NAME, ExportReport
+from retry import FailedItemsLedger, download_isolated, retry, retry_async
+from selection import (
+    AnnotationCounts,
+    ItemSelector,
+    count_annotation,
+    is_empty_ann_json,
+    parse_names,
+)
+from shards import ShardDataset, ShardProject, ShardWriter, resolve_index_format
+from streaming import download_images_streamed
+from tar_stream import TarDataset, TarProject, TarWriter, archive_directory
+from upload import PartUploader, UploadError
 
 if sly.is_development():
     sly.logger.info("Launching locally")
@@ -33,8 +65,23 @@ SIZE_LIMIT = 10 if sly.is_community() else 100
 SIZE_LIMIT_BYTES = SIZE_LIMIT * (1024**3)
 SPLIT_MODE = "MB"
 SPLIT_SIZE = 500  # do not increase this value (memory issues)
+INFLIGHT_BYTES_LIMIT = int(os.environ.get("INFLIGHT_MB", 512)) * (1024**2)
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", 10))  # initial value
+EXPORT_CONCURRENCY_MIN = int(os.environ.get("EXPORT_CONCURRENCY_MIN", 2))
+EXPORT_CONCURRENCY_MAX = int(os.environ.get("EXPORT_CONCURRENCY_MAX", 50))
+ITEMS_BATCH_SIZE = 50
+ANN_BATCH_SIZE = 500
+LISTING_PAGE_SIZE = int(os.environ.get("LISTING_PAGE_SIZE", 10000))  # 0 lists datasets at once
+# annotation batches downloaded and filtered at once, bounds memory of big datasets
+ANN_BATCHES_IN_FLIGHT = int(os.environ.get("ANN_BATCHES_IN_FLIGHT", 4))
+ANN_WORKERS = int(os.environ.get("ANN_WORKERS", min(len(os.sched_getaffinity(0)), 16)))
+RETRY_ATTEMPTS = int(os.environ.get("EXPORT_RETRIES", 3))
+RETRY_BACKOFF = float(os.environ.get("EXPORT_RETRY_BACKOFF", 1.0))  # seconds
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 4))  # archive parts uploaded at once
 RESULT_DIR_NAME = "export_only_labeled_items"
 DATA_DIR = os.path.join(os.getcwd(), "data")
+ANN_STAGING_DIR = os.path.join(DATA_DIR, "annotations")
+PROFILES_DIR = os.path.join(DATA_DIR, PROFILES_DIR_NAME)  # uploaded beside the report
 # endregion
 sly.fs.mkdir(DATA_DIR, remove_content_if_exists=True)
 
@@ -49,441 +96,1437 @@ except KeyError:
 else:
     DOWNLOAD_ITEMS = bool(util.strtobool(os.environ["modal.state.items"]))
 
+STREAM_ARCHIVE = bool(util.strtobool(os.environ.get("modal.state.streamArchive", "False")))
+# "auto", "store", "gzip" or "zstd", level 0 is the default level of the format
+COMPRESSION = resolve_compression(os.environ.get("modal.state.compression", "auto"), DOWNLOAD_ITEMS)
+COMPRESSION_LEVEL = resolve_compression_level(
+    COMPRESSION, int(os.environ.get("modal.state.compressionLevel", 0))
+)
+COMPRESSION_WORKERS = int(os.environ.get("COMPRESSION_WORKERS", len(os.sched_getaffinity(0))))
+# "project" - Supervisely project in the archive,
+# "shards" - items with annotations in uncompressed tar shards with the index of items
+OUTPUT_FORMAT = os.environ.get("modal.state.outputFormat", "project")
+SHARD_SIZE = int(os.environ.get("SHARD_SIZE_MB", 256)) * (1024**2)
+INDEX_FORMAT = resolve_index_format(os.environ.get("INDEX_FORMAT", "auto"))  # parquet or npz
+# items with the same content hash are downloaded once and hard linked
+DEDUPLICATE = bool(util.strtobool(os.environ.get("EXPORT_DEDUPLICATE", "True")))
+# opt-in cache of item files by content hash, shared by export tasks on the same agent
+USE_CACHE = bool(util.strtobool(os.environ.get("EXPORT_CACHE", "False")))
+CACHE_DIR = os.environ.get(
+    "EXPORT_CACHE_DIR",
+    os.path.join(sly.app.get_synced_data_dir(), "export-only-labeled-items", "cache"),
+)
+CACHE_SIZE_LIMIT = int(os.environ.get("EXPORT_CACHE_MB", 20 * 1024)) * (1024**2)
 
-def filter_unlabeled_items(
+# "off" - export everything, "delta" - archive only new and modified items,
+# "complete" - keep exported project on the agent and update only new and modified items
+INCREMENTAL_MODE = os.environ.get("modal.state.incrementalMode", "off")
+STATE_DIR = os.path.join(
+    os.environ.get("EXPORT_STATE_DIR", sly.app.get_synced_data_dir()),
+    "export-only-labeled-items",
+    str(project_id),
+)
+# manifests are named <project_id>_<timestamp>_export_manifest.json, the newest one is used
+MANIFESTS_REMOTE_DIR = os.path.join(
+    sly.team_files.RECOMMENDED_EXPORT_PATH, "export-only-labeled-items", "manifests"
+)
+report = ExportReport(
+    project_id,
+    log_stages=bool(util.strtobool(os.environ.get("LOG_STAGE_STATS", "False"))),
+    profile_filter=os.environ.get("PROFILE_FILTER"),  # "cprofile" or "pyinstrument"
+)
+failed_items = FailedItemsLedger()
+content_index = ContentIndex()
+blob_cache = BlobCache(CACHE_DIR, CACHE_SIZE_LIMIT) if USE_CACHE else None
+# only items with the selected classes and tags are exported, if they are set
+SELECTOR = ItemSelector(
+    parse_names(os.environ.get("modal.state.selectClasses")),
+    parse_names(os.environ.get("modal.state.selectTags")),
+    int(os.environ.get("modal.state.minObjects", 0)),
+    bool(util.strtobool(os.environ.get("modal.state.pruneClasses", "False"))),
+)
+
+if INCREMENTAL_MODE == "complete" and STREAM_ARCHIVE:
+    sly.logger.warning("Complete incremental export keeps project on disk, streaming is disabled")
+    STREAM_ARCHIVE = False
+if INCREMENTAL_MODE == "complete" and OUTPUT_FORMAT == "shards":
+    sly.logger.warning("Complete incremental export keeps project on disk, shards are not written")
+    OUTPUT_FORMAT = "project"
+if OUTPUT_FORMAT == "shards" and DEDUPLICATE:
+    sly.logger.info("Every sample of the shards has its own item file, duplicates are not linked")
+    DEDUPLICATE = False
+# options that define what the export contains, records of the manifest made with other
+# options do not tell which items were delivered
+if OUTPUT_FORMAT == "shards":
+    EXPORT_OUTPUT = "shards"
+else:
+    EXPORT_OUTPUT = "stream" if STREAM_ARCHIVE else "directory"
+EXPORT_OPTIONS = {
+    "items": DOWNLOAD_ITEMS,
+    "output": EXPORT_OUTPUT,
+    "selection": SELECTOR.get_options(),
+}
+
+
+def is_unlabeled_info(
     item_type: Literal["image", "video", "pointcloud"],
-    meta: sly.ProjectMeta,
-    ann_jsons: List[dict],
-    items_ids: List[int],
-    items_names: List[str],
-    not_labeled_items_cnt: int,
-    key_id_map: Optional[KeyIdMap] = None,  # for video and pointcloud projects
-) -> Tuple[
-    List[Dict],
-    List[int],
-    List[str],
-    int,
-    List[sly.Annotation],
-]:
-    """Creates new lists of labeled items and annotations.
-
-    Returns Tuple of filtered:
-     - list of annotations
-     - list of item IDs
-     - list of item names
-     - number of not labeled items
-     - list of annotations objects
+    item_info: NamedTuple,
+) -> bool:
+    """Checks whether item info certainly describes an unlabeled item.
+
+    Uses counters and tags that already come with item infos. Returns False when the
+    info is not enough to decide, such items must go through the full annotation check.
+    Video infos have no objects counter, so videos are never dropped here.
     """
-    ds_progress = sly.tqdm_sly(
-        desc=f"Filter unlabeled items",
-        total=len(ann_jsons),
+    if item_type == "image":
+        labels_cnt = getattr(item_info, "labels_count", None)
+    elif item_type == "pointcloud":
+        labels_cnt = getattr(item_info, "objects_count", None)
+    else:
+        return False
+    tags = getattr(item_info, "tags", None)
+    return labels_cnt == 0 and tags is not None and len(tags) == 0
+
+
+def prefilter_unlabeled_infos(
+    item_type: Literal["image", "video", "pointcloud"],
+    item_infos: List[NamedTuple],
+) -> Tuple[List[NamedTuple], int]:
+    """Drops items that are certainly unlabeled before downloading annotations.
+
+    Returns Tuple of:
+     - list of item infos that need the full annotation check
+     - number of dropped items
+    """
+    candidates = [info for info in item_infos if not is_unlabeled_info(item_type, info)]
+    skipped_cnt = len(item_infos) - len(candidates)
+    if skipped_cnt > 0:
+        sly.logger.info(f"Skipped {skipped_cnt} unlabeled items by item infos")
+    return candidates, skipped_cnt
+
+
+def iter_labeled_items(
+    items: Iterable[Tuple[int, str, Dict]],
+    selector: Optional[ItemSelector] = None,
+    progress_cb=None,
+    size_cb=None,
+) -> Iterator[Tuple[int, str, Dict, str, AnnotationCounts]]:
+    """Yields labeled items one by one as
+    (ID, name, annotation JSON, annotation hash, class and tag counts).
+
+    Emptiness is checked on raw JSON, annotation objects of video and pointcloud
+    items are built later in the annotation process pool. If selector is enabled, only
+    the items it selects are yielded, pruned of the classes that are not selected.
+    ``size_cb`` gets size of every annotation in bytes, the serialized annotation is
+    reused for its hash.
+    """
+    for item_id, name, ann_json in items:
+        if progress_cb is not None:
+            progress_cb(1)
+        ann_bytes = None
+        if size_cb is not None:
+            ann_bytes = dump_ann_json(ann_json)
+            size_cb(len(ann_bytes))
+        if is_empty_ann_json(ann_json):
+            continue
+        counts = count_annotation(ann_json)
+        if selector is not None and selector.enabled:
+            if not selector.match(counts):
+                continue
+            if selector.prune:
+                ann_json = selector.prune_ann_json(ann_json)
+                counts = count_annotation(ann_json)
+                ann_bytes = None
+        yield item_id, name, ann_json, get_ann_hash(ann_json, ann_bytes), counts
+
+
+class DatasetItems(NamedTuple):
+    """Labeled items of a dataset with their annotations, ready to be downloaded."""
+
+    dataset_info: sly.DatasetInfo
+    dataset_path: str
+    dataset_fs: sly.Dataset
+    total_cnt: int
+    not_labeled_cnt: int
+    infos: Dict[int, NamedTuple]
+    ids: List[int]
+    names: List[str]
+    ann_paths: List[str]  # annotation files in the staging directory
+    ann_hashes: List[str]
+    ann_counts: List[AnnotationCounts]  # index of class and tag counts of every item
+
+
+def select_changed_items(
+    items: DatasetItems, manifest: ExportManifest, failed_ids: Optional[set] = None
+) -> DatasetItems:
+    """Leaves only labeled items that are new or changed since the previous export.
+
+    Records of items that are not labeled anymore are removed from the manifest.
+    In the "complete" incremental mode outdated files of such items are deleted
+    from the result project. Items in ``failed_ids`` (their annotations failed to
+    download) are unknown, their records and files are left as they are.
+    """
+    dataset_fs = items.dataset_fs
+    keep_files = INCREMENTAL_MODE == "complete"
+    prev_records = manifest.get_dataset_items(items.dataset_info.id)
+    labeled_ids = set(items.ids)
+    failed_ids = failed_ids or set()
+    for item_id, record in prev_records.items():
+        if item_id not in labeled_ids and item_id not in failed_ids:
+            manifest.remove(item_id)
+            if keep_files:
+                dataset_fs.delete_item(record["name"])
+
+    ids, names, ann_paths, ann_hashes, ann_counts = [], [], [], [], []
+    unchanged_cnt = 0
+    for idx, (item_id, name, ann_hash) in enumerate(zip(items.ids, items.names, items.ann_hashes)):
+        updated_at = items.infos[item_id].updated_at
+        if manifest.is_unchanged(item_id, updated_at, ann_hash):
+            if not keep_files or dataset_fs.item_exists(name):
+                unchanged_cnt += 1
+                sly.fs.silent_remove(items.ann_paths[idx])
+                continue
+        if keep_files:
+            record = prev_records.get(item_id)
+            if record is not None:
+                dataset_fs.delete_item(record["name"])
+            dataset_fs.delete_item(name)
+        ids.append(item_id)
+        names.append(name)
+        ann_hashes.append(ann_hash)
+        ann_counts.append(items.ann_counts[idx])
+        ann_paths.append(items.ann_paths[idx])
+    sly.logger.info(
+        f"Items not changed since previous export: {unchanged_cnt}, new or modified: {len(ids)}"
     )
-    ann_jsons_filtered = []
-    item_ids_filtered = []
-    item_names_filtered = []
-    ann_objects = []
-    for idx, ann_json in enumerate(ann_jsons):
-        if item_type == "image":
-            ann = sly.Annotation.from_json(ann_json, meta)
-        elif item_type == "video":
-            ann = sly.VideoAnnotation.from_json(ann_json, meta, key_id_map)
-        elif item_type == "pointcloud":
-            ann = sly.PointcloudAnnotation.from_json(ann_json, meta, key_id_map)
-        if ann.is_empty():
-            not_labeled_items_cnt += 1
-        else:
-            ann_objects.append(ann)
-            ann_jsons_filtered.append(ann_json)
-            item_ids_filtered.append(items_ids[idx])
-            item_names_filtered.append(items_names[idx])
-        ds_progress(1)
-    sly.logger.info(f"Labeled items to download: {len(ann_jsons_filtered)}")
-    return (
-        ann_jsons_filtered,
-        item_ids_filtered,
-        item_names_filtered,
-        not_labeled_items_cnt,
-        ann_objects,
+    return items._replace(
+        ids=ids,
+        names=names,
+        ann_paths=ann_paths,
+        ann_hashes=ann_hashes,
+        ann_counts=ann_counts,
     )
 
 
-def export_only_labeled_items(api: sly.Api):
-    project = api.project.get_info_by_id(project_id)
-    if project is None:
-        raise RuntimeError(f"Project with the given ID {project_id} not found")
-    w.workflow_input(api, project.id)
-    project_name = project.name
-    meta_json = api.project.get_meta(project_id)
-    meta = sly.ProjectMeta.from_json(meta_json)
+def record_exported_items(
+    items: DatasetItems, manifest: ExportManifest, failed_ids: Optional[set] = None
+):
+    """Adds exported items to the manifest. Failed items are not added, so the next
+    incremental export downloads them again."""
+    failed_ids = failed_ids or set()
+    for item_id, name, ann_hash in zip(items.ids, items.names, items.ann_hashes):
+        if item_id in failed_ids:
+            continue
+        manifest.add(
+            item_id,
+            items.dataset_info.id,
+            items.dataset_path,
+            name,
+            items.infos[item_id].updated_at,
+            ann_hash,
+        )
 
-    if len(meta.obj_classes) == 0 and len(meta.tag_metas) == 0:
-        sly.logger.warning("Project {} have no labeled items".format(project_name))
 
-    timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+def list_remote_manifests(api: sly.Api) -> List[str]:
+    """Returns paths of the manifests of the project in Team Files, the newest is the last."""
+    if not api.file.dir_exists(team_id, MANIFESTS_REMOTE_DIR):
+        return []
+    prefix = f"{project_id}_"
+    names = [os.path.basename(path) for path in api.file.listdir(team_id, MANIFESTS_REMOTE_DIR)]
+    names = [n for n in names if n.startswith(prefix) and n.endswith(MANIFEST_FILE_NAME)]
+    # manifest without timestamp in the name is left by the previous versions of the app
+    names.sort(key=lambda name: (name != prefix + MANIFEST_FILE_NAME, name))
+    return [os.path.join(MANIFESTS_REMOTE_DIR, name) for name in names]
 
-    RESULT_DIR = os.path.join(DATA_DIR, RESULT_DIR_NAME, project_name)
-    RESULT_PROJECT_DIR = os.path.join(DATA_DIR, RESULT_DIR_NAME)
-    ARCHIVE_NAME = f"{project_id}_{project_name}.tar.gz"
-    RESULT_ARCHIVE_DIR = os.path.join(DATA_DIR, timestamp)
-    sly.fs.mkdir(RESULT_ARCHIVE_DIR, remove_content_if_exists=True)
-    RESULT_ARCHIVE = os.path.join(RESULT_ARCHIVE_DIR, ARCHIVE_NAME)
+
+def load_previous_manifest(api: sly.Api) -> ExportManifest:
+    """Loads manifest of the previous export of the project.
+
+    The "complete" mode uses the manifest stored beside the project kept on the agent,
+    the "delta" mode uses the manifest of the last successful export from Team Files.
+    Manifest of the export with other options (item files, selection, output format)
+    is not used, all items are exported. The "complete" mode then starts a new project.
+    """
+    manifest = None
+    if INCREMENTAL_MODE == "complete":
+        manifest = ExportManifest.load(os.path.join(STATE_DIR, MANIFEST_FILE_NAME))
+    else:
+        remote_paths = list_remote_manifests(api)
+        if len(remote_paths) > 0:
+            local_path = os.path.join(DATA_DIR, MANIFEST_FILE_NAME)
+            api.file.download(team_id, remote_paths[-1], local_path)
+            manifest = ExportManifest.load(local_path)
+    if manifest is None:
+        sly.logger.info("Previous export manifest is not found, all items will be exported")
+        return ExportManifest(project_id, options=EXPORT_OPTIONS)
+    if manifest.options != EXPORT_OPTIONS:
+        sly.logger.warning(
+            "Previous export was made with other options, all items will be exported",
+            extra={"previous_options": manifest.options, "options": EXPORT_OPTIONS},
+        )
+        if INCREMENTAL_MODE == "complete" and sly.fs.dir_exists(STATE_DIR):
+            sly.fs.remove_dir(STATE_DIR)  # the kept project has other content
+        return ExportManifest(project_id, options=EXPORT_OPTIONS)
+    sly.logger.info(f"Previous export manifest has {len(manifest.items)} items")
+    return manifest
+
+
+def upload_manifest(api: sly.Api, manifest: ExportManifest, timestamp: str):
+    """Uploads manifest to Team Files to be used by the next incremental export of the project.
+
+    The new manifest is uploaded beside the previous ones, which are removed only after
+    the upload, so a failed upload leaves the previous manifest in place. Failures are
+    logged, the exported archive is already delivered.
+    """
+    if INCREMENTAL_MODE == "off":
+        return
+    local_path = os.path.join(DATA_DIR, MANIFEST_FILE_NAME)
     remote_path = os.path.join(
-        sly.team_files.RECOMMENDED_EXPORT_PATH,
-        "export-only-labeled-items",
-        timestamp,
+        MANIFESTS_REMOTE_DIR, f"{project_id}_{timestamp}_{MANIFEST_FILE_NAME}"
     )
+    try:
+        manifest.dump(local_path)
+        previous_paths = list_remote_manifests(api)
+        retry(
+            api.file.upload,
+            team_id,
+            local_path,
+            remote_path,
+            attempts=RETRY_ATTEMPTS,
+            backoff=RETRY_BACKOFF,
+            description="Upload of the export manifest",
+        )
+    except Exception as e:
+        sly.logger.warning(
+            f"Can not upload export manifest: {repr(e)}. The next incremental export "
+            "will use the manifest of the previous export"
+        )
+        return
+    sly.logger.info(f"Export manifest is saved to Team Files: {remote_path}")
+    for path in previous_paths:
+        if path == remote_path:
+            continue
+        try:
+            api.file.remove(team_id, path)
+        except Exception as e:
+            sly.logger.warning(f"Can not remove previous export manifest {path}: {repr(e)}")
 
-    sly.fs.mkdir(RESULT_DIR, True)
-    sly.logger.info("Export folder has been created")
 
-    if project.type == str(sly.ProjectType.IMAGES):
-        project_fs = Project(RESULT_DIR, OpenMode.CREATE)
-        project_fs.set_meta(meta)
-        for parents, dataset_info in api.dataset.tree(project_id):
-            sly.logger.info(f"Processing dataset {dataset_info.name}...")
-            dataset_path = sly.Dataset._get_dataset_path(dataset_info.name, parents)
-            dataset_id = dataset_info.id
-            dataset_fs = project_fs.create_dataset(dataset_info.name, dataset_path)
-
-            images = api.image.get_list(dataset_id)
-
-            total_items_cnt = len(images)
-            not_labeled_items_cnt = 0
-
-            ids = [info.id for info in images]
-            img_names = [info.name for info in images]
-            ann_progress = sly.tqdm_sly(desc="Downloading annotations", total=total_items_cnt)
-            try:
-                coro = api.annotation.download_bulk_async(dataset_id, ids, ann_progress)
-                loop = sly.utils.get_or_create_event_loop()
-                if loop.is_running():
-                    future = asyncio.run_coroutine_threadsafe(coro, loop)
-                    anns = future.result()
-                else:
-                    anns = loop.run_until_complete(coro)
-                ann_jsons = [ann_info.annotation for ann_info in anns]
-            except Exception as e:
-                sly.logger.warning(
-                    f"Can not download {total_items_cnt} annotations from dataset {dataset_info.name}: {repr(e)}. Skipping."
-                )
-                continue
+def upload_report(api: sly.Api, local_dir: str, remote_dir: str):
+    """Saves the run report and uploads it beside the result archive.
 
-            (
-                ann_jsons_filtered,
-                item_ids_filtered,
-                item_names_filtered,
-                not_labeled_items_cnt,
-                _,
-            ) = filter_unlabeled_items(
-                "image",
-                meta,
-                ann_jsons,
-                ids,
-                img_names,
-                not_labeled_items_cnt,
-            )
-            if DOWNLOAD_ITEMS:
-                image_progress = sly.tqdm_sly(
-                    desc="Downloading images", total=len(ann_jsons_filtered)
+    Filter profiles, if profiling is enabled, are uploaded to the "profiles" directory beside it.
+    """
+    report_path = os.path.join(local_dir, REPORT_FILE_NAME)
+    report.dump(report_path)
+    try:
+        remote_path = os.path.join(remote_dir, REPORT_FILE_NAME)
+        api.file.upload(team_id, report_path, remote_path)
+        if sly.fs.dir_exists(PROFILES_DIR):
+            for name in sorted(os.listdir(PROFILES_DIR)):
+                remote_path = os.path.join(remote_dir, PROFILES_DIR_NAME, name)
+                api.file.upload(team_id, os.path.join(PROFILES_DIR, name), remote_path)
+    except Exception as e:
+        sly.logger.warning(f"Can not upload export report: {repr(e)}")
+
+
+def open_project_fs(project_class, directory: str) -> Tuple[Project, bool]:
+    """Opens project kept by the previous "complete" incremental export or creates a new one.
+
+    Returns Tuple of the project and flag whether existing project was opened.
+    """
+    if INCREMENTAL_MODE == "complete" and sly.fs.file_exists(os.path.join(directory, "meta.json")):
+        try:
+            return project_class(directory, OpenMode.READ), True
+        except Exception as e:
+            sly.logger.warning(f"Can not open previously exported project: {repr(e)}")
+    return project_class(directory, OpenMode.CREATE), False
+
+
+def open_dataset_fs(project_fs: Project, dataset_name: str, dataset_path: str) -> sly.Dataset:
+    dataset_dir = os.path.join(project_fs.directory, dataset_path)
+    if INCREMENTAL_MODE == "complete" and os.path.isdir(dataset_dir):
+        return project_fs.dataset_class(dataset_dir, OpenMode.READ)
+    return project_fs.create_dataset(dataset_name, dataset_path)
+
+
+def create_part_uploader(api: sly.Api, remote_dir: str) -> PartUploader:
+    """Creates uploader of archive parts to a new directory in Team Files."""
+    if api.file.dir_exists(team_id, remote_dir):
+        remote_dir = api.file.get_free_dir_name(team_id, remote_dir)
+    return PartUploader(
+        api,
+        team_id,
+        remote_dir,
+        UPLOAD_WORKERS,
+        attempts=RETRY_ATTEMPTS,
+        backoff=RETRY_BACKOFF,
+        report=report,
+    )
+
+
+def get_files_size(paths: List[str]) -> int:
+    return sum(sly.fs.get_file_size(path) for path in paths if sly.fs.file_exists(path))
+
+
+def add_failed_items(
+    dataset_info: sly.DatasetInfo,
+    errors: Dict[int, Exception],
+    names: Dict[int, str],
+    stage: str,
+):
+    """Adds items that failed after all retries to the ledger of the export report."""
+    if len(errors) == 0:
+        return
+    for item_id, error in errors.items():
+        failed_items.add(dataset_info, stage, error, item_id, names.get(item_id))
+    sly.logger.warning(
+        f"{len(errors)} items of dataset {dataset_info.name} failed at {stage} stage "
+        f"after {RETRY_ATTEMPTS} attempts and will not be exported. First error: "
+        f"{repr(next(iter(errors.values())))}"
+    )
+
+
+async def download_files_isolated(
+    download_paths,
+    ids: List[int],
+    paths: List[str],
+    semaphore: asyncio.Semaphore,
+    progress_cb=None,
+    hashes: Optional[Dict[int, Optional[str]]] = None,
+) -> Dict[int, Exception]:
+    """Downloads files with ``download_paths(ids, paths, semaphore=...)``, retrying failed items.
+
+    If the cache is enabled and content hashes are given, files are taken from the cache
+    when possible, and downloaded files are added to the cache.
+    Returns errors of the items that could not be downloaded, their files are removed.
+    """
+    path_by_id = dict(zip(ids, paths))
+    done = set()
+    use_cache = blob_cache is not None and bool(hashes)
+
+    def _get_from_cache() -> List[int]:
+        return [i for i in ids if not blob_cache.get_file(hashes.get(i), path_by_id[i])]
+
+    def _add_to_cache():
+        for item_id in done:
+            blob_cache.put_file(hashes.get(item_id), path_by_id[item_id])
+
+    if use_cache:
+        not_cached = await asyncio.to_thread(_get_from_cache)
+        if progress_cb is not None:
+            progress_cb(len(ids) - len(not_cached))
+        ids = not_cached
+
+    async def _download(batch_ids: List[int]):
+        await download_paths(
+            batch_ids, [path_by_id[item_id] for item_id in batch_ids], semaphore=semaphore
+        )
+        done.update(batch_ids)
+        if progress_cb is not None:
+            progress_cb(len(batch_ids))
+
+    errors = await download_isolated(
+        _download, list(ids), done.__contains__, RETRY_ATTEMPTS, RETRY_BACKOFF
+    )
+    for item_id in errors:
+        sly.fs.silent_remove(path_by_id[item_id])
+    if use_cache:
+        await asyncio.to_thread(_add_to_cache)
+    return errors
+
+
+async def download_unique_files(
+    download_paths,
+    ids: List[int],
+    paths: List[str],
+    hashes: Dict[int, Optional[str]],
+    semaphore: asyncio.Semaphore,
+    progress_cb=None,
+) -> Tuple[Dict[int, Exception], Dict[int, str]]:
+    """Downloads files of the items, the file of every content hash is downloaded once.
+
+    Returns errors of the items that could not be downloaded and duplicates to be linked
+    with ``add_downloaded_items``: item ID -> content hash.
+    """
+    path_by_id = dict(zip(ids, paths))
+    to_download, duplicates = content_index.split(list(ids), hashes if DEDUPLICATE else {})
+    errors = await download_files_isolated(
+        download_paths,
+        to_download,
+        [path_by_id[i] for i in to_download],
+        semaphore,
+        progress_cb,
+        hashes,
+    )
+    # duplicates of the items that failed to download are downloaded themselves
+    failed_hashes = {hashes.get(item_id) for item_id in errors} - {None}
+    unresolved = [item_id for item_id, h in duplicates.items() if h in failed_hashes]
+    if len(unresolved) > 0:
+        for item_id in unresolved:
+            duplicates.pop(item_id)
+        unresolved_errors = await download_files_isolated(
+            download_paths,
+            unresolved,
+            [path_by_id[i] for i in unresolved],
+            semaphore,
+            progress_cb,
+            hashes,
+        )
+        errors.update(unresolved_errors)
+    if progress_cb is not None:
+        progress_cb(len(duplicates))
+    return errors, duplicates
+
+
+def get_item_hashes(items: DatasetItems) -> Dict[int, Optional[str]]:
+    """Returns content hashes of items for deduplication and cache, empty if they are not used."""
+    if not DOWNLOAD_ITEMS or not (DEDUPLICATE or USE_CACHE):
+        return {}
+    return {item_id: getattr(items.infos[item_id], "hash", None) for item_id in items.ids}
+
+
+def get_info_size(item_info: NamedTuple) -> Optional[int]:
+    size = getattr(item_info, "size", None)
+    if size is None:
+        file_meta = getattr(item_info, "file_meta", None) or {}
+        size = file_meta.get("size")
+    return int(size) if size is not None else None
+
+
+def add_downloaded_items(
+    items: DatasetItems,
+    ids: List[int],
+    names: List[str],
+    paths: List[str],
+    anns: List,
+    errors: Dict[int, Exception],
+    duplicates: Dict[int, str],
+    hashes: Dict[int, Optional[str]],
+    progress_cb,
+):
+    """Adds downloaded item files with annotations to the dataset.
+
+    Duplicates are linked to the already added files with the same content, failed items are skipped.
+    """
+    dataset_fs = items.dataset_fs
+    for item_id, name, path, ann in zip(ids, names, paths, anns):
+        if item_id in duplicates and item_id not in errors:
+            source = content_index.get(duplicates[item_id])
+            if source is None:
+                errors[item_id] = RuntimeError("File with the same content was not downloaded")
+                add_failed_items(
+                    items.dataset_info, {item_id: errors[item_id]}, {item_id: name}, "item_download"
                 )
-                try:
-                    coro = api.image.download_bytes_many_async(
-                        item_ids_filtered, progress_cb=image_progress
-                    )
-                    loop = sly.utils.get_or_create_event_loop()
-                    if loop.is_running():
-                        future = asyncio.run_coroutine_threadsafe(coro, loop)
-                        img_bytes_many = future.result()
-                    else:
-                        img_bytes_many = loop.run_until_complete(coro)
-
-                    ds_progress = sly.tqdm_sly(
-                        desc=f"Processing dataset items",
-                        total=len(img_bytes_many),
-                    )
-                    for name, img_bytes, ann_json in zip(
-                        item_names_filtered, img_bytes_many, ann_jsons_filtered
-                    ):
-                        dataset_fs.add_item_raw_bytes(name, img_bytes, ann_json)
-                        ds_progress(1)
-                except:
-                    sly.logger.warning(
-                        f"Can not download {total_items_cnt} images from dataset {dataset_info.name}: {repr(e)}. Skipping."
-                    )
-                    continue
             else:
-                ds_progress = sly.tqdm_sly(
-                    desc=f"Processing dataset items", total=len(item_names_filtered)
+                path = link_duplicate_item(dataset_fs, name, source)
+                content_index.count_duplicate(get_info_size(items.infos[item_id]))
+        if item_id not in errors:
+            dataset_fs.add_item_file(name, path, ann=ann, _validate_item=False)
+            content_index.add(hashes.get(item_id), get_item_source(dataset_fs, name))
+        if isinstance(ann, str):
+            sly.fs.silent_remove(ann)  # annotation file is copied to the dataset
+        progress_cb(1)
+
+
+def run_sync(coro):
+    """Runs coroutine in the app event loop and returns its result."""
+    loop = sly.utils.get_or_create_event_loop()
+    if loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return future.result()
+    return loop.run_until_complete(coro)
+
+
+def get_items_api(api: sly.Api, item_type: Literal["image", "video", "pointcloud"]):
+    if item_type == "image":
+        return api.image
+    elif item_type == "video":
+        return api.video
+    return api.pointcloud
+
+
+async def download_ann_jsons(
+    api: sly.Api,
+    item_type: Literal["image", "video", "pointcloud"],
+    dataset_id: int,
+    ids: List[int],
+    semaphore: asyncio.Semaphore,
+    progress_cb=None,
+) -> List[Dict]:
+    if item_type == "image":
+        anns = await api.annotation.download_bulk_async(
+            dataset_id, ids, progress_cb, semaphore=semaphore
+        )
+        return [ann_info.annotation for ann_info in anns]
+    items_api = get_items_api(api, item_type)
+    return await items_api.annotation.download_bulk_async(
+        ids, semaphore=semaphore, progress_cb=progress_cb
+    )
+
+
+async def iter_item_pages(
+    api: sly.Api,
+    item_type: Literal["image", "video", "pointcloud"],
+    dataset_info: sly.DatasetInfo,
+) -> AsyncIterator[List[NamedTuple]]:
+    """Yields item infos of the dataset page by page, sorted by ID.
+
+    Every page is requested with "ID greater than the last ID of the previous page"
+    filter, so a failed page is retried alone. Video and pointcloud APIs do not support
+    limit of the listing, their items are listed as one page.
+    """
+    items_api = get_items_api(api, item_type)
+    description = f"Listing items of dataset {dataset_info.name}"
+    if item_type != "image" or LISTING_PAGE_SIZE <= 0:
+        yield await retry_async(
+            asyncio.to_thread,
+            items_api.get_list,
+            dataset_info.id,
+            attempts=RETRY_ATTEMPTS,
+            backoff=RETRY_BACKOFF,
+            description=description,
+        )
+        return
+    last_id = None
+    while True:
+        filters = []
+        if last_id is not None:
+            filters.append({"field": ApiField.ID, "operator": ">", "value": last_id})
+        page = await retry_async(
+            asyncio.to_thread,
+            items_api.get_list,
+            dataset_info.id,
+            filters,
+            sort=ApiField.ID,
+            sort_order="asc",
+            limit=LISTING_PAGE_SIZE,
+            attempts=RETRY_ATTEMPTS,
+            backoff=RETRY_BACKOFF,
+            description=description,
+        )
+        if len(page) > 0:
+            yield page
+        if len(page) < LISTING_PAGE_SIZE:
+            return
+        last_id = page[-1].id
+
+
+async def prepare_dataset(
+    api: sly.Api,
+    item_type: Literal["image", "video", "pointcloud"],
+    meta: sly.ProjectMeta,
+    dataset_info: sly.DatasetInfo,
+    dataset_path: str,
+    dataset_fs: sly.Dataset,
+    semaphore: asyncio.Semaphore,
+    key_id_spool: Optional[KeyIdMapSpool] = None,
+    manifest: Optional[ExportManifest] = None,
+    ann_pool: Optional[Executor] = None,
+    dataset_idx: int = 0,
+) -> Optional[DatasetItems]:
+    """Lists dataset items, downloads their annotations and filters out unlabeled ones.
+
+    Items are listed page by page, annotations of every page are processed by batches
+    as they are downloaded, at most ANN_BATCHES_IN_FLIGHT batches at once. If selection
+    of classes or tags is set, only the selected items are kept. Annotations of labeled
+    items are written to files in the staging directory right after filtering, video and
+    pointcloud annotations are parsed in the process pool and their keys are added to
+    the KeyIdMap spool on disk in the order of ``dataset_idx`` and batches.
+    If manifest of the previous export is given, items that have not changed are skipped.
+
+    Items which annotations can not be downloaded after all retries are added to the
+    failed items ledger. Returns None if items of the dataset can not be listed.
+    """
+    sly.logger.info(f"Processing dataset {dataset_info.name}...")
+    ds_name = dataset_info.name
+    total = dataset_info.items_count
+    infos = {}  # infos of listed items, only labeled ones are kept after filtering
+    ann_progress = sly.tqdm_sly(desc="Downloading annotations", total=total)
+    filter_progress = sly.tqdm_sly(desc="Filter unlabeled items", total=total)
+    if item_type != "image":
+        parse_progress = sly.tqdm_sly(desc="Parsing annotations", total=total)
+    ann_dir = os.path.join(ANN_STAGING_DIR, str(dataset_info.id))
+    batches_limit = asyncio.Semaphore(ANN_BATCHES_IN_FLIGHT)
+
+    async def _prepare_batch(batch_idx: int, batch_ids: List[int]):
+        """Downloads annotations of the batch, filters them and writes out the labeled ones.
+        Returns labeled items of the batch, infos of other items are dropped."""
+        batch_anns = {}
+
+        async def _download_anns(pending_ids: List[int]):
+            anns = await download_ann_jsons(api, item_type, dataset_info.id, pending_ids, semaphore)
+            batch_anns.update(zip(pending_ids, anns))
+            ann_progress(len(pending_ids))
+
+        def _filter() -> Tuple[List[Tuple], int]:
+            """Returns labeled items and size of all annotations of the batch in bytes."""
+            anns_size = 0
+
+            def _add_size(size: int):
+                nonlocal anns_size
+                anns_size += size
+
+            with report.profile(f"filter_{dataset_info.id}_{batch_idx}", PROFILES_DIR):
+                # every annotation is released from the batch as soon as it is checked
+                stream = (
+                    (item_id, infos[item_id].name, batch_anns.pop(item_id))
+                    for item_id in batch_ids
+                    if item_id in batch_anns
                 )
-                ann_dir = os.path.join(RESULT_DIR, dataset_info.name, "ann")
-                sly.fs.mkdir(ann_dir)
-                for image_name, ann_json in zip(item_names_filtered, ann_jsons_filtered):
-                    sly.json.dump_json_file(ann_json, os.path.join(ann_dir, image_name + ".json"))
-                    ds_progress(1)
-
-            if total_items_cnt == not_labeled_items_cnt:
-                sly.logger.warning(
-                    "There are no labeled items in dataset {}".format(dataset_info.name)
+                labeled = list(iter_labeled_items(stream, SELECTOR, filter_progress, _add_size))
+            return labeled, anns_size
+
+        def _write_image_anns(labeled: List[Tuple], ann_paths: List[str]):
+            sly.fs.mkdir(ann_dir)
+            for (_, _, ann_json, _, _), ann_path in zip(labeled, ann_paths):
+                sly.json.dump_json_file(ann_json, ann_path)
+
+        async with batches_limit:
+            with report.stage("annotation_download", ds_name, items=len(batch_ids)):
+                errors = await download_isolated(
+                    _download_anns,
+                    batch_ids,
+                    batch_anns.__contains__,
+                    RETRY_ATTEMPTS,
+                    RETRY_BACKOFF,
                 )
+            if len(errors) > 0:
+                names = {item_id: infos[item_id].name for item_id in errors}
+                add_failed_items(dataset_info, errors, names, "annotation_download")
+            with report.stage("filtering", ds_name, items=len(batch_anns)):
+                labeled, anns_size = await asyncio.to_thread(_filter)
+            # annotations come parsed from the API, their size is measured as serialized JSON
+            report.add("annotation_download", ds_name, bytes=anns_size)
+            labeled_ids = {item_id for item_id, *_ in labeled}
+            for item_id in batch_ids:
+                if item_id not in labeled_ids:
+                    infos.pop(item_id)
+            if len(labeled) == 0:
+                return labeled
+            ann_paths = [os.path.join(ann_dir, f"{item_id}.json") for item_id, *_ in labeled]
+            if item_type == "image":
+                with report.stage("disk_write", ds_name, items=len(labeled)):
+                    await asyncio.to_thread(_write_image_anns, labeled, ann_paths)
             else:
-                sly.logger.info(
-                    f"Dataset {dataset_info.name} has {total_items_cnt-not_labeled_items_cnt}/{total_items_cnt} items labeled"
-                )
+                with report.stage("annotation_parsing", ds_name, items=len(labeled)):
+                    errors = await write_annotations_parallel(
+                        ann_pool,
+                        item_type,
+                        meta,
+                        [ann_json for _, _, ann_json, _, _ in labeled],
+                        ann_paths,
+                        key_id_spool,
+                        (dataset_idx, batch_idx),
+                        parse_progress,
+                    )
+                if len(errors) > 0:
+                    failed = {labeled[idx][0]: e for idx, e in errors.items()}
+                    names = {item_id: infos.pop(item_id).name for item_id in failed}
+                    add_failed_items(dataset_info, failed, names, "parse")
+                    labeled = [item for idx, item in enumerate(labeled) if idx not in errors]
+                    ann_paths = [path for idx, path in enumerate(ann_paths) if idx not in errors]
+        # annotations are kept only in files from now on
+        return [
+            (item_id, name, ann_path, ann_hash, counts)
+            for (item_id, name, _, ann_hash, counts), ann_path in zip(labeled, ann_paths)
+        ]
 
-    elif project.type == str(sly.ProjectType.VIDEOS):
-        key_id_map = KeyIdMap()
-        project_fs = VideoProject(RESULT_DIR, OpenMode.CREATE)
-        project_fs.set_meta(meta)
-        for dataset_info in api.dataset.get_list(project_id):
-            dataset_fs = project_fs.create_dataset(dataset_info.name)
-            videos = api.video.get_list(dataset_info.id)
-            not_labeled_items_cnt = 0
-            total_items_cnt = len(videos)
-
-            video_ids = [video_info.id for video_info in videos]
-            video_names = [video_info.name for video_info in videos]
-            try:
-                video_ann_progress = sly.tqdm_sly(
-                    desc="Downloading video annotations", total=total_items_cnt
-                )
+    # annotations of every page are downloaded while the next pages are listed,
+    # listing waits when enough batches are queued, so memory does not grow with the dataset
+    total_items_cnt = 0
+    batches: List[asyncio.Task] = []
+    try:
+        start = time.monotonic()
+        async for page in iter_item_pages(api, item_type, dataset_info):
+            report.add("listing", ds_name, time.monotonic() - start, len(page))
+            total_items_cnt += len(page)
+            page, skipped_cnt = prefilter_unlabeled_infos(item_type, page)
+            filter_progress(skipped_cnt)
+            ann_progress(skipped_cnt)
+            infos.update((info.id, info) for info in page)
+            for batch_ids in sly.batched([info.id for info in page], ANN_BATCH_SIZE):
+                batches.append(asyncio.ensure_future(_prepare_batch(len(batches), batch_ids)))
+            del page
+            pending = [batch for batch in batches if not batch.done()]
+            while len(pending) > ANN_BATCHES_IN_FLIGHT * 2:
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending = [batch for batch in pending if not batch.done()]
+            start = time.monotonic()
+    except Exception as e:
+        # the dataset is skipped as a whole, a part of its items would mark
+        # the other items as removed in the manifest
+        for batch in batches:
+            batch.cancel()
+        await asyncio.gather(*batches, return_exceptions=True)
+        sly.logger.warning(f"Can not list items of dataset {ds_name}: {repr(e)}. Skipping.")
+        failed_items.add(dataset_info, "listing", e)
+        return None
 
-                coro = api.video.annotation.download_bulk_async(
-                    video_ids, progress_cb=video_ann_progress
-                )
-                loop = sly.utils.get_or_create_event_loop()
-                if loop.is_running():
-                    future = asyncio.run_coroutine_threadsafe(coro, loop)
-                    ann_jsons = future.result()
-                else:
-                    ann_jsons = loop.run_until_complete(coro)
-            except Exception as e:
-                sly.logger.warning(
-                    f"Can not download {len(video_ids)} annotations: {repr(e)}. Skipping."
-                )
-                continue
+    ids_filtered, names_filtered, anns_filtered, ann_hashes, ann_counts = [], [], [], [], []
+    for labeled in await asyncio.gather(*batches):
+        for item_id, name, ann, ann_hash, counts in labeled:
+            ids_filtered.append(item_id)
+            names_filtered.append(name)
+            anns_filtered.append(ann)
+            ann_hashes.append(ann_hash)
+            ann_counts.append(counts)
+    del batches
+    failed_ids = failed_items.get_ids(dataset_info.id)  # annotations that failed to download
+    failed_cnt = len(failed_ids)
+    not_labeled_items_cnt = total_items_cnt - failed_cnt - len(ids_filtered)
+    sly.logger.info(f"Labeled items to download: {len(ids_filtered)}")
 
-            (
-                ann_jsons_filtered,
-                video_ids_filtered,
-                video_names_filtered,
-                not_labeled_items_cnt,
-                video_anns,
-            ) = filter_unlabeled_items(
-                "video",
-                meta,
-                ann_jsons,
-                video_ids,
-                video_names,
-                not_labeled_items_cnt,
-                key_id_map,
-            )
-            video_paths = [dataset_fs.generate_item_path(name) for name in video_names_filtered]
+    items = DatasetItems(
+        dataset_info=dataset_info,
+        dataset_path=dataset_path,
+        dataset_fs=dataset_fs,
+        total_cnt=total_items_cnt,
+        not_labeled_cnt=not_labeled_items_cnt,
+        infos=infos,
+        ids=ids_filtered,
+        names=names_filtered,
+        ann_paths=anns_filtered,
+        ann_hashes=ann_hashes,
+        ann_counts=ann_counts,
+    )
+    if manifest is not None:
+        items = await asyncio.to_thread(select_changed_items, items, manifest, failed_ids)
+    return items
 
-            if DOWNLOAD_ITEMS:
-                progress = sly.tqdm_sly(desc="Downloading videos", total=len(video_ids_filtered))
-                try:
-                    coro = api.video.download_paths_async(
-                        video_ids_filtered, video_paths, progress_cb=progress
-                    )
-                    loop = sly.utils.get_or_create_event_loop()
-                    if loop.is_running():
-                        future = asyncio.run_coroutine_threadsafe(coro, loop)
-                        future.result()
-                    else:
-                        loop.run_until_complete(coro)
-                except Exception as e:
-                    sly.logger.warning(
-                        f"An error occured while downloading videos. Error: {repr(e)}"
-                    )
-            ds_progress = sly.tqdm_sly(desc=f"Processing dataset items", total=len(video_anns))
-            for video_name, video_path, video_ann in zip(
-                video_names_filtered, video_paths, video_anns
-            ):
-                dataset_fs.add_item_file(
-                    video_name, video_path, ann=video_ann, _validate_item=False
-                )
+
+async def write_images(api: sly.Api, items: DatasetItems, semaphore: asyncio.Semaphore):
+    dataset_fs = items.dataset_fs
+    if not DOWNLOAD_ITEMS:
+        ds_progress = sly.tqdm_sly(desc=f"Processing dataset items", total=len(items.names))
+        if isinstance(dataset_fs, (TarDataset, ShardDataset)):
+            add_ann = dataset_fs.add_ann_file
+        else:
+            sly.fs.mkdir(dataset_fs.ann_dir)
+
+            def add_ann(image_name: str, ann_path: str):
+                shutil.move(ann_path, os.path.join(dataset_fs.ann_dir, image_name + ".json"))
+
+        def write_ann(image_name: str, ann_path: str):
+            add_ann(image_name, ann_path)
+            sly.fs.silent_remove(ann_path)
+
+        with report.stage("disk_write", items.dataset_info.name, items=len(items.names)):
+            for image_name, ann_path in zip(items.names, items.ann_paths):
+                await asyncio.to_thread(write_ann, image_name, ann_path)
                 ds_progress(1)
-            if total_items_cnt == not_labeled_items_cnt:
-                sly.logger.warning(
-                    "There are no labeled items in dataset {}".format(dataset_info.name)
-                )
-            else:
-                sly.logger.info(
-                    f"Dataset {dataset_info.name} has {total_items_cnt-not_labeled_items_cnt}/{total_items_cnt} items labeled"
-                )
+        return
 
-        project_fs.set_key_id_map(key_id_map)
+    image_progress = sly.tqdm_sly(desc="Downloading images", total=len(items.ids))
+    image_sizes = {img_id: info.size for img_id, info in items.infos.items()}
+    id_to_item = {
+        img_id: (name, ann_path)
+        for img_id, name, ann_path in zip(items.ids, items.names, items.ann_paths)
+    }
 
-    elif project.type == str(sly.ProjectType.POINT_CLOUDS):
-        key_id_map = KeyIdMap()
-        project_fs = PointcloudProject(RESULT_DIR, OpenMode.CREATE)
-        project_fs.set_meta(meta)
-        for dataset_info in api.dataset.get_list(project_id):
-            dataset_fs: PointcloudDataset = project_fs.create_dataset(dataset_info.name)
-            pointclouds = api.pointcloud.get_list(dataset_info.id)
-            not_labeled_items_cnt = 0
-            total_items_cnt = len(pointclouds)
-
-            pointcloud_ids = [pointcloud_info.id for pointcloud_info in pointclouds]
-            pointcloud_names = [pointcloud_info.name for pointcloud_info in pointclouds]
-
-            anns_json = []
-            try:
-                ann_progress = sly.tqdm_sly(desc="Downloading annotations", total=total_items_cnt)
-                coro = api.pointcloud.annotation.download_bulk_async(
-                    pointcloud_ids, progress_cb=ann_progress
-                )
-                loop = sly.utils.get_or_create_event_loop()
-                if loop.is_running():
-                    future = asyncio.run_coroutine_threadsafe(coro, loop)
-                    anns_json.extend(future.result())
-                else:
-                    anns_json.extend(loop.run_until_complete(coro))
-            except Exception as e:
-                sly.logger.warning(
-                    f"Can not download {total_items_cnt} annotations from dataset {dataset_info.name}: {repr(e)}. Skipping."
-                )
+    ds_name = items.dataset_info.name
+    hashes = get_item_hashes(items)
+    to_download, duplicates = content_index.split(items.ids, hashes if DEDUPLICATE else {})
+
+    def _write_image(img_id: int, img_bytes: bytes):
+        name, ann_path = id_to_item[img_id]
+        start = time.monotonic()
+        dataset_fs.add_item_raw_bytes(name, img_bytes, ann_path)
+        sly.fs.silent_remove(ann_path)  # annotation file is copied to the dataset
+        content_index.add(hashes.get(img_id), get_item_source(dataset_fs, name))
+        if blob_cache is not None:
+            blob_cache.put_bytes(hashes.get(img_id), img_bytes)
+        report.add("disk_write", ds_name, time.monotonic() - start, 1, len(img_bytes))
+
+    def _write_cached_images(image_ids: List[int]) -> List[int]:
+        """Writes images found in the cache, returns IDs of the images to download."""
+        not_cached = []
+        for img_id in image_ids:
+            img_bytes = blob_cache.get_bytes(hashes.get(img_id))
+            if img_bytes is None:
+                not_cached.append(img_id)
                 continue
+            _write_image(img_id, img_bytes)
+            image_progress(1)
+        return not_cached
 
-            (
-                _,
-                pcd_ids_filtered,
-                pcd_names_filtered,
-                not_labeled_items_cnt,
-                ann_objects,
-            ) = filter_unlabeled_items(
-                "pointcloud",
-                meta,
-                anns_json,
-                pointcloud_ids,
-                pointcloud_names,
-                not_labeled_items_cnt,
-                key_id_map,
+    errors = {}
+
+    async def _download(image_ids: List[int]):
+        if blob_cache is not None:
+            image_ids = await asyncio.to_thread(_write_cached_images, image_ids)
+        images_size = sum(image_sizes.get(img_id) or 0 for img_id in image_ids)
+        with report.stage("item_download", ds_name, len(image_ids), images_size):
+            await download_images_streamed(
+                api,
+                items.dataset_info.id,
+                image_ids,
+                image_sizes,
+                _write_image,
+                INFLIGHT_BYTES_LIMIT,
+                semaphore=semaphore,
+                progress_cb=image_progress,
+                on_item_failed=errors.__setitem__,
+                attempts=RETRY_ATTEMPTS,
+                backoff=RETRY_BACKOFF,
             )
 
-            pcd_file_paths = [dataset_fs.generate_item_path(name) for name in pcd_names_filtered]
-            if DOWNLOAD_ITEMS:
-                pcd_progress = sly.tqdm_sly(
-                    desc="Downloading point clouds", total=len(pcd_ids_filtered)
-                )
-                try:
-                    coro = api.pointcloud.download_paths_async(
-                        pcd_ids_filtered, pcd_file_paths, progress_cb=pcd_progress
-                    )
-                    loop = sly.utils.get_or_create_event_loop()
-                    if loop.is_running():
-                        future = asyncio.run_coroutine_threadsafe(coro, loop)
-                        future.result()
-                    else:
-                        loop.run_until_complete(coro)
-                except Exception as e:
-                    sly.logger.warning(
-                        f"An error occured while downloading PCD items from dataset: {dataset_info.name}. Error: {repr(e)}"
-                    )
-                    continue
+    await _download(to_download)
+    # duplicates of the images that failed to download are downloaded themselves
+    unresolved = [img_id for img_id, h in duplicates.items() if content_index.get(h) is None]
+    if len(unresolved) > 0:
+        for img_id in unresolved:
+            duplicates.pop(img_id)
+        await _download(unresolved)
+    add_failed_items(
+        items.dataset_info, errors, {i: id_to_item[i][0] for i in errors}, "item_download"
+    )
+
+    def _add_duplicates():
+        for img_id, img_hash in duplicates.items():
+            name, ann_path = id_to_item[img_id]
+            item_path = link_duplicate_item(dataset_fs, name, content_index.get(img_hash))
+            dataset_fs.add_item_file(name, item_path, ann=ann_path, _validate_item=False)
+            sly.fs.silent_remove(ann_path)
+            content_index.count_duplicate(image_sizes.get(img_id))
+            image_progress(1)
+
+    if len(duplicates) > 0:
+        with report.stage("disk_write", ds_name, items=len(duplicates)):
+            await asyncio.to_thread(_add_duplicates)
+
+
+async def write_videos(api: sly.Api, items: DatasetItems, semaphore: asyncio.Semaphore):
+    dataset_fs = items.dataset_fs
+    ds_name = items.dataset_info.name
+    hashes = get_item_hashes(items)
+    if DOWNLOAD_ITEMS:
+        progress = sly.tqdm_sly(desc="Downloading videos", total=len(items.ids))
+    ds_progress = sly.tqdm_sly(desc=f"Processing dataset items", total=len(items.names))
+    # items are downloaded by batches, so the archive streaming mode keeps only one batch on disk
+    for batch in sly.batched(list(zip(items.ids, items.names, items.ann_paths)), ITEMS_BATCH_SIZE):
+        ids, names, anns = zip(*batch)
+        video_paths = [dataset_fs.generate_item_path(name) for name in names]
+        errors, duplicates = {}, {}
+        if DOWNLOAD_ITEMS:
+            start = time.monotonic()
+            errors, duplicates = await download_unique_files(
+                api.video.download_paths_async, ids, video_paths, hashes, semaphore, progress
+            )
+            add_failed_items(items.dataset_info, errors, dict(zip(ids, names)), "item_download")
+            report.add(
+                "item_download",
+                ds_name,
+                time.monotonic() - start,
+                len(ids),
+                get_files_size(video_paths),
+            )
+
+        with report.stage("disk_write", ds_name, items=len(names)):
+            await asyncio.to_thread(
+                add_downloaded_items,
+                items,
+                ids,
+                names,
+                video_paths,
+                anns,
+                errors,
+                duplicates,
+                hashes,
+                ds_progress,
+            )
+
+
+async def get_related_images_infos(
+    api: sly.Api, dataset_id: int, pcd_ids: List[int], semaphore: asyncio.Semaphore
+) -> Dict[int, List[Dict]]:
+    """Gets infos of all related images of the given point clouds with one batched request.
 
-                rimage_paths = []
-                rimage_ids = []
-                dri_progress = sly.tqdm_sly(
-                    desc="Dumping related images infos", total=len(pcd_ids_filtered)
+    Returns dict: point cloud ID -> list of related images infos.
+    """
+    async with semaphore:
+        rimage_infos = await asyncio.to_thread(
+            api.pointcloud.get_list_related_images_batch, dataset_id, pcd_ids
+        )
+    pcd_to_rimages = {pcd_id: [] for pcd_id in pcd_ids}
+    for rimage_info in rimage_infos:
+        pcd_to_rimages[rimage_info[ApiField.ENTITY_ID]].append(rimage_info)
+    return pcd_to_rimages
+
+
+async def write_pointclouds(api: sly.Api, items: DatasetItems, semaphore: asyncio.Semaphore):
+    dataset_fs: PointcloudDataset = items.dataset_fs
+    dataset_id = items.dataset_info.id
+    ds_name = items.dataset_info.name
+    hashes = get_item_hashes(items)
+    if DOWNLOAD_ITEMS:
+        pcd_progress = sly.tqdm_sly(desc="Downloading point clouds", total=len(items.ids))
+        ri_progress = sly.tqdm_sly(desc="Downloading related images", total=len(items.ids))
+    ds_progress = sly.tqdm_sly(desc=f"Processing dataset items", total=len(items.names))
+    # items are downloaded by batches, so the archive streaming mode keeps only one batch on disk
+    for batch in sly.batched(list(zip(items.ids, items.names, items.ann_paths)), ITEMS_BATCH_SIZE):
+        ids, names, anns = zip(*batch)
+        pcd_file_paths = [dataset_fs.generate_item_path(name) for name in names]
+        errors, duplicates = {}, {}
+        if DOWNLOAD_ITEMS:
+            start = time.monotonic()
+            pcd_to_rimages = {}
+
+            async def _get_rimages_infos(pcd_ids: List[int]):
+                pcd_to_rimages.update(
+                    await get_related_images_infos(api, dataset_id, pcd_ids, semaphore)
                 )
-                for pcd_id, pcd_name in zip(pcd_ids_filtered, pcd_names_filtered):
-                    rimage_path = dataset_fs.get_related_images_path(pcd_name)
-                    # only one related image for each pointcloud
-                    rimage_info = api.pointcloud.get_list_related_images(pcd_id)[0]
+
+            # related images infos are requested while point clouds are downloading
+            infos_errors, (pcd_errors, duplicates) = await asyncio.gather(
+                download_isolated(
+                    _get_rimages_infos,
+                    list(ids),
+                    pcd_to_rimages.__contains__,
+                    RETRY_ATTEMPTS,
+                    RETRY_BACKOFF,
+                ),
+                download_unique_files(
+                    api.pointcloud.download_paths_async,
+                    ids,
+                    pcd_file_paths,
+                    hashes,
+                    semaphore,
+                    pcd_progress,
+                ),
+            )
+            errors.update(infos_errors)
+            errors.update(pcd_errors)
+
+            rimage_paths = []
+            rimage_ids = []
+            rimage_to_pcd = {}
+            rimage_hashes = {}
+            for pcd_id, pcd_name in zip(ids, names):
+                if pcd_id in errors:
+                    continue
+                rimage_path = dataset_fs.get_related_images_path(pcd_name)
+                for rimage_info in pcd_to_rimages[pcd_id]:
                     name = rimage_info[ApiField.NAME]
                     rimage_ids.append(rimage_info[ApiField.ID])
                     rimage_paths.append(os.path.join(rimage_path, name))
+                    rimage_to_pcd[rimage_info[ApiField.ID]] = pcd_id
+                    rimage_hashes[rimage_info[ApiField.ID]] = rimage_info.get(ApiField.HASH)
                     path_json = os.path.join(rimage_path, name + ".json")
                     sly.fs.mkdir(rimage_path)
                     dump_json_file(rimage_info, path_json)
-                    dri_progress(1)
-                try:
-                    ri_progress = sly.tqdm_sly(
-                        desc="Downloading related images", total=len(rimage_ids)
-                    )
-                    coro = api.pointcloud.download_related_images_async(
-                        rimage_ids, rimage_paths, progress_cb=ri_progress
-                    )
-                    loop = sly.utils.get_or_create_event_loop()
-                    if loop.is_running():
-                        future = asyncio.run_coroutine_threadsafe(coro, loop)
-                        future.result()
-                    else:
-                        loop.run_until_complete(coro)
-                except Exception as e:
-                    sly.logger.warning(
-                        f"An error occured while downloading PCD related images. Error: {repr(e)}"
-                    )
-                    continue
 
-            ds_progress = sly.tqdm_sly(
-                desc=f"Processing dataset items", total=len(pcd_names_filtered)
+            rimage_errors = await download_files_isolated(
+                api.pointcloud.download_related_images_async,
+                rimage_ids,
+                rimage_paths,
+                semaphore,
+                hashes=rimage_hashes if hashes else None,
             )
-            for pcd_path, pointcloud_name, pc_ann in zip(
-                pcd_file_paths, pcd_names_filtered, ann_objects
-            ):
-                dataset_fs.add_item_file(
-                    pointcloud_name,
-                    pcd_path,
-                    ann=pc_ann,
-                    _validate_item=False,
-                )
-                ds_progress(1)
-            if total_items_cnt == not_labeled_items_cnt:
-                sly.logger.warning(
-                    "There are no labeled items in dataset {}".format(dataset_info.name)
-                )
-            else:
-                sly.logger.info(
-                    f"Dataset {dataset_info.name} has {total_items_cnt-not_labeled_items_cnt}/{total_items_cnt} items labeled"
+            for rimage_id, error in rimage_errors.items():
+                errors.setdefault(rimage_to_pcd[rimage_id], error)
+
+            # duplicates of the point clouds that failed with their related images
+            # have nothing to be linked to, their own files are downloaded
+            sources = {hashes.get(pcd_id): pcd_id for pcd_id in ids if pcd_id not in duplicates}
+            requeued = [
+                pcd_id
+                for pcd_id, pcd_hash in duplicates.items()
+                if pcd_id not in errors
+                and content_index.get(pcd_hash) is None
+                and sources.get(pcd_hash) in errors
+            ]
+            if len(requeued) > 0:
+                for pcd_id in requeued:
+                    duplicates.pop(pcd_id)
+                path_by_id = dict(zip(ids, pcd_file_paths))
+                requeued_errors = await download_files_isolated(
+                    api.pointcloud.download_paths_async,
+                    requeued,
+                    [path_by_id[pcd_id] for pcd_id in requeued],
+                    semaphore,
+                    hashes=hashes,
                 )
-        project_fs.set_key_id_map(key_id_map)
+                errors.update(requeued_errors)
+            ri_progress(len(ids))
+            report.add(
+                "item_download",
+                ds_name,
+                time.monotonic() - start,
+                len(ids),
+                get_files_size(pcd_file_paths + rimage_paths),
+            )
 
-    dir_size = sly.fs.get_directory_size(RESULT_PROJECT_DIR)
-    dir_size_gb = round(dir_size / (1024 * 1024 * 1024), 2)
+            # point clouds are exported only with all their related images
+            for pcd_id, pcd_name, pcd_path in zip(ids, names, pcd_file_paths):
+                if pcd_id in errors:
+                    sly.fs.silent_remove(pcd_path)
+                    rimage_dir = dataset_fs.get_related_images_path(pcd_name)
+                    if sly.fs.dir_exists(rimage_dir):
+                        sly.fs.remove_dir(rimage_dir)
+            add_failed_items(items.dataset_info, errors, dict(zip(ids, names)), "item_download")
 
-    if dir_size < SIZE_LIMIT_BYTES:
-        sly.logger.debug(f"Result archive size ({dir_size_gb} GB) less than limit {SIZE_LIMIT} GB")
-        file_info = sly.output.set_download(RESULT_PROJECT_DIR)
-        w.workflow_output(api, file_info)
-        sly.logger.info(f"Project {project_name} has been successfully exported.")
-        return
+        with report.stage("disk_write", ds_name, items=len(names)):
+            await asyncio.to_thread(
+                add_downloaded_items,
+                items,
+                ids,
+                names,
+                pcd_file_paths,
+                anns,
+                errors,
+                duplicates,
+                hashes,
+                ds_progress,
+            )
 
-    # TODO: Add option to split archive by parts into sly.output.set_download() method and remove the code below.
 
-    sly.logger.info(f"Result archive size ({dir_size_gb} GB) more than {SIZE_LIMIT} GB")
-    split = f"{SPLIT_SIZE}{SPLIT_MODE}"
-    sly.logger.info(f"It will be uploaded with splitting by {split}")
-    splits = sly.fs.archive_directory(RESULT_PROJECT_DIR, RESULT_ARCHIVE, split=split)
-    sly.logger.info(f"Result directory is archived {'with splitting' if splits else ''}")
+async def export_datasets_async(
+    api: sly.Api,
+    item_type: Literal["image", "video", "pointcloud"],
+    meta: sly.ProjectMeta,
+    datasets: List[Tuple[sly.DatasetInfo, str, sly.Dataset]],
+    key_id_spool: Optional[KeyIdMapSpool] = None,
+    manifest: Optional[ExportManifest] = None,
+    ann_pool: Optional[Executor] = None,
+):
+    """Exports datasets one by one, preparing the next dataset in the background.
 
-    sly.fs.remove_dir(RESULT_PROJECT_DIR)  # remove dir
+    While items of dataset N are downloaded and written, annotations of dataset N+1
+    are downloaded, filtered and parsed (in the ``ann_pool`` processes if it is given). All requests share one adaptive semaphore: the number
+    of simultaneous requests starts at EXPORT_CONCURRENCY and is tuned by observed
+    latency and errors between EXPORT_CONCURRENCY_MIN and EXPORT_CONCURRENCY_MAX.
+    """
+    if item_type == "image":
+        write_items = write_images
+    elif item_type == "video":
+        write_items = write_videos
+    else:
+        write_items = write_pointclouds
 
-    upload_progress = []
-    upload_msg = f"Uploading splitted archive {ARCHIVE_NAME} to Team Files"
+    semaphore = AdaptiveSemaphore(
+        EXPORT_CONCURRENCY, floor=EXPORT_CONCURRENCY_MIN, ceiling=EXPORT_CONCURRENCY_MAX
+    )
 
-    def _print_progress(monitor, upload_progress: List):
-        if len(upload_progress) == 0:
-            upload_progress.append(
-                sly.Progress(
-                    message=upload_msg,
-                    total_cnt=monitor.len,
-                    ext_logger=sly.logger,
-                    is_size=True,
-                )
+    def _prepare(idx: int) -> asyncio.Future:
+        dataset_info, dataset_path, dataset_fs = datasets[idx]
+        return asyncio.ensure_future(
+            prepare_dataset(
+                api,
+                item_type,
+                meta,
+                dataset_info,
+                dataset_path,
+                dataset_fs,
+                semaphore,
+                key_id_spool,
+                manifest,
+                ann_pool,
+                idx,
             )
-        upload_progress[0].set_current_value(monitor.bytes_read)
+        )
 
-    res_remote_dir = api.file.upload_directory(
-        team_id,
-        RESULT_ARCHIVE_DIR,
-        remote_path,
-        progress_size_cb=lambda m: _print_progress(m, upload_progress),
+    if len(datasets) == 0:
+        return
+    next_items = _prepare(0)
+    for idx in range(len(datasets)):
+        items = await next_items
+        if idx + 1 < len(datasets):
+            next_items = _prepare(idx + 1)
+        if items is None:
+            continue
+        dataset_name = items.dataset_info.name
+        if isinstance(items.dataset_fs, ShardDataset):
+            items.dataset_fs.set_items(items.ids, items.names, items.ann_counts)
+        if DOWNLOAD_ITEMS and not isinstance(items.dataset_fs, (TarDataset, ShardDataset)):
+            # labeled items are known now, fail before the download instead of running out of disk
+            items_bytes = sum(get_info_size(items.infos[item_id]) or 0 for item_id in items.ids)
+            check_free_space(items_bytes, items.dataset_fs.directory, f"dataset {dataset_name}")
+        try:
+            await write_items(api, items, semaphore)
+        except UploadError:
+            next_items.cancel()  # the export is stopped, archive parts can not be uploaded
+            raise
+        except Exception as e:
+            sly.logger.warning(
+                f"Can not write {len(items.ids)} items of dataset {dataset_name}: {repr(e)}. Skipping."
+            )
+            for item_id, name in zip(items.ids, items.names):
+                failed_items.add(items.dataset_info, "write", e, item_id, name)
+            continue
+        if manifest is not None:
+            failed_ids = failed_items.get_ids(items.dataset_info.id)
+            record_exported_items(items, manifest, failed_ids)
+            if INCREMENTAL_MODE == "complete":
+                # checkpoint, so the interrupted export continues from this dataset
+                await asyncio.to_thread(manifest.dump, os.path.join(STATE_DIR, MANIFEST_FILE_NAME))
+        if items.total_cnt == items.not_labeled_cnt:
+            sly.logger.warning("There are no labeled items in dataset {}".format(dataset_name))
+        else:
+            sly.logger.info(
+                f"Dataset {dataset_name} has {items.total_cnt-items.not_labeled_cnt}/{items.total_cnt} items labeled"
+            )
+    report.extra["concurrency"] = semaphore.to_json()
+
+
+def export_only_labeled_items(api: sly.Api):
+    project = api.project.get_info_by_id(project_id)
+    if project is None:
+        raise RuntimeError(f"Project with the given ID {project_id} not found")
+    w.workflow_input(api, project.id)
+    project_name = project.name
+    meta_json = api.project.get_meta(project_id)
+    meta = sly.ProjectMeta.from_json(meta_json)
+
+    if len(meta.obj_classes) == 0 and len(meta.tag_metas) == 0:
+        sly.logger.warning("Project {} have no labeled items".format(project_name))
+    if SELECTOR.enabled:
+        SELECTOR.validate(meta)
+        meta = SELECTOR.prune_meta(meta)
+
+    timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+
+    if INCREMENTAL_MODE == "complete":
+        RESULT_PROJECT_DIR = STATE_DIR
+    else:
+        RESULT_PROJECT_DIR = os.path.join(DATA_DIR, RESULT_DIR_NAME)
+    RESULT_DIR = os.path.join(RESULT_PROJECT_DIR, project_name)
+    ARCHIVE_NAME = f"{project_id}_{project_name}{ARCHIVE_EXTENSIONS[COMPRESSION]}"
+    RESULT_ARCHIVE_DIR = os.path.join(DATA_DIR, timestamp)
+    sly.fs.mkdir(RESULT_ARCHIVE_DIR, remove_content_if_exists=True)
+    RESULT_ARCHIVE = os.path.join(RESULT_ARCHIVE_DIR, ARCHIVE_NAME)
+    remote_path = os.path.join(
+        sly.team_files.RECOMMENDED_EXPORT_PATH,
+        "export-only-labeled-items",
+        timestamp,
+    )
+
+    if INCREMENTAL_MODE == "off":
+        manifest = ExportManifest(project_id, options=EXPORT_OPTIONS)
+    else:
+        manifest = load_previous_manifest(api)
+
+    if INCREMENTAL_MODE != "complete":
+        sly.fs.mkdir(RESULT_DIR, True)
+    sly.logger.info("Export folder has been created")
+
+    key_id_spool = None
+    datasets = []
+    if project.type == str(sly.ProjectType.IMAGES):
+        item_type = "image"
+    elif project.type == str(sly.ProjectType.VIDEOS):
+        item_type = "video"
+    elif project.type == str(sly.ProjectType.POINT_CLOUDS):
+        item_type = "pointcloud"
+    else:
+        raise RuntimeError(f"Project type {project.type} is not supported")
+
+    # output strategy is chosen before the download by the estimated size of the export
+    # shards are written and uploaded one by one like the parts of the streamed archive
+    shards = OUTPUT_FORMAT == "shards"
+    existing_bytes = 0  # project kept by the previous complete export is already on disk
+    if INCREMENTAL_MODE == "complete" and sly.fs.dir_exists(STATE_DIR):
+        existing_bytes = sly.fs.get_directory_size(STATE_DIR)
+    plan = plan_export(
+        estimate_project_bytes(project, DOWNLOAD_ITEMS),
+        STREAM_ARCHIVE or shards,
+        INCREMENTAL_MODE == "complete",
+        get_free_space(STATE_DIR if INCREMENTAL_MODE == "complete" else DATA_DIR),
+        SIZE_LIMIT_BYTES,
+        SHARD_SIZE if shards else SPLIT_SIZE * (1024**2),
+        UPLOAD_WORKERS * 2,
+        existing_bytes,
     )
-    main_part_name = os.path.basename(splits[0])
-    main_part = os.path.join(res_remote_dir, main_part_name)
-    file_info = api.file.get_info_by_path(team_id, main_part)
+    report.extra["plan"] = plan.to_json()
+    stream_archive = plan.strategy == "stream" and not shards
+
+    ann_pool = None
+    if item_type != "image":
+        # workers are forked before the export starts its threads
+        ann_pool = create_pool(ANN_WORKERS)
+
+    uploader = None
+    if shards:
+        uploader = create_part_uploader(api, remote_path)
+        shard_writer = ShardWriter(RESULT_ARCHIVE_DIR, SHARD_SIZE, uploader.submit)
+        project_fs = ShardProject(shard_writer, RESULT_DIR, item_type)
+    elif stream_archive:
+        uploader = create_part_uploader(api, remote_path)
+        writer = TarWriter(
+            RESULT_ARCHIVE,
+            SPLIT_SIZE * (1024**2),
+            uploader.submit,
+            compression=COMPRESSION,
+            level=COMPRESSION_LEVEL,
+            workers=COMPRESSION_WORKERS,
+        )
+        project_fs = TarProject(writer, project_name, RESULT_DIR, item_type)
+    else:
+        if item_type == "image":
+            project_class = Project
+        elif item_type == "video":
+            project_class = VideoProject
+        else:
+            project_class = PointcloudProject
+        project_fs, reopened = open_project_fs(project_class, RESULT_DIR)
+        if INCREMENTAL_MODE == "complete" and not reopened:
+            manifest = ExportManifest(project_id, options=EXPORT_OPTIONS)
+    project_fs.set_meta(meta)
+
+    if item_type == "image":
+        for parents, dataset_info in api.dataset.tree(project_id):
+            dataset_path = sly.Dataset._get_dataset_path(dataset_info.name, parents)
+            datasets.append((dataset_info, dataset_path))
+    else:
+        key_id_spool = KeyIdMapSpool(os.path.join(DATA_DIR, "key_id_map.jsonl"))
+        for dataset_info in api.dataset.get_list(project_id):
+            datasets.append((dataset_info, dataset_info.name))
+    if stream_archive or shards:
+        datasets = [
+            (info, path, project_fs.create_dataset(info.name, path)) for info, path in datasets
+        ]
+    else:
+        datasets = [
+            (info, path, open_dataset_fs(project_fs, info.name, path)) for info, path in datasets
+        ]
+
+    try:
+        run_sync(
+            export_datasets_async(api, item_type, meta, datasets, key_id_spool, manifest, ann_pool)
+        )
+    finally:
+        if ann_pool is not None:
+            ann_pool.shutdown()
+    if sly.fs.dir_exists(ANN_STAGING_DIR):
+        sly.fs.remove_dir(ANN_STAGING_DIR)  # annotations of failed items
+    report.extra["failed_items"] = failed_items.to_json()
+    report.extra["deduplication"] = content_index.to_json()
+    if SELECTOR.enabled:
+        report.extra["selection"] = SELECTOR.to_json()
+    if blob_cache is not None:
+        report.extra["cache"] = blob_cache.to_json()
+    if len(failed_items) > 0:
+        sly.logger.warning(
+            f"{len(failed_items)} items could not be exported, they are listed in {REPORT_FILE_NAME}"
+        )
+    if key_id_spool is not None:
+        if stream_archive or shards:
+            key_id_map_path = os.path.join(DATA_DIR, "key_id_map.json")
+            key_id_spool.dump(key_id_map_path)
+            project_fs.set_key_id_map_file(key_id_map_path)
+        else:
+            key_id_spool.dump(os.path.join(project_fs.directory, "key_id_map.json"))
+        sly.fs.silent_remove(key_id_spool.path)
+
+    dataset_ids = [info.id for info, _, _ in datasets]
+    for item_id, record in manifest.get_stale_items(dataset_ids).items():
+        manifest.remove(item_id)
+        stale_dataset_dir = os.path.join(RESULT_DIR, record["dataset_path"])
+        if INCREMENTAL_MODE == "complete" and sly.fs.dir_exists(stale_dataset_dir):
+            sly.fs.remove_dir(stale_dataset_dir)
+    # manifest is written beside the exported project
+    if shards:
+        manifest_path = os.path.join(RESULT_ARCHIVE_DIR, MANIFEST_FILE_NAME)
+        manifest.dump(manifest_path)
+        uploader.submit(manifest_path)
+    elif stream_archive:
+        project_fs.writer.add_json(MANIFEST_FILE_NAME, manifest.to_json())
+    else:
+        manifest.dump(os.path.join(RESULT_PROJECT_DIR, MANIFEST_FILE_NAME))
+
+    if shards:
+        with report.stage("archive"):
+            # meta, key_id_map and the index are uploaded beside the shards
+            for path in project_fs.close(INDEX_FORMAT):
+                uploader.submit(path)
+        report.add("archive", bytes=shard_writer.bytes_written)
+        sly.fs.remove_dir(RESULT_PROJECT_DIR)  # remove staging dir
+        sly.logger.info(
+            f"{len(shard_writer.records)} items are written in {len(shard_writer.shards)} "
+            f"shard(s), index format: {INDEX_FORMAT}"
+        )
+    elif stream_archive:
+        with report.stage("archive"):
+            splits = writer.close()
+        report.add("archive", bytes=writer.bytes_written)
+        sly.fs.remove_dir(RESULT_PROJECT_DIR)  # remove staging dir
+        archive_size_gb = round(writer.bytes_written / (1024 * 1024 * 1024), 2)
+        sly.logger.info(
+            f"Result archive ({archive_size_gb} GB) is written in {len(splits)} part(s)"
+        )
+    else:
+        dir_size = sly.fs.get_directory_size(RESULT_PROJECT_DIR)
+        dir_size_gb = round(dir_size / (1024 * 1024 * 1024), 2)
+
+        # the archive is split as planned, the size is checked again if it was not known
+        if plan.strategy == "directory" and dir_size < SIZE_LIMIT_BYTES:
+            sly.logger.debug(
+                f"Result archive size ({dir_size_gb} GB) less than limit {SIZE_LIMIT} GB"
+            )
+            if INCREMENTAL_MODE == "complete" or COMPRESSION != "store":
+                # set_download archives the directory without compression and removes it,
+                # but the project of the complete incremental mode is kept for the next export
+                archive_name = f"{RESULT_DIR_NAME}{ARCHIVE_EXTENSIONS[COMPRESSION]}"
+                archive_path = os.path.join(RESULT_ARCHIVE_DIR, archive_name)
+                with report.stage("archive"):
+                    archive_directory(
+                        RESULT_PROJECT_DIR,
+                        archive_path,
+                        compression=COMPRESSION,
+                        level=COMPRESSION_LEVEL,
+                        workers=COMPRESSION_WORKERS,
+                    )
+                report.add("archive", bytes=sly.fs.get_file_size(archive_path))
+                if INCREMENTAL_MODE != "complete":
+                    sly.fs.remove_dir(RESULT_PROJECT_DIR)
+            else:
+                archive_path = RESULT_PROJECT_DIR
+            with report.stage("upload", bytes=dir_size):
+                file_info = sly.output.set_download(archive_path)
+            upload_manifest(api, manifest, timestamp)
+            if file_info is None:
+                # set_download uploads the archive only in production, otherwise it stays local
+                result_dir = os.path.dirname(archive_path)
+                report.dump(os.path.join(result_dir, REPORT_FILE_NAME))
+                sly.logger.info(f"Project {project_name} has been exported to {result_dir}")
+                return
+            w.workflow_output(api, file_info)
+            upload_report(api, RESULT_ARCHIVE_DIR, os.path.dirname(file_info.path))
+            sly.logger.info(f"Project {project_name} has been successfully exported.")
+            return
+
+        # TODO: Add option to split archive by parts into sly.output.set_download() method and remove the code below.
+
+        if plan.strategy == "split":
+            sly.logger.info(
+                f"Project is bigger than {SIZE_LIMIT} GB by the estimate, "
+                f"result directory ({dir_size_gb} GB) is archived by parts"
+            )
+        else:
+            sly.logger.info(f"Result archive size ({dir_size_gb} GB) more than {SIZE_LIMIT} GB")
+        split = f"{SPLIT_SIZE}{SPLIT_MODE}"
+        sly.logger.info(f"It will be uploaded with splitting by {split}")
+        uploader = create_part_uploader(api, remote_path)
+        with report.stage("archive"):
+            splits = archive_directory(
+                RESULT_PROJECT_DIR,
+                RESULT_ARCHIVE,
+                SPLIT_SIZE * (1024**2),
+                COMPRESSION,
+                COMPRESSION_LEVEL,
+                COMPRESSION_WORKERS,
+                uploader.submit,
+            )
+        sly.logger.info(f"Result directory is archived {'with splitting' if splits else ''}")
+
+        if INCREMENTAL_MODE != "complete":
+            sly.fs.remove_dir(RESULT_PROJECT_DIR)  # remove dir
+
+    # parts are uploaded while the archive is written, wait for the last ones
+    file_info = uploader.wait()[0]
+    res_remote_dir = uploader.remote_dir
+    if not stream_archive and not shards:
+        report.add("archive", bytes=uploader.uploaded_bytes)  # parts are removed after upload
     try:
         api.task.set_output_directory(
             task_id=task_id, file_id=file_info.id, directory_path=res_remote_dir
@@ -494,6 +1537,8 @@ def export_only_labeled_items(api: sly.Api):
             "Task ID is not set in local.env file, it has no effect in development mode."
         )
     w.workflow_output(api, file_info)
+    upload_manifest(api, manifest, timestamp)
+    upload_report(api, RESULT_ARCHIVE_DIR, res_remote_dir)
     sly.logger.info(f"Uploaded to Team-Files: {res_remote_dir}")
 
 
@@ -0,0 +1,127 @@
+# This module contains the manifest of exported items, used for incremental and resumable export.
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import supervisely as sly
+
+MANIFEST_FILE_NAME = "export_manifest.json"
+
+
+def dump_ann_json(ann_json: Dict) -> bytes:
+    """Returns annotation JSON serialized with sorted keys, as it is hashed."""
+    return json.dumps(ann_json, sort_keys=True, ensure_ascii=False).encode("utf-8")
+
+
+def get_ann_hash(ann_json: Dict, ann_bytes: Optional[bytes] = None) -> str:
+    """Returns hash of annotation JSON that does not depend on keys order.
+
+    Annotation serialized with ``dump_ann_json`` can be given to avoid serializing it again.
+    """
+    if ann_bytes is None:
+        ann_bytes = dump_ann_json(ann_json)
+    return hashlib.sha256(ann_bytes).hexdigest()
+
+
+class ExportManifest:
+    """Records of exported items: ID, dataset, name, update time and annotation hash.
+
+    Next export of the same project compares items with these records and skips the unchanged ones.
+    ``options`` are the options of the export that define its content (item files, selection,
+    output format), records are valid only for the export with the same options.
+    """
+
+    def __init__(
+        self,
+        project_id: int,
+        items: Optional[Dict[int, Dict]] = None,
+        options: Optional[Dict] = None,
+    ):
+        self.project_id = project_id
+        self.items: Dict[int, Dict] = items or {}
+        self.options = options
+        self.removed: List[int] = []
+        self._lock = threading.Lock()
+
+    def is_unchanged(self, item_id: int, updated_at: str, ann_hash: str) -> bool:
+        with self._lock:
+            record = self.items.get(item_id)
+        if record is None:
+            return False
+        return record["updated_at"] == updated_at and record["ann_hash"] == ann_hash
+
+    def add(
+        self,
+        item_id: int,
+        dataset_id: int,
+        dataset_path: str,
+        name: str,
+        updated_at: str,
+        ann_hash: str,
+    ):
+        with self._lock:
+            self.items[item_id] = {
+                "dataset_id": dataset_id,
+                "dataset_path": dataset_path,
+                "name": name,
+                "updated_at": updated_at,
+                "ann_hash": ann_hash,
+            }
+
+    def remove(self, item_id: int):
+        with self._lock:
+            if self.items.pop(item_id, None) is not None:
+                self.removed.append(item_id)
+
+    def get_dataset_items(self, dataset_id: int) -> Dict[int, Dict]:
+        with self._lock:
+            return {
+                item_id: record
+                for item_id, record in self.items.items()
+                if record["dataset_id"] == dataset_id
+            }
+
+    def get_stale_items(self, dataset_ids: List[int]) -> Dict[int, Dict]:
+        """Returns records of items from datasets that are not in the given list."""
+        dataset_ids = set(dataset_ids)
+        with self._lock:
+            return {
+                item_id: record
+                for item_id, record in self.items.items()
+                if record["dataset_id"] not in dataset_ids
+            }
+
+    def to_json(self) -> Dict:
+        with self._lock:
+            return {
+                "project_id": self.project_id,
+                "created_at": datetime.now().isoformat(),
+                "options": self.options,
+                "items": {str(item_id): record for item_id, record in self.items.items()},
+                "removed": list(self.removed),
+            }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "ExportManifest":
+        items = {int(item_id): record for item_id, record in data.get("items", {}).items()}
+        return cls(data["project_id"], items, data.get("options"))
+
+    def dump(self, path: str):
+        sly.fs.ensure_base_path(path)
+        tmp_path = path + ".tmp"
+        sly.json.dump_json_file(self.to_json(), tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ExportManifest"]:
+        if not os.path.isfile(path):
+            return None
+        try:
+            return cls.from_json(sly.json.load_json_file(path))
+        except Exception as e:
+            sly.logger.warning(f"Can not read export manifest {path}: {repr(e)}")
+            return None
@@ -0,0 +1,152 @@
+# This module contains the pre-flight estimate of the export size and the choice of the output strategy.
+
+import os
+import shutil
+from typing import Dict, NamedTuple, Optional
+
+import supervisely as sly
+
+DISK_RESERVE = 1024**3  # bytes kept free for logs, annotations and temporary files
+
+
+class ExportPlan(NamedTuple):
+    """Output strategy chosen before the download.
+
+    Strategies:
+     - "directory" - project directory is prepared on disk, archived to one file at the end
+       and uploaded by ``sly.output.set_download``
+     - "split" - project directory is prepared on disk and archived into parts of fixed
+       size at the end, parts are uploaded as they are written
+     - "stream" - items are streamed into archive parts that are uploaded as they are written
+    """
+
+    strategy: str
+    estimated_bytes: Optional[int]  # None if the project size is unknown
+    existing_bytes: int  # size of the project kept on the agent by the previous export
+    required_bytes: Optional[int]
+    free_bytes: int
+
+    def to_json(self) -> Dict:
+        return self._asdict()
+
+
+def get_free_space(path: str) -> int:
+    """Returns free space of the disk with the path, the path may not exist yet."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def estimate_project_bytes(project_info: sly.ProjectInfo, download_items: bool) -> Optional[int]:
+    """Returns upper bound of the exported items size: size of all items of the project.
+
+    Unlabeled items are counted too, they are not known before annotations are
+    downloaded, so the exact size of labeled items is checked per dataset during the
+    export. Returns 0 for exports of annotations only and None if the server does not
+    report size of the project.
+    """
+    if not download_items:
+        return 0
+    size = getattr(project_info, "size", None)
+    if size is None:
+        return None
+    return int(size)
+
+
+def get_required_bytes(
+    strategy: str,
+    estimated_bytes: int,
+    part_size: int,
+    parts_in_flight: int,
+    existing_bytes: int = 0,
+) -> int:
+    """Returns disk space needed by the strategy for the project of the given size.
+
+    The "directory" strategy archives the project to one file before the upload, so it
+    needs the project and its archive. The "split" and "stream" strategies archive by parts
+    that are removed after upload. Project kept on the agent by the previous export
+    (``existing_bytes``) is already on disk, only the rest of the project is downloaded.
+    """
+    parts_bytes = part_size * (parts_in_flight + 1)
+    if strategy == "stream":
+        return parts_bytes + DISK_RESERVE
+    new_bytes = max(estimated_bytes - existing_bytes, 0)
+    if strategy == "directory":
+        return new_bytes + estimated_bytes + DISK_RESERVE
+    return new_bytes + parts_bytes + DISK_RESERVE
+
+
+def plan_export(
+    estimated_bytes: Optional[int],
+    stream_requested: bool,
+    keep_project: bool,
+    free_bytes: int,
+    size_limit: int,
+    part_size: int,
+    parts_in_flight: int,
+    existing_bytes: int = 0,
+) -> ExportPlan:
+    """Chooses output strategy that fits into the free disk space.
+
+    Project smaller than the size limit is archived to one file, bigger projects are
+    archived by parts. The estimate is an upper bound, so if the project directory does
+    not fit on disk, items are streamed into archive parts, and if the project must be kept
+    on the agent (complete incremental export), the export goes on with a warning and
+    labeled items are checked per dataset. Raises RuntimeError only if archive parts of
+    the streaming mode do not fit into the free space.
+    """
+
+    def _required(strategy: str) -> Optional[int]:
+        if estimated_bytes is None and strategy != "stream":
+            return None
+        return get_required_bytes(
+            strategy, estimated_bytes or 0, part_size, parts_in_flight, existing_bytes
+        )
+
+    def _fits(strategy: str) -> bool:
+        required = _required(strategy)
+        return required is None or required <= free_bytes
+
+    if stream_requested:
+        strategy = "stream"
+    elif estimated_bytes is not None and estimated_bytes >= size_limit:
+        strategy = "split"
+    else:
+        strategy = "directory"
+    if not _fits(strategy) and strategy != "stream":
+        if keep_project:
+            sly.logger.warning(
+                f"Project ({_to_gb(estimated_bytes)} GB with unlabeled items) may not fit into "
+                f"free disk space ({_to_gb(free_bytes)} GB), labeled items of every dataset "
+                "are checked before the download"
+            )
+        else:
+            sly.logger.warning(
+                f"Project ({_to_gb(estimated_bytes)} GB with unlabeled items) may not fit into "
+                f"free disk space ({_to_gb(free_bytes)} GB), items will be streamed into "
+                "archive parts"
+            )
+            strategy = "stream"
+    if strategy == "stream" and not _fits(strategy):
+        raise RuntimeError(
+            f"Not enough disk space for the export: {_to_gb(_required(strategy))} GB is "
+            f"required, {_to_gb(free_bytes)} GB is free"
+        )
+    plan = ExportPlan(strategy, estimated_bytes, existing_bytes, _required(strategy), free_bytes)
+    sly.logger.info("Export plan", extra=plan.to_json())
+    return plan
+
+
+def check_free_space(required_bytes: int, path: str, description: str):
+    """Raises RuntimeError if the data does not fit into free space of the disk with the path."""
+    free_bytes = get_free_space(path)
+    if required_bytes + DISK_RESERVE > free_bytes:
+        raise RuntimeError(
+            f"Not enough disk space for {description}: {_to_gb(required_bytes)} GB is required, "
+            f"{_to_gb(free_bytes)} GB is free"
+        )
+
+
+def _to_gb(size: Optional[int]) -> Optional[float]:
+    return round(size / 1024**3, 2) if size is not None else None
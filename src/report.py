@@ -0,0 +1,233 @@
+# This module contains per-stage instrumentation of the export and the JSON run report.
+
+import cProfile
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import supervisely as sly
+
+REPORT_FILE_NAME = "export_report.json"
+PROFILES_DIR_NAME = "profiles"
+RSS_SAMPLE_INTERVAL = 0.1  # seconds between RSS samples while stages are running
+STAGES = [
+    "listing",
+    "annotation_download",
+    "filtering",
+    "annotation_parsing",
+    "item_download",
+    "disk_write",
+    "archive",
+    "upload",
+]
+
+
+def get_peak_rss_mb() -> float:
+    """Returns peak resident set size of the process since its start in MB."""
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+def get_rss_mb() -> float:
+    """Returns current resident set size of the process in MB.
+
+    Falls back to the peak RSS of the process if /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss_mb()
+    return round(pages * resource.getpagesize() / 1024**2, 2)
+
+
+class StageStats:
+    """Accumulated wall time, number of items and bytes of one export stage.
+
+    ``peak_rss_mb`` is the highest RSS of the process sampled while the stage was
+    running. Stages overlap in time, so it includes memory used by other stages.
+    """
+
+    def __init__(self):
+        self.wall_time = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.peak_rss_mb = 0.0
+
+    def add(self, wall_time: float = 0.0, items: int = 0, bytes: int = 0, rss_mb: float = 0.0):
+        self.wall_time += wall_time
+        self.items += items
+        self.bytes += bytes
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+
+    def to_json(self) -> Dict:
+        wall_time = self.wall_time or None
+        return {
+            "wall_time_sec": round(self.wall_time, 3),
+            "items": self.items,
+            "bytes": self.bytes,
+            "items_per_sec": round(self.items / wall_time, 2) if wall_time else None,
+            "mb_per_sec": round(self.bytes / 1024**2 / wall_time, 2) if wall_time else None,
+            "peak_rss_mb": self.peak_rss_mb,
+        }
+
+
+class ExportReport:
+    """Collects stage statistics per dataset and writes them to export_report.json.
+
+    Stages of different datasets overlap in time (the next dataset is prepared while
+    the current one is downloaded), so wall times of the stages are not additive.
+    Item download of images includes writing them to disk, which is also counted
+    separately in the "disk_write" stage.
+
+    RSS is sampled in a thread every RSS_SAMPLE_INTERVAL seconds while any stage is
+    running, every sample raises the peak RSS of the stages that are running at the moment.
+    """
+
+    def __init__(self, project_id: int, log_stages: bool = False, profile_filter: str = None):
+        self.project_id = project_id
+        self.log_stages = log_stages
+        self.profile_filter = profile_filter
+        self.started_at = datetime.now()
+        self._start_time = time.monotonic()
+        self.datasets: Dict[str, Dict[str, StageStats]] = {}
+        self.extra: Dict = {}
+        self._lock = threading.Lock()
+        self._running: Dict[Tuple[str, str], int] = {}  # stages in progress -> number of blocks
+        self._rss_mb = 0.0  # last RSS sample
+        self._sampler: Optional[threading.Thread] = None
+
+    def _sample_rss(self):
+        while True:
+            rss_mb = get_rss_mb()
+            with self._lock:
+                self._rss_mb = rss_mb
+                for dataset, stage in self._running:
+                    stats = self.datasets[dataset][stage]
+                    stats.peak_rss_mb = max(stats.peak_rss_mb, rss_mb)
+            time.sleep(RSS_SAMPLE_INTERVAL)
+
+    def _get_stats(self, stage: str, dataset: str) -> StageStats:
+        if self._sampler is None:
+            # started with the first stage, after the annotation pool is forked
+            self._rss_mb = get_rss_mb()
+            self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self._sampler.start()
+        return self.datasets.setdefault(dataset, {}).setdefault(stage, StageStats())
+
+    def add(
+        self,
+        stage: str,
+        dataset: Optional[str] = None,
+        wall_time: float = 0.0,
+        items: int = 0,
+        bytes: int = 0,
+    ):
+        """Adds measurements to the stage of the dataset. Project level stages have no dataset."""
+        dataset = dataset or "__project__"
+        with self._lock:
+            self._get_stats(stage, dataset).add(wall_time, items, bytes, self._rss_mb)
+
+    @contextmanager
+    def stage(self, stage: str, dataset: Optional[str] = None, items: int = 0, bytes: int = 0):
+        """Measures wall time and peak RSS of the code block and adds them to the stage
+        of the dataset."""
+        key = (dataset or "__project__", stage)
+        with self._lock:
+            stats = self._get_stats(stage, key[0])
+            self._running[key] = self._running.get(key, 0) + 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            wall_time = time.monotonic() - start
+            with self._lock:
+                self._running[key] -= 1
+                if self._running[key] == 0:
+                    self._running.pop(key)
+                stats.add(wall_time, items, bytes, get_rss_mb())
+            if self.log_stages:
+                sly.logger.info(
+                    "Export stage finished",
+                    extra={
+                        "stage": stage,
+                        "dataset": dataset,
+                        "wall_time_sec": round(wall_time, 3),
+                        "items": items,
+                        "bytes": bytes,
+                        "peak_rss_mb": stats.peak_rss_mb,
+                    },
+                )
+
+    @contextmanager
+    def profile(self, name: str, output_dir: str):
+        """Profiles the code block if profiling is enabled with PROFILE_FILTER env variable.
+
+        Supported profilers: "cprofile" (writes .prof file) and "pyinstrument" (writes .html file).
+        """
+        if self.profile_filter in ["cprofile", "pyinstrument"]:
+            sly.fs.mkdir(output_dir)
+        if self.profile_filter == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(output_dir, f"profile_{name}.prof"))
+        elif self.profile_filter == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                sly.logger.warning("pyinstrument is not installed, profiling is skipped")
+                yield
+                return
+            profiler = Profiler(async_mode="disabled")
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(os.path.join(output_dir, f"profile_{name}.html"), "w") as f:
+                    f.write(profiler.output_html())
+        else:
+            yield
+
+    def get_totals(self) -> Dict[str, StageStats]:
+        totals = {}
+        with self._lock:
+            for stages in self.datasets.values():
+                for stage, stats in stages.items():
+                    total = totals.setdefault(stage, StageStats())
+                    total.wall_time += stats.wall_time
+                    total.items += stats.items
+                    total.bytes += stats.bytes
+                    total.peak_rss_mb = max(total.peak_rss_mb, stats.peak_rss_mb)
+        return totals
+
+    def to_json(self) -> Dict:
+        totals = self.get_totals()
+        with self._lock:
+            datasets = {
+                dataset: {stage: stats.to_json() for stage, stats in stages.items()}
+                for dataset, stages in self.datasets.items()
+            }
+        return {
+            "project_id": self.project_id,
+            "started_at": self.started_at.isoformat(),
+            "wall_time_sec": round(time.monotonic() - self._start_time, 3),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "stages": {
+                stage: totals[stage].to_json() for stage in STAGES + list(totals) if stage in totals
+            },
+            "datasets": datasets,
+            **self.extra,
+        }
+
+    def dump(self, path: str):
+        sly.json.dump_json_file(self.to_json(), path, indent=4)
+        sly.logger.info(f"Export report is saved: {path}")
@@ -0,0 +1,154 @@
+# This module contains retries with backoff and the ledger of items that could not be exported.
+
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+import supervisely as sly
+
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BACKOFF = 1.0  # seconds before the first retry, doubled for every next one
+MAX_BACKOFF = 30.0
+
+
+def get_backoff_delay(attempt: int, backoff: float = DEFAULT_BACKOFF) -> float:
+    """Returns delay before the given retry (1-based) with exponential growth and jitter."""
+    return min(MAX_BACKOFF, backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+async def retry_async(
+    func: Callable[..., Awaitable],
+    *args,
+    attempts: int = DEFAULT_ATTEMPTS,
+    backoff: float = DEFAULT_BACKOFF,
+    description: str = "Request",
+    **kwargs,
+):
+    """Awaits ``func(*args, **kwargs)`` and retries it with backoff if it raises."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = get_backoff_delay(attempt, backoff)
+            sly.logger.debug(
+                f"{description} failed (attempt {attempt}/{attempts}): {repr(e)}. "
+                f"Retrying in {delay:.1f} s"
+            )
+            await asyncio.sleep(delay)
+
+
+def retry(
+    func: Callable,
+    *args,
+    attempts: int = DEFAULT_ATTEMPTS,
+    backoff: float = DEFAULT_BACKOFF,
+    description: str = "Request",
+    **kwargs,
+):
+    """Calls ``func(*args, **kwargs)`` and retries it with backoff if it raises.
+    Blocking version of ``retry_async`` for the code that runs in threads."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = get_backoff_delay(attempt, backoff)
+            sly.logger.debug(
+                f"{description} failed (attempt {attempt}/{attempts}): {repr(e)}. "
+                f"Retrying in {delay:.1f} s"
+            )
+            time.sleep(delay)
+
+
+async def download_isolated(
+    download: Callable[[List[Hashable]], Awaitable],
+    ids: List[Hashable],
+    is_done: Callable[[Hashable], bool],
+    attempts: int = DEFAULT_ATTEMPTS,
+    backoff: float = DEFAULT_BACKOFF,
+) -> Dict[Hashable, Exception]:
+    """Downloads a batch of items and retries only the items that are not done yet.
+
+    ``download(batch_ids)`` is awaited for the whole batch first. After every failed
+    attempt only the items for which ``is_done(item_id)`` is False are requested again.
+    If the batch keeps failing, the remaining items are downloaded one by one, so a
+    single bad item does not fail the others.
+
+    Returns dict: item ID -> last error, for the items that could not be downloaded.
+    """
+    pending = list(ids)
+    if len(pending) == 0:
+        return {}
+    error = None
+    for attempt in range(attempts):
+        if attempt > 0:
+            await asyncio.sleep(get_backoff_delay(attempt, backoff))
+        try:
+            await download(pending)
+            error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        pending = [item_id for item_id in pending if not is_done(item_id)]
+        if len(pending) == 0:
+            return {}
+        if error is None:
+            error = RuntimeError(f"{len(pending)} items were not returned by the server")
+        sly.logger.debug(
+            f"Download of {len(pending)} items failed (attempt {attempt + 1}/{attempts}): "
+            f"{repr(error)}"
+        )
+    if len(pending) == 1:
+        return {pending[0]: error}
+    results = await asyncio.gather(
+        *[download_isolated(download, [item_id], is_done, attempts, backoff) for item_id in pending]
+    )
+    return {item_id: e for failed in results for item_id, e in failed.items()}
+
+
+class FailedItemsLedger:
+    """Thread-safe list of items that could not be exported after all retries."""
+
+    def __init__(self):
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        dataset_info: sly.DatasetInfo,
+        stage: str,
+        error: Exception,
+        item_id: Optional[int] = None,
+        name: Optional[str] = None,
+    ):
+        """Adds failed item. Item ID is None if the whole dataset failed."""
+        with self._lock:
+            self.records.append(
+                {
+                    "dataset_id": dataset_info.id,
+                    "dataset": dataset_info.name,
+                    "item_id": item_id,
+                    "name": name,
+                    "stage": stage,
+                    "error": repr(error),
+                }
+            )
+
+    def get_ids(self, dataset_id: int) -> set:
+        with self._lock:
+            return {r["item_id"] for r in self.records if r["dataset_id"] == dataset_id}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def to_json(self) -> List[Dict]:
+        with self._lock:
+            return list(self.records)
@@ -0,0 +1,154 @@
+# This module contains checks of raw annotation JSON: emptiness, class and tag counts and the selection of items by them.
+
+import json
+import threading
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+import supervisely as sly
+
+
+class AnnotationCounts(NamedTuple):
+    """Lightweight index of one item annotation, built from raw JSON."""
+
+    classes: Dict[str, int]  # number of objects of every class
+    tags: Dict[str, int]  # number of item and object tags with every name
+
+
+def is_empty_ann_json(ann_json: Dict) -> bool:
+    """Checks whether raw annotation JSON has no objects and no tags.
+
+    Gives the same result as ``is_empty()`` of image, video and pointcloud annotations,
+    but does not build geometries or touch the KeyIdMap. Figures and frames always
+    reference objects, so checking the "objects" list is enough for them.
+    """
+    return not ann_json.get("objects") and not ann_json.get("tags")
+
+
+def count_annotation(ann_json: Dict) -> AnnotationCounts:
+    """Counts objects by class and tags by name in image, video or pointcloud annotation JSON."""
+    classes = Counter()
+    tags = Counter(tag.get("name") for tag in ann_json.get("tags") or [])
+    for obj in ann_json.get("objects") or []:
+        classes[obj.get("classTitle")] += 1
+        tags.update(tag.get("name") for tag in obj.get("tags") or [])
+    return AnnotationCounts(dict(classes), dict(tags))
+
+
+def prune_ann_json(ann_json: Dict, classes: set) -> Dict:
+    """Returns annotation JSON without objects of other classes and their figures.
+
+    Image labels are objects themselves. Video figures are stored in frames and pointcloud
+    figures in the "figures" list, both reference objects by key.
+    """
+    objects = [obj for obj in ann_json.get("objects") or [] if obj.get("classTitle") in classes]
+    pruned = dict(ann_json, objects=objects)
+    keys = {obj.get("key") for obj in objects}
+    if "frames" in ann_json:
+        pruned["frames"] = [
+            dict(
+                frame, figures=[f for f in frame.get("figures") or [] if f.get("objectKey") in keys]
+            )
+            for frame in ann_json["frames"]
+        ]
+    if "figures" in ann_json:
+        pruned["figures"] = [f for f in ann_json["figures"] if f.get("objectKey") in keys]
+    return pruned
+
+
+def parse_names(value: Optional[str]) -> List[str]:
+    """Parses list of class or tag names from JSON list or comma-separated string."""
+    value = (value or "").strip()
+    if value.startswith("["):
+        names = json.loads(value)
+    else:
+        names = value.split(",")
+    return [name.strip() for name in names if name.strip()]
+
+
+class ItemSelector:
+    """Predicate that selects labeled items by their class and tag counts.
+
+    An item is selected if it has an object of any of the given classes, has any of the
+    given tags, and has at least ``min_objects`` objects (of the given classes, if they
+    are set). Conditions that are not set are not checked. With ``prune`` objects of
+    other classes are removed from annotations and the project meta.
+    """
+
+    def __init__(
+        self,
+        classes: List[str],
+        tags: List[str],
+        min_objects: int = 0,
+        prune: bool = False,
+    ):
+        self.classes = set(classes)
+        self.tags = set(tags)
+        self.min_objects = min_objects
+        self.prune = prune and len(self.classes) > 0
+        self.selected = 0
+        self.not_selected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.classes) > 0 or len(self.tags) > 0 or self.min_objects > 0
+
+    def validate(self, meta: sly.ProjectMeta):
+        """Warns about names missing in the project meta. Raises RuntimeError if none of
+        the given classes or tags exists, the export would be empty."""
+        for kind, names, collection in [
+            ("classes", self.classes, meta.obj_classes),
+            ("tags", self.tags, meta.tag_metas),
+        ]:
+            missing = sorted(name for name in names if collection.get(name) is None)
+            if len(names) > 0 and len(missing) == len(names):
+                raise RuntimeError(f"None of the selected {kind} exists in the project: {missing}")
+            if len(missing) > 0:
+                sly.logger.warning(f"Selected {kind} do not exist in the project: {missing}")
+
+    def match(self, counts: AnnotationCounts) -> bool:
+        if len(self.classes) > 0:
+            objects_cnt = sum(counts.classes.get(name, 0) for name in self.classes)
+            matched = objects_cnt > 0
+        else:
+            objects_cnt = sum(counts.classes.values())
+            matched = True
+        if len(self.tags) > 0:
+            matched = matched and any(name in counts.tags for name in self.tags)
+        matched = matched and objects_cnt >= self.min_objects
+        with self._lock:
+            if matched:
+                self.selected += 1
+            else:
+                self.not_selected += 1
+        return matched
+
+    def prune_ann_json(self, ann_json: Dict) -> Dict:
+        if not self.prune:
+            return ann_json
+        return prune_ann_json(ann_json, self.classes)
+
+    def prune_meta(self, meta: sly.ProjectMeta) -> sly.ProjectMeta:
+        if not self.prune:
+            return meta
+        obj_classes = [
+            obj_class for obj_class in meta.obj_classes if obj_class.name in self.classes
+        ]
+        return meta.clone(obj_classes=sly.ObjClassCollection(obj_classes))
+
+    def get_options(self) -> Dict:
+        """Returns the selection options, without the counts of the items."""
+        return {
+            "classes": sorted(self.classes),
+            "tags": sorted(self.tags),
+            "min_objects": self.min_objects,
+            "prune": self.prune,
+        }
+
+    def to_json(self) -> Dict:
+        return {
+            **self.get_options(),
+            "selected_items": self.selected,
+            "not_selected_items": self.not_selected,
+        }
@@ -0,0 +1,294 @@
+# This module contains the sharded output: items with annotations in tar shards of fixed size and the index of items.
+
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import supervisely as sly
+
+from selection import AnnotationCounts
+from tar_stream import ITEM_DIR_NAMES, RELATED_IMAGES_DIR_NAME
+
+INDEX_FORMATS = ["auto", "parquet", "npz"]
+INDEX_FILE_NAME = "index"
+SHARD_NAME_TEMPLATE = "shard-{:06d}.tar"
+CLASS_COLUMN_PREFIX = "objects/"  # index column with number of objects of the class
+
+
+def resolve_index_format(index_format: str) -> str:
+    """Returns format of the index file.
+
+    "auto" writes Parquet if pyarrow is installed and NPZ otherwise, Parquet falls back
+    to NPZ if pyarrow is not installed.
+    """
+    if index_format not in INDEX_FORMATS:
+        raise ValueError(f"Unknown index format {index_format!r}, expected one of {INDEX_FORMATS}")
+    if index_format == "npz":
+        return index_format
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        if index_format == "parquet":
+            sly.logger.warning("pyarrow is not installed, index is written in NPZ format")
+        return "npz"
+    return "parquet"
+
+
+class IndexRecord(NamedTuple):
+    """Row of the index: where the item and its annotation are stored in the shards."""
+
+    item_id: int
+    name: str
+    dataset: str
+    shard: str
+    key: str
+    offset: int  # offset of the item file data in the shard, -1 if items are not exported
+    size: int
+    ann_offset: int
+    ann_size: int
+    counts: AnnotationCounts
+
+
+class ShardWriter:
+    """Thread-safe writer of samples into uncompressed tar shards of fixed size.
+
+    Files of a sample are written one after another into the same shard, like in
+    WebDataset: <key>.<extension>. The shard is sealed and passed to ``on_shard_sealed``
+    once its size reaches ``shard_size``, so shards are a bit bigger than the limit.
+    Shards are not compressed, so the offsets of the files in the index point to
+    their data in the shard files.
+    """
+
+    def __init__(
+        self,
+        shards_dir: str,
+        shard_size: int,
+        on_shard_sealed: Optional[Callable[[str], None]] = None,
+    ):
+        self.shards_dir = shards_dir
+        self.shard_size = shard_size
+        self.on_shard_sealed = on_shard_sealed
+        self.shards: List[str] = []
+        self.records: List[IndexRecord] = []
+        self.bytes_written = 0
+        self._tar = None
+        self._lock = threading.Lock()
+        sly.fs.mkdir(shards_dir)
+
+    def _open_shard(self):
+        path = os.path.join(self.shards_dir, SHARD_NAME_TEMPLATE.format(len(self.shards)))
+        self.shards.append(path)
+        self._tar = tarfile.open(path, "w", format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+    def _seal_shard(self):
+        self._tar.close()
+        self._tar = None
+        self.bytes_written += sly.fs.get_file_size(self.shards[-1])
+        if self.on_shard_sealed is not None:
+            self.on_shard_sealed(self.shards[-1])
+
+    def _add_member(self, arcname: str, data: Union[bytes, str]) -> Tuple[int, int]:
+        """Adds bytes or file to the current shard, returns offset and size of its data."""
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.mtime = int(time.time())
+        if isinstance(data, str):
+            tarinfo.size = os.path.getsize(data)
+            with open(data, "rb") as f:
+                self._tar.addfile(tarinfo, f)
+        else:
+            tarinfo.size = len(data)
+            self._tar.addfile(tarinfo, io.BytesIO(data))
+        # data is padded to the tar block size, shard offset points to the end of the padding
+        padded_size = -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return self._tar.offset - padded_size, tarinfo.size
+
+    def add_sample(
+        self,
+        key: str,
+        files: List[Tuple[str, Union[bytes, str]]],
+        item_id: int,
+        name: str,
+        dataset: str,
+        counts: AnnotationCounts,
+    ):
+        """Writes files of the sample, given as (extension, bytes or path), and adds the
+        sample to the index. The item file goes first, the annotation has "json" extension."""
+        with self._lock:
+            if self._tar is None:
+                self._open_shard()
+            locations = {ext: self._add_member(f"{key}.{ext}", data) for ext, data in files}
+            item_ext = files[0][0]
+            offset, size = locations[item_ext] if item_ext != "json" else (-1, -1)
+            ann_offset, ann_size = locations.get("json", (-1, -1))
+            shard = os.path.basename(self.shards[-1])
+            self.records.append(
+                IndexRecord(
+                    item_id, name, dataset, shard, key, offset, size, ann_offset, ann_size, counts
+                )
+            )
+            if self._tar.offset >= self.shard_size:
+                self._seal_shard()
+
+    def close(self) -> List[str]:
+        """Seals the last shard and returns paths of all shards."""
+        with self._lock:
+            if self._tar is not None:
+                self._seal_shard()
+        return self.shards
+
+    def dump_index(self, path: str, index_format: str, class_names: List[str]) -> str:
+        """Writes index of the samples to <path>.parquet or <path>.npz, returns its path.
+
+        Columns: item_id, name, dataset, shard, key, offset, size, ann_offset, ann_size
+        and number of objects of every class in "objects/<class name>" columns.
+        """
+        with self._lock:
+            records = list(self.records)
+        columns = {
+            "item_id": np.array([r.item_id for r in records], dtype=np.int64),
+            "name": np.array([r.name for r in records], dtype=str),
+            "dataset": np.array([r.dataset for r in records], dtype=str),
+            "shard": np.array([r.shard for r in records], dtype=str),
+            "key": np.array([r.key for r in records], dtype=str),
+        }
+        for field in ["offset", "size", "ann_offset", "ann_size"]:
+            columns[field] = np.array([getattr(r, field) for r in records], dtype=np.int64)
+        for class_name in class_names:
+            columns[CLASS_COLUMN_PREFIX + class_name] = np.array(
+                [r.counts.classes.get(class_name, 0) for r in records], dtype=np.int32
+            )
+        if index_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            path = f"{path}.parquet"
+            pq.write_table(pa.table(columns), path)
+        else:
+            path = f"{path}.npz"
+            np.savez_compressed(path, **columns)
+        return path
+
+
+class ShardDataset:
+    """Dataset that writes every item with its annotation as a sample of the shards.
+
+    Implements the part of sly.Dataset interface used by the export. The sample key is
+    the item ID, so keys are unique in the export and do not contain dots. Item files
+    downloaded to the staging directory are removed right after they are written.
+    """
+
+    def __init__(self, writer: ShardWriter, ds_path: str, staging_dir: str, item_type: str):
+        self.writer = writer
+        self.ds_path = ds_path
+        self.directory = staging_dir
+        self.item_type = item_type
+        self.item_dir = os.path.join(staging_dir, ITEM_DIR_NAMES[item_type])
+        self._items: Dict[str, Tuple[int, AnnotationCounts]] = {}
+
+    def set_items(self, ids: List[int], names: List[str], counts: List[AnnotationCounts]):
+        """Sets IDs and class counts of the items to be written, they are not passed
+        to the methods of sly.Dataset interface."""
+        self._items = {name: (item_id, c) for item_id, name, c in zip(ids, names, counts)}
+
+    def generate_item_path(self, item_name: str) -> str:
+        sly.fs.mkdir(self.item_dir)
+        return os.path.join(self.item_dir, item_name)
+
+    def get_related_images_path(self, item_name: str) -> str:
+        item_name_temp = item_name.replace(".", "_")
+        return os.path.join(self.directory, RELATED_IMAGES_DIR_NAME, item_name_temp)
+
+    def _get_item_ext(self, item_name: str) -> str:
+        return sly.fs.get_file_ext(item_name).lstrip(".").lower() or ITEM_DIR_NAMES[self.item_type]
+
+    def _add_sample(self, item_name: str, files: List[Tuple[str, Union[bytes, str]]]):
+        item_id, counts = self._items[item_name]
+        self.writer.add_sample(str(item_id), files, item_id, item_name, self.ds_path, counts)
+
+    def _get_ann_data(self, ann) -> Union[bytes, str]:
+        if isinstance(ann, str):
+            return ann
+        ann_json = ann if isinstance(ann, dict) else ann.to_json()
+        return json.dumps(ann_json).encode("utf-8")
+
+    def add_ann_json(self, item_name: str, ann_json: Dict):
+        self._add_sample(item_name, [("json", self._get_ann_data(ann_json))])
+
+    def add_ann_file(self, item_name: str, ann_path: str):
+        self._add_sample(item_name, [("json", ann_path)])
+
+    def add_item_raw_bytes(self, item_name: str, item_raw_bytes: bytes, ann: Union[Dict, str]):
+        files = [(self._get_item_ext(item_name), item_raw_bytes), ("json", self._get_ann_data(ann))]
+        self._add_sample(item_name, files)
+
+    def add_item_file(self, item_name: str, item_path: str, ann=None, _validate_item: bool = True):
+        files = []
+        if os.path.isfile(item_path):
+            files.append((self._get_item_ext(item_name), item_path))
+        if ann is not None:
+            files.append(("json", self._get_ann_data(ann)))
+        rimage_dir = self.get_related_images_path(item_name)
+        if self.item_type == "pointcloud" and os.path.isdir(rimage_dir):
+            # related images and their infos: <key>.rimg0.jpg, <key>.rimg0.json, ...
+            rimage_names = [n for n in sorted(os.listdir(rimage_dir)) if not n.endswith(".json")]
+            for idx, rimage_name in enumerate(rimage_names):
+                rimage_path = os.path.join(rimage_dir, rimage_name)
+                rimage_ext = sly.fs.get_file_ext(rimage_name).lstrip(".").lower()
+                files.append((f"rimg{idx}.{rimage_ext}", rimage_path))
+                if os.path.isfile(rimage_path + ".json"):
+                    files.append((f"rimg{idx}.json", rimage_path + ".json"))
+        if len(files) > 0:
+            self._add_sample(item_name, files)
+        sly.fs.silent_remove(item_path)
+        if os.path.isdir(rimage_dir):
+            sly.fs.remove_dir(rimage_dir)
+
+
+class ShardProject:
+    """Project that writes items of all datasets into shards as they arrive.
+
+    Implements the part of sly.Project interface used by the export. Project meta,
+    key_id_map.json and the index are written to the directory of the shards.
+    """
+
+    def __init__(self, writer: ShardWriter, staging_dir: str, item_type: str):
+        self.writer = writer
+        self.directory = writer.shards_dir
+        self.staging_dir = staging_dir
+        self.item_type = item_type
+        self.class_names: List[str] = []
+        self.files: List[str] = []  # files written beside the shards
+
+    def set_meta(self, meta: sly.ProjectMeta):
+        self.class_names = [obj_class.name for obj_class in meta.obj_classes]
+        meta_path = os.path.join(self.directory, "meta.json")
+        sly.json.dump_json_file(meta.to_json(), meta_path)
+        self.files.append(meta_path)
+
+    def create_dataset(self, ds_name: str, ds_path: Optional[str] = None) -> ShardDataset:
+        ds_path = ds_path or ds_name
+        return ShardDataset(
+            self.writer, ds_path, os.path.join(self.staging_dir, ds_path), self.item_type
+        )
+
+    def set_key_id_map_file(self, path: str):
+        key_id_map_path = os.path.join(self.directory, "key_id_map.json")
+        os.replace(path, key_id_map_path)
+        self.files.append(key_id_map_path)
+
+    def close(self, index_format: str) -> List[str]:
+        """Seals the last shard and writes the index.
+
+        Returns paths of the files written beside the shards: meta, key_id_map and index.
+        """
+        self.writer.close()
+        index_path = self.writer.dump_index(
+            os.path.join(self.directory, INDEX_FILE_NAME), index_format, self.class_names
+        )
+        self.files.append(index_path)
+        return self.files
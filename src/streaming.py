@@ -0,0 +1,133 @@
+# This module contains the bounded producer/consumer pipeline for downloading items.
+
+import asyncio
+from typing import Callable, Dict, Iterator, List, Optional
+
+import supervisely as sly
+
+from retry import DEFAULT_ATTEMPTS, DEFAULT_BACKOFF, download_isolated
+
+DEFAULT_ITEM_SIZE = 1024**2  # used when item info has no size (e.g. remote links)
+BATCH_ITEMS_LIMIT = 50
+
+
+class ByteBudget:
+    """Limits the number of bytes that are downloaded but not yet written to disk.
+
+    A single item bigger than the whole budget is allowed when nothing else is in flight.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._used = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, size: int) -> int:
+        size = min(size, self.limit)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._used + size <= self.limit)
+            self._used += size
+        return size
+
+    async def release(self, size: int):
+        async with self._cond:
+            self._used -= size
+            self._cond.notify_all()
+
+
+def batched_by_size(ids: List[int], sizes: Dict[int, int], batch_bytes: int) -> Iterator[List[int]]:
+    """Splits IDs into batches limited both by items count and by total size in bytes."""
+    batch, batch_size = [], 0
+    for item_id in ids:
+        size = sizes.get(item_id) or DEFAULT_ITEM_SIZE
+        if batch and (batch_size + size > batch_bytes or len(batch) >= BATCH_ITEMS_LIMIT):
+            yield batch
+            batch, batch_size = [], 0
+        batch.append(item_id)
+        batch_size += size
+    if batch:
+        yield batch
+
+
+async def download_images_streamed(
+    api: sly.Api,
+    dataset_id: int,
+    ids: List[int],
+    sizes: Dict[int, int],
+    write_item: Callable[[int, bytes], None],
+    bytes_limit: int,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    progress_cb: Optional[Callable] = None,
+    on_item_failed: Optional[Callable[[int, Exception], None]] = None,
+    attempts: int = DEFAULT_ATTEMPTS,
+    backoff: float = DEFAULT_BACKOFF,
+):
+    """Downloads images in batches and writes every image as soon as it arrives.
+
+    Not more than `bytes_limit` bytes (estimated by image infos) are kept in memory
+    at once, so memory usage does not depend on the number of images in the dataset.
+    Images of a failed batch that were not received yet are retried with backoff.
+
+    :param write_item: Function that writes image bytes to disk, called as
+        ``write_item(image_id, image_bytes)`` in a worker thread, one call at a time.
+    :param on_item_failed: Function called as ``on_item_failed(image_id, error)`` for
+        images that can not be downloaded after all retries. If not set, the error is raised.
+    """
+    budget = ByteBudget(bytes_limit)
+    queue = asyncio.Queue()
+    reserved = {}
+    done = object()
+
+    async def _download_batch(batch_ids: List[int]):
+        received = set()
+
+        async def _download(pending_ids: List[int]):
+            async for img_id, img_bytes in api.image.download_bytes_generator_async(
+                dataset_id, pending_ids, semaphore=semaphore, check_hash=True
+            ):
+                if img_id not in received:
+                    received.add(img_id)
+                    await queue.put((img_id, img_bytes))
+
+        failed = await download_isolated(
+            _download, batch_ids, received.__contains__, attempts, backoff
+        )
+        for img_id, error in failed.items():
+            await queue.put((img_id, error))
+
+    async def _produce():
+        tasks = []
+        try:
+            for batch_ids in batched_by_size(ids, sizes, max(bytes_limit // 4, 1)):
+                for img_id in batch_ids:
+                    reserved[img_id] = await budget.acquire(sizes.get(img_id) or DEFAULT_ITEM_SIZE)
+                tasks.append(asyncio.ensure_future(_download_batch(batch_ids)))
+            await asyncio.gather(*tasks)
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await queue.put((done, e))
+            raise
+        await queue.put((done, None))
+
+    producer = asyncio.ensure_future(_produce())
+    try:
+        while True:
+            img_id, img_bytes = await queue.get()
+            if img_id is done:
+                if img_bytes is not None:
+                    raise img_bytes
+                break
+            if isinstance(img_bytes, Exception):
+                if on_item_failed is None:
+                    raise img_bytes
+                on_item_failed(img_id, img_bytes)
+            else:
+                await asyncio.to_thread(write_item, img_id, img_bytes)
+            await budget.release(reserved.pop(img_id))
+            if progress_cb is not None:
+                progress_cb(1)
+    finally:
+        if not producer.done():
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
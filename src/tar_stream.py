@@ -0,0 +1,270 @@
+# This module contains the writer that streams Supervisely project layout into split tar archive.
+
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+import supervisely as sly
+
+from compression import open_compressed
+
+ITEM_DIR_NAMES = {"image": "img", "video": "video", "pointcloud": "pointcloud"}
+RELATED_IMAGES_DIR_NAME = "related_images"
+
+
+class SplitFileWriter(io.RawIOBase):
+    """Writable file object that splits written data into parts of fixed size.
+
+    Parts are named like in sly.fs.archive_directory: <path>.001, <path>.002, ...
+    If everything fits into one part, it is renamed to <path> on close.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        part_size: int,
+        on_part_sealed: Optional[Callable[[str], None]] = None,
+    ):
+        super().__init__()
+        self.path = path
+        self.part_size = part_size
+        self.on_part_sealed = on_part_sealed
+        self.parts: List[str] = []
+        self.bytes_written = 0
+        self._file = None
+        self._part_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def _open_part(self):
+        part_path = f"{self.path}.{str(len(self.parts) + 1).zfill(3)}"
+        self.parts.append(part_path)
+        self._file = open(part_path, "wb")
+        self._part_written = 0
+
+    def _seal_part(self):
+        self._file.close()
+        self._file = None
+        if self.on_part_sealed is not None:
+            self.on_part_sealed(self.parts[-1])
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        while len(view) > 0:
+            if self._file is None:
+                self._open_part()
+            chunk = view[: self.part_size - self._part_written]
+            self._file.write(chunk)
+            self._part_written += len(chunk)
+            self.bytes_written += len(chunk)
+            view = view[len(chunk) :]
+            if self._part_written >= self.part_size:
+                self._seal_part()
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        single_part = len(self.parts) == 1 and self._file is not None
+        if single_part:
+            self._file.close()
+            self._file = None
+            os.rename(self.parts[0], self.path)
+            self.parts = [self.path]
+            if self.on_part_sealed is not None:
+                self.on_part_sealed(self.path)
+        elif self._file is not None:
+            self._seal_part()
+        super().close()
+
+
+class TarWriter:
+    """Thread-safe writer of files into streamed tar archive, compressed and split into parts.
+
+    Compression is one of "store", "gzip" and "zstd", see ``compression.open_compressed``.
+    """
+
+    def __init__(
+        self,
+        archive_path: str,
+        part_size: int,
+        on_part_sealed: Optional[Callable[[str], None]] = None,
+        compression: str = "gzip",
+        level: Optional[int] = None,
+        workers: int = 1,
+    ):
+        self._splitter = SplitFileWriter(archive_path, part_size, on_part_sealed)
+        self._compressor = open_compressed(self._splitter, compression, level, workers)
+        self._tar = tarfile.open(fileobj=self._compressor, mode="w|", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_written(self) -> int:
+        """Number of compressed bytes written to archive parts so far."""
+        return self._splitter.bytes_written
+
+    @property
+    def parts(self) -> List[str]:
+        return self._splitter.parts
+
+    def add_bytes(self, arcname: str, data: bytes):
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.size = len(data)
+        tarinfo.mtime = int(time.time())
+        with self._lock:
+            self._tar.addfile(tarinfo, io.BytesIO(data))
+
+    def add_json(self, arcname: str, data: Dict):
+        self.add_bytes(arcname, json.dumps(data, indent=4).encode("utf-8"))
+
+    def add_file(self, arcname: str, path: str):
+        with self._lock:
+            self._tar.add(path, arcname=arcname)
+
+    def add_dir(self, arcname: str, path: str):
+        """Adds directory with all its content."""
+        with self._lock:
+            self._tar.add(path, arcname=arcname)
+
+    def add_link(self, arcname: str, target_arcname: str):
+        """Adds hard link entry to the file that is already in the archive."""
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.type = tarfile.LNKTYPE
+        tarinfo.linkname = target_arcname
+        tarinfo.mtime = int(time.time())
+        with self._lock:
+            self._tar.addfile(tarinfo)
+
+    def close(self) -> List[str]:
+        with self._lock:
+            self._tar.close()
+            self._compressor.close()
+            self._splitter.close()
+        return self.parts
+
+
+def archive_directory(
+    dir_path: str,
+    archive_path: str,
+    part_size: Optional[int] = None,
+    compression: str = "store",
+    level: Optional[int] = None,
+    workers: int = 1,
+    on_part_sealed: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    """Archives content of the directory, like ``sly.fs.archive_directory``.
+
+    Data is compressed while it is archived and parts are written at once, without
+    intermediate archive of the whole directory. Returns list of archive parts, or list
+    with the archive path if it fits into one part.
+    """
+    part_size = part_size or sys.maxsize
+    writer = TarWriter(archive_path, part_size, on_part_sealed, compression, level, workers)
+    for name in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, name)
+        if os.path.isdir(path):
+            writer.add_dir(name, path)
+        else:
+            writer.add_file(name, path)
+    return writer.close()
+
+
+class TarDataset:
+    """Dataset that writes items and annotations straight into the archive.
+
+    Implements the part of sly.Dataset interface used by the export. Item files
+    downloaded to the staging directory are removed right after they are archived.
+    """
+
+    def __init__(self, writer: TarWriter, arc_dir: str, staging_dir: str, item_type: str):
+        self.writer = writer
+        self.arc_dir = arc_dir
+        self.directory = staging_dir
+        self.item_type = item_type
+        self.item_dir = os.path.join(staging_dir, ITEM_DIR_NAMES[item_type])
+
+    def _arcname(self, *parts: str) -> str:
+        return "/".join((self.arc_dir,) + parts)
+
+    def get_item_arcname(self, item_name: str) -> str:
+        return self._arcname(ITEM_DIR_NAMES[self.item_type], item_name)
+
+    def generate_item_path(self, item_name: str) -> str:
+        sly.fs.mkdir(self.item_dir)
+        return os.path.join(self.item_dir, item_name)
+
+    def get_related_images_path(self, item_name: str) -> str:
+        item_name_temp = item_name.replace(".", "_")
+        return os.path.join(self.directory, RELATED_IMAGES_DIR_NAME, item_name_temp)
+
+    def add_ann_json(self, item_name: str, ann_json: Dict):
+        self.writer.add_json(self._arcname("ann", item_name + ".json"), ann_json)
+
+    def add_ann_file(self, item_name: str, ann_path: str):
+        self.writer.add_file(self._arcname("ann", item_name + ".json"), ann_path)
+
+    def _add_ann(self, item_name: str, ann):
+        """Adds annotation given as file path, JSON or annotation object."""
+        if isinstance(ann, str):
+            self.add_ann_file(item_name, ann)
+        elif ann is not None:
+            self.add_ann_json(item_name, ann if isinstance(ann, dict) else ann.to_json())
+
+    def add_item_raw_bytes(self, item_name: str, item_raw_bytes: bytes, ann: Union[Dict, str]):
+        self.writer.add_bytes(self.get_item_arcname(item_name), item_raw_bytes)
+        self._add_ann(item_name, ann)
+
+    def add_item_link(self, item_name: str, target_arcname: str):
+        """Adds item file as a hard link to the archived file with the same content."""
+        self.writer.add_link(self.get_item_arcname(item_name), target_arcname)
+
+    def add_item_file(self, item_name: str, item_path: str, ann=None, _validate_item: bool = True):
+        if os.path.isfile(item_path):
+            self.writer.add_file(self.get_item_arcname(item_name), item_path)
+            sly.fs.silent_remove(item_path)
+        if self.item_type == "pointcloud":
+            rimage_dir = self.get_related_images_path(item_name)
+            if os.path.isdir(rimage_dir):
+                rimage_arc_dir = os.path.basename(rimage_dir)
+                for file_name in sorted(os.listdir(rimage_dir)):
+                    self.writer.add_file(
+                        self._arcname(RELATED_IMAGES_DIR_NAME, rimage_arc_dir, file_name),
+                        os.path.join(rimage_dir, file_name),
+                    )
+                sly.fs.remove_dir(rimage_dir)
+        self._add_ann(item_name, ann)
+
+
+class TarProject:
+    """Project that writes Supervisely project layout into the archive as items arrive.
+
+    Implements the part of sly.Project interface used by the export.
+    """
+
+    def __init__(self, writer: TarWriter, project_name: str, staging_dir: str, item_type: str):
+        self.writer = writer
+        self.name = project_name
+        self.staging_dir = staging_dir
+        self.item_type = item_type
+
+    def set_meta(self, meta: sly.ProjectMeta):
+        self.writer.add_json(f"{self.name}/meta.json", meta.to_json())
+
+    def create_dataset(self, ds_name: str, ds_path: Optional[str] = None) -> TarDataset:
+        ds_path = ds_path or ds_name
+        return TarDataset(
+            self.writer,
+            f"{self.name}/{ds_path}",
+            os.path.join(self.staging_dir, ds_path),
+            self.item_type,
+        )
+
+    def set_key_id_map_file(self, path: str):
+        self.writer.add_file(f"{self.name}/key_id_map.json", path)
+        sly.fs.silent_remove(path)
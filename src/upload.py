@@ -0,0 +1,101 @@
+# This module contains the upload of archive parts to Team Files while the archive is being written.
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+import supervisely as sly
+from supervisely.api.file_api import FileInfo
+
+from report import ExportReport
+from retry import DEFAULT_ATTEMPTS, DEFAULT_BACKOFF, retry
+
+
+class UploadError(RuntimeError):
+    """Upload of an archive part failed after all retries, the export can not be completed.
+
+    Not an error of the items being written, so the export is stopped instead of
+    skipping the dataset."""
+
+
+class PartUploader:
+    """Uploads sealed archive parts to Team Files in a pool of threads.
+
+    ``submit`` is passed to the archive writer as the ``on_part_sealed`` callback, so
+    every part is uploaded as soon as it is written while the next parts are being
+    written. Every part is retried separately and removed from disk once the upload
+    is confirmed. The writer is blocked while ``max_pending`` parts are not uploaded
+    yet, so the disk holds only a few parts and not the whole archive.
+    """
+
+    def __init__(
+        self,
+        api: sly.Api,
+        team_id: int,
+        remote_dir: str,
+        workers: int = 4,
+        max_pending: Optional[int] = None,
+        attempts: int = DEFAULT_ATTEMPTS,
+        backoff: float = DEFAULT_BACKOFF,
+        report: Optional[ExportReport] = None,
+    ):
+        self.api = api
+        self.team_id = team_id
+        self.remote_dir = remote_dir
+        self.attempts = attempts
+        self.backoff = backoff
+        self.report = report
+        self.uploaded_bytes = 0
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="upload")
+        self._slots = threading.Semaphore(max_pending or workers * 2)
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+
+    def _check_failed(self):
+        for future in self._futures:
+            error = future.exception() if future.done() and not future.cancelled() else None
+            if error is not None:
+                # parts that are not uploaded yet are useless without the failed one
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                raise UploadError(f"Upload of archive part failed: {repr(error)}") from error
+
+    def _upload(self, path: str) -> FileInfo:
+        try:
+            remote_path = os.path.join(self.remote_dir, os.path.basename(path))
+            size = sly.fs.get_file_size(path)
+            start = time.monotonic()
+            file_info = retry(
+                self.api.file.upload,
+                self.team_id,
+                path,
+                remote_path,
+                attempts=self.attempts,
+                backoff=self.backoff,
+                description=f"Upload of {os.path.basename(path)}",
+            )
+            sly.fs.silent_remove(path)
+            with self._lock:
+                self.uploaded_bytes += size
+            if self.report is not None:
+                self.report.add("upload", wall_time=time.monotonic() - start, items=1, bytes=size)
+            sly.logger.info(f"Archive part is uploaded to Team Files: {remote_path}")
+            return file_info
+        finally:
+            self._slots.release()
+
+    def submit(self, path: str):
+        """Starts upload of the sealed part.
+
+        Raises UploadError if upload of a previous part failed."""
+        self._check_failed()
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._upload, path))
+
+    def wait(self) -> List[FileInfo]:
+        """Waits for all uploads and returns file infos of the parts in order."""
+        try:
+            return [future.result() for future in self._futures]
+        finally:
+            self._pool.shutdown(cancel_futures=True)
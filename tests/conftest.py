@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of the app are imported from src like in the app itself
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,45 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+import supervisely as sly
+
+import ann_pool
+from ann_pool import KeyIdMapSpool, write_annotations_parallel
+
+
+def write_anns(tmp_path, pool, ann_jsons: list) -> tuple:
+    ann_paths = [str(tmp_path / "ann" / f"{idx}.json") for idx in range(len(ann_jsons))]
+    spool = KeyIdMapSpool(str(tmp_path / "spool.jsonl"))
+    errors = asyncio.run(
+        write_annotations_parallel(
+            pool, "video", sly.ProjectMeta(), ann_jsons, ann_paths, spool, (0, 0)
+        )
+    )
+    return errors, ann_paths
+
+
+def make_ann_json() -> dict:
+    return sly.VideoAnnotation((100, 100), 10).to_json()
+
+
+def test_only_failed_annotations_of_chunk_are_lost(tmp_path, monkeypatch):
+    monkeypatch.setattr(ann_pool, "CHUNK_SIZE", 4)
+    ann_jsons = [make_ann_json() for _ in range(10)]
+    ann_jsons[5] = {"size": "broken"}
+    errors, ann_paths = write_anns(tmp_path, None, ann_jsons)
+    assert list(errors) == [5]
+    assert [os.path.exists(path) for path in ann_paths] == [idx != 5 for idx in range(10)]
+
+
+def test_broken_pool_falls_back_to_threads(tmp_path):
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"))
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+    errors, ann_paths = write_anns(tmp_path, pool, [make_ann_json() for _ in range(3)])
+    pool.shutdown()
+    assert errors == {}
+    assert all(os.path.exists(path) for path in ann_paths)
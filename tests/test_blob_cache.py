@@ -0,0 +1,41 @@
+import os
+
+from blob_cache import BlobCache
+
+
+def test_cached_file_is_linked(tmp_path):
+    cache = BlobCache(str(tmp_path / "cache"), 1024)
+    src = tmp_path / "a.jpg"
+    src.write_bytes(b"image")
+    cache.put_file("hash/a", str(src))
+    dst = tmp_path / "export" / "img" / "a.jpg"
+    assert cache.get_file("hash/a", str(dst))
+    assert os.path.samefile(dst, cache._blob_path("hash/a"))
+    assert not cache.get_file("hash/b", str(tmp_path / "b.jpg"))
+    assert cache.get_bytes("hash/a") == b"image"
+    assert cache.to_json() == {
+        "hits": 2,
+        "misses": 1,
+        "hit_bytes": 10,
+        "size": 5,
+        "size_limit": 1024,
+    }
+
+
+def test_eviction_removes_least_recently_used_files(tmp_path):
+    cache = BlobCache(str(tmp_path / "cache"), 25)
+    cache.put_bytes("a", b"0" * 10)
+    cache.put_bytes("b", b"1" * 10)
+    # "a" was read after "b" was added
+    os.utime(cache._blob_path("b"), (1, 1))
+    os.utime(cache._blob_path("a"), (2, 2))
+    cache.put_bytes("c", b"2" * 10)  # 30 bytes exceed the limit, evicted down to 22
+    assert cache.get_bytes("b") is None
+    assert cache.get_bytes("a") == b"0" * 10
+    assert cache.get_bytes("c") == b"2" * 10
+    assert cache.to_json()["size"] == 20
+
+
+def test_size_is_restored_by_next_run(tmp_path):
+    BlobCache(str(tmp_path / "cache"), 1024).put_bytes("a", b"0" * 10)
+    assert BlobCache(str(tmp_path / "cache"), 1024).to_json()["size"] == 10
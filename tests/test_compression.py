@@ -0,0 +1,33 @@
+import gzip
+import io
+
+import pytest
+
+from compression import open_compressed, resolve_compression_level
+
+
+@pytest.mark.parametrize(
+    "compression, level, expected",
+    [
+        ("gzip", None, 6),
+        ("gzip", 0, 6),
+        ("gzip", 1, 1),
+        ("gzip", 9, 9),
+        ("gzip", 19, 9),
+        ("gzip", -1, 1),
+        ("zstd", 0, 3),
+        ("zstd", 19, 19),
+        ("zstd", 22, 19),
+        ("store", 5, None),
+    ],
+)
+def test_resolve_compression_level(compression, level, expected):
+    assert resolve_compression_level(compression, level) == expected
+
+
+def test_gzip_level_out_of_range_is_clamped():
+    buffer = io.BytesIO()
+    writer = open_compressed(buffer, "gzip", level=19, workers=2)
+    writer.write(b"data" * 1000)
+    writer.close()
+    assert gzip.decompress(buffer.getvalue()) == b"data" * 1000
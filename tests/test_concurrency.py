@@ -0,0 +1,62 @@
+import asyncio
+
+from concurrency import AdaptiveSemaphore
+
+
+async def run_requests(semaphore: AdaptiveSemaphore, count: int, fail: bool = False):
+    async def _request():
+        try:
+            async with semaphore:
+                await asyncio.sleep(0.001)
+                if fail:
+                    raise ConnectionError("429 Too Many Requests")
+        except ConnectionError:
+            pass
+
+    await asyncio.gather(*[_request() for _ in range(count)])
+
+
+def count_free_permits(semaphore: AdaptiveSemaphore) -> int:
+    count = 0
+    while not semaphore.locked():
+        asyncio.run(semaphore.acquire())
+        count += 1
+    return count
+
+
+def test_limit_shrinks_after_errors_and_recovers():
+    semaphore = AdaptiveSemaphore(8, floor=2, ceiling=10, window=2)
+
+    async def _run():
+        await run_requests(semaphore, 1, fail=True)
+        assert semaphore.limit == 4
+        for _ in range(20):
+            semaphore._on_success(0.01)  # stable latency
+
+    asyncio.run(_run())
+    assert semaphore.min_limit == 4
+    assert semaphore.limit == 10
+    assert semaphore.errors == 1
+    assert count_free_permits(semaphore) == 10
+
+
+def test_decrease_takes_free_permits_first():
+    semaphore = AdaptiveSemaphore(8, floor=1)
+    semaphore._set_limit(2)
+    assert semaphore._debt == 0
+    assert count_free_permits(semaphore) == 2
+
+
+def test_decrease_takes_permits_of_holders_on_release():
+    semaphore = AdaptiveSemaphore(4, floor=1)
+
+    async def _run():
+        for _ in range(3):
+            await semaphore.acquire()
+        semaphore._set_limit(1)  # one free permit is taken, two are in debt
+        assert semaphore._debt == 2
+        for _ in range(3):
+            semaphore.release()
+
+    asyncio.run(_run())
+    assert count_free_permits(semaphore) == 1
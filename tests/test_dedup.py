@@ -0,0 +1,37 @@
+import os
+from types import SimpleNamespace
+
+from dedup import ContentIndex, link_duplicate_item
+
+
+def test_split_downloads_every_hash_once():
+    index = ContentIndex()
+    index.add("exported", "/project/ds/img/a.jpg")
+    hashes = {1: "h1", 2: "h1", 3: "exported", 4: None, 5: None, 6: "h2"}
+    to_download, duplicates = index.split([1, 2, 3, 4, 5, 6], hashes)
+    assert to_download == [1, 4, 5, 6]
+    assert duplicates == {2: "h1", 3: "exported"}
+
+
+def test_first_source_is_kept():
+    index = ContentIndex()
+    index.add("h1", "a.jpg")
+    index.add("h1", "b.jpg")
+    index.add(None, "c.jpg")
+    assert index.get("h1") == "a.jpg"
+    assert index.get(None) is None
+    index.count_duplicate(10)
+    index.count_duplicate()
+    assert index.to_json() == {"unique_files": 1, "duplicates": 2, "saved_bytes": 10}
+
+
+def test_duplicate_is_linked_to_source(tmp_path):
+    source = tmp_path / "ds" / "img" / "a.jpg"
+    source.parent.mkdir(parents=True)
+    source.write_bytes(b"image")
+    dataset_fs = SimpleNamespace(
+        generate_item_path=lambda name: str(tmp_path / "ds" / "img" / name)
+    )
+    path = link_duplicate_item(dataset_fs, "b.jpg", str(source))
+    assert path == str(tmp_path / "ds" / "img" / "b.jpg")
+    assert os.path.samefile(path, source)
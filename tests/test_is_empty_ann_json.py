@@ -0,0 +1,132 @@
+import uuid
+
+import pytest
+import supervisely as sly
+from supervisely.geometry.cuboid_3d import Cuboid3d
+from supervisely.video_annotation.key_id_map import KeyIdMap
+
+from selection import is_empty_ann_json
+
+META = sly.ProjectMeta(
+    obj_classes=sly.ObjClassCollection(
+        [sly.ObjClass("car", sly.Rectangle), sly.ObjClass("box", Cuboid3d)]
+    ),
+    tag_metas=sly.TagMetaCollection([sly.TagMeta("day", sly.TagValueType.NONE)]),
+)
+SIZE = {"height": 100, "width": 100}
+RECTANGLE = {"points": {"exterior": [[10, 10], [50, 50]], "interior": []}}
+CUBOID = {
+    "position": {"x": 0, "y": 0, "z": 0},
+    "rotation": {"x": 0, "y": 0, "z": 0},
+    "dimensions": {"x": 1, "y": 1, "z": 1},
+}
+
+
+def image_ann(tags: bool, objects: bool) -> dict:
+    return {
+        "description": "",
+        "size": SIZE,
+        "tags": [{"name": "day", "value": None}] if tags else [],
+        "objects": [{"classTitle": "car", "tags": [], **RECTANGLE}] if objects else [],
+    }
+
+
+def video_ann(tags: bool, objects: bool, frames: bool = False) -> dict:
+    object_key = uuid.uuid4().hex
+    ann = {
+        "description": "",
+        "size": SIZE,
+        "framesCount": 10,
+        "key": uuid.uuid4().hex,
+        "tags": [{"name": "day", "key": uuid.uuid4().hex}] if tags else [],
+        "objects": [],
+        "frames": [],
+    }
+    if objects:
+        ann["objects"] = [{"key": object_key, "classTitle": "car", "tags": []}]
+        figure = {
+            "key": uuid.uuid4().hex,
+            "objectKey": object_key,
+            "geometryType": "rectangle",
+            "geometry": RECTANGLE,
+        }
+        ann["frames"] = [{"index": 0, "figures": [figure]}]
+    elif frames:
+        ann["frames"] = [{"index": 0, "figures": []}, {"index": 1, "figures": []}]
+    return ann
+
+
+def pointcloud_ann(tags: bool, objects: bool, figures: bool = False) -> dict:
+    object_key = uuid.uuid4().hex
+    ann = {
+        "description": "",
+        "key": uuid.uuid4().hex,
+        "tags": [{"name": "day", "key": uuid.uuid4().hex}] if tags else [],
+        "objects": [],
+        "figures": [],
+    }
+    if objects or figures:
+        figure = {
+            "key": uuid.uuid4().hex,
+            "objectKey": object_key,
+            "geometryType": "cuboid_3d",
+            "geometry": CUBOID,
+        }
+        ann["figures"] = [figure]
+    if objects:
+        ann["objects"] = [{"key": object_key, "classTitle": "box", "tags": []}]
+    return ann
+
+
+def image_is_empty(ann_json: dict) -> bool:
+    return sly.Annotation.from_json(ann_json, META).is_empty()
+
+
+def video_is_empty(ann_json: dict) -> bool:
+    return sly.VideoAnnotation.from_json(ann_json, META, KeyIdMap()).is_empty()
+
+
+def pointcloud_is_empty(ann_json: dict) -> bool:
+    return sly.PointcloudAnnotation.from_json(ann_json, META, KeyIdMap()).is_empty()
+
+
+CASES = {
+    "empty": dict(tags=False, objects=False),
+    "tags_only": dict(tags=True, objects=False),
+    "objects_only": dict(tags=False, objects=True),
+    "tags_and_objects": dict(tags=True, objects=True),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+@pytest.mark.parametrize(
+    "make_ann, slow_is_empty",
+    [
+        (image_ann, image_is_empty),
+        (video_ann, video_is_empty),
+        (pointcloud_ann, pointcloud_is_empty),
+    ],
+    ids=["image", "video", "pointcloud"],
+)
+def test_matches_annotation_is_empty(case, make_ann, slow_is_empty):
+    ann_json = make_ann(**CASES[case])
+    assert is_empty_ann_json(ann_json) == slow_is_empty(ann_json)
+
+
+def test_video_frames_without_objects():
+    ann_json = video_ann(tags=False, objects=False, frames=True)
+    assert is_empty_ann_json(ann_json)
+    assert video_is_empty(ann_json)
+
+
+def test_pointcloud_figures_without_objects():
+    ann_json = pointcloud_ann(tags=False, objects=False, figures=True)
+    assert is_empty_ann_json(ann_json)
+    # figures can not exist without their objects, the annotation is not valid
+    with pytest.raises(Exception):
+        pointcloud_is_empty(ann_json)
+
+
+def test_missing_fields():
+    assert is_empty_ann_json({})
+    assert is_empty_ann_json({"objects": None, "tags": None})
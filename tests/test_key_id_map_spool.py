@@ -0,0 +1,48 @@
+import json
+import random
+import uuid
+
+from supervisely.video_annotation.key_id_map import KeyIdMap
+
+from ann_pool import KeyIdMapSpool
+
+
+def make_part(start_id: int) -> dict:
+    key_id_map = KeyIdMap()
+    for idx in range(3):
+        key_id_map.add_object(uuid.uuid4(), start_id + idx)
+        key_id_map.add_figure(uuid.uuid4(), start_id + idx)
+    return key_id_map.to_dict()
+
+
+def dump_parts(tmp_path, parts: list, name: str) -> str:
+    spool = KeyIdMapSpool(str(tmp_path / f"{name}.jsonl"))
+    for order, part in parts:
+        spool.add(part, order)
+    path = tmp_path / f"{name}.json"
+    spool.dump(str(path))
+    return path.read_text()
+
+
+def test_dump_does_not_depend_on_order_of_parts(tmp_path):
+    parts = [
+        ((ds_idx, batch_idx, 0), make_part(100 * ds_idx + 10 * batch_idx))
+        for ds_idx in range(2)
+        for batch_idx in range(3)
+    ]
+    shuffled = list(parts)
+    random.Random(0).shuffle(shuffled)
+    assert dump_parts(tmp_path, shuffled, "shuffled") == dump_parts(tmp_path, parts, "ordered")
+
+
+def test_dump_is_loaded_by_key_id_map(tmp_path):
+    part = make_part(1)
+    path = tmp_path / "key_id_map.json"
+    spool = KeyIdMapSpool(str(tmp_path / "spool.jsonl"))
+    spool.add(part, (0, 0, 0))
+    spool.add(make_part(10), (0, 0, 1))
+    spool.add(KeyIdMap().to_dict(), (0, 0, 2))  # empty parts are skipped
+    spool.dump(str(path))
+    key_id_map = KeyIdMap.load_json(str(path))
+    assert len(key_id_map.to_dict()["objects"]) == 6
+    assert json.loads(path.read_text())["objects"].items() >= part["objects"].items()
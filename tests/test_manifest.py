@@ -0,0 +1,52 @@
+from manifest import ExportManifest, get_ann_hash
+
+OPTIONS = {"items": True, "output": "directory", "selection": {"classes": ["car"]}}
+
+
+def make_manifest() -> ExportManifest:
+    manifest = ExportManifest(1, options=OPTIONS)
+    manifest.add(10, 100, "ds", "a.jpg", "2024-01-01T00:00:00Z", "hash_a")
+    manifest.add(11, 100, "ds", "b.jpg", "2024-01-01T00:00:00Z", "hash_b")
+    manifest.add(20, 200, "ds2", "c.jpg", "2024-01-01T00:00:00Z", "hash_c")
+    return manifest
+
+
+def test_dump_and_load(tmp_path):
+    manifest = make_manifest()
+    manifest.remove(11)
+    path = str(tmp_path / "manifest.json")
+    manifest.dump(path)
+    loaded = ExportManifest.load(path)
+    assert loaded.project_id == 1
+    assert loaded.options == OPTIONS
+    assert loaded.items == manifest.items
+    assert list(loaded.items) == [10, 20]  # IDs are integers again
+    assert ExportManifest.load(str(tmp_path / "missing.json")) is None
+
+
+def test_broken_manifest_is_not_loaded(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text('{"items": ')
+    assert ExportManifest.load(str(path)) is None
+
+
+def test_unchanged_items():
+    manifest = make_manifest()
+    assert manifest.is_unchanged(10, "2024-01-01T00:00:00Z", "hash_a")
+    assert not manifest.is_unchanged(10, "2024-02-01T00:00:00Z", "hash_a")
+    assert not manifest.is_unchanged(10, "2024-01-01T00:00:00Z", "hash_b")
+    assert not manifest.is_unchanged(30, "2024-01-01T00:00:00Z", "hash_a")
+
+
+def test_items_of_datasets():
+    manifest = make_manifest()
+    assert list(manifest.get_dataset_items(100)) == [10, 11]
+    assert list(manifest.get_stale_items([100])) == [20]
+    manifest.remove(20)
+    manifest.remove(20)
+    assert manifest.to_json()["removed"] == [20]
+
+
+def test_ann_hash_does_not_depend_on_keys_order():
+    assert get_ann_hash({"a": 1, "b": [1, 2]}) == get_ann_hash({"b": [1, 2], "a": 1})
+    assert get_ann_hash({"a": 1}) != get_ann_hash({"a": 2})
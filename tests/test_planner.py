@@ -0,0 +1,56 @@
+import pytest
+
+from planner import DISK_RESERVE, get_required_bytes, plan_export
+
+GB = 1024**3
+PART = 500 * 1024**2
+PARTS_IN_FLIGHT = 8
+SIZE_LIMIT = 100 * GB
+
+
+def plan(estimated, free, stream=False, keep=False, existing=0):
+    return plan_export(estimated, stream, keep, free, SIZE_LIMIT, PART, PARTS_IN_FLIGHT, existing)
+
+
+def test_small_project_is_archived_to_one_file():
+    result = plan(10 * GB, 100 * GB)
+    assert result.strategy == "directory"
+    assert result.required_bytes == 20 * GB + DISK_RESERVE
+
+
+def test_big_project_is_split_before_the_download():
+    result = plan(200 * GB, 500 * GB)
+    assert result.strategy == "split"
+    assert result.required_bytes == 200 * GB + PART * (PARTS_IN_FLIGHT + 1) + DISK_RESERVE
+
+
+def test_project_that_does_not_fit_is_streamed():
+    assert plan(200 * GB, 50 * GB).strategy == "stream"
+
+
+def test_kept_project_is_not_counted_again():
+    # the second complete export of a 30 GB project with 35 GB free disk
+    result = plan(30 * GB, 35 * GB, keep=True, existing=30 * GB)
+    assert result.strategy == "directory"
+    assert result.required_bytes == 30 * GB + DISK_RESERVE
+
+
+def test_kept_project_goes_on_when_upper_bound_does_not_fit():
+    assert plan(30 * GB, 10 * GB, keep=True).strategy == "directory"
+
+
+def test_unknown_size_is_archived_as_directory():
+    result = plan(None, 10 * GB)
+    assert result.strategy == "directory"
+    assert result.required_bytes is None
+
+
+def test_raises_if_archive_parts_do_not_fit():
+    with pytest.raises(RuntimeError):
+        plan(None, PART, stream=True)
+
+
+def test_stream_does_not_depend_on_project_size():
+    assert get_required_bytes("stream", 500 * GB, PART, PARTS_IN_FLIGHT) == get_required_bytes(
+        "stream", 0, PART, PARTS_IN_FLIGHT
+    )
@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from retry import FailedItemsLedger, download_isolated, retry_async
+
+
+def test_retry_async_returns_result_of_successful_retry():
+    calls = []
+
+    async def _request():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("502 Bad Gateway")
+        return "ok"
+
+    assert asyncio.run(retry_async(_request, attempts=2, backoff=0)) == "ok"
+    assert len(calls) == 2
+
+
+def test_retry_async_raises_last_error():
+    async def _request():
+        raise ConnectionError("502 Bad Gateway")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(retry_async(_request, attempts=2, backoff=0))
+
+
+def test_item_that_fails_once_is_retried_alone():
+    done, requests = set(), []
+
+    async def _download(ids):
+        requests.append(list(ids))
+        for item_id in ids:
+            if item_id == 2 and len(requests) == 1:
+                raise ConnectionError("connection reset")
+            done.add(item_id)
+
+    errors = asyncio.run(download_isolated(_download, [1, 2, 3], done.__contains__, 3, 0))
+    assert errors == {}
+    assert done == {1, 2, 3}
+    assert requests == [[1, 2, 3], [2, 3]]
+
+
+def test_only_failing_item_is_returned():
+    done = set()
+
+    async def _download(ids):
+        for item_id in ids:
+            if item_id == 2:
+                raise ConnectionError("404 Not Found")
+            done.add(item_id)
+
+    errors = asyncio.run(download_isolated(_download, [1, 2, 3], done.__contains__, 2, 0))
+    assert list(errors) == [2]
+    assert isinstance(errors[2], ConnectionError)
+    assert done == {1, 3}
+
+
+def test_ledger_keeps_failed_items_by_dataset():
+    ledger = FailedItemsLedger()
+    dataset = SimpleNamespace(id=1, name="ds")
+    ledger.add(dataset, "item_download", ConnectionError("timeout"), 10, "a.jpg")
+    ledger.add(SimpleNamespace(id=2, name="ds2"), "listing", RuntimeError("500"))
+    assert len(ledger) == 2
+    assert ledger.get_ids(1) == {10}
+    assert ledger.get_ids(2) == {None}
+    assert ledger.to_json()[0] == {
+        "dataset_id": 1,
+        "dataset": "ds",
+        "item_id": 10,
+        "name": "a.jpg",
+        "stage": "item_download",
+        "error": "ConnectionError('timeout')",
+    }
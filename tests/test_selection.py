@@ -0,0 +1,88 @@
+import pytest
+import supervisely as sly
+
+from selection import ItemSelector, count_annotation, parse_names, prune_ann_json
+
+IMAGE_ANN = {
+    "tags": [{"name": "day"}],
+    "objects": [
+        {"classTitle": "car", "tags": [{"name": "parked"}]},
+        {"classTitle": "car", "tags": []},
+        {"classTitle": "person", "tags": []},
+    ],
+}
+
+VIDEO_ANN = {
+    "tags": [],
+    "objects": [{"key": "o1", "classTitle": "car"}, {"key": "o2", "classTitle": "person"}],
+    "frames": [
+        {"index": 0, "figures": [{"objectKey": "o1"}, {"objectKey": "o2"}]},
+        {"index": 1, "figures": [{"objectKey": "o2"}]},
+    ],
+}
+
+
+def test_count_annotation():
+    counts = count_annotation(IMAGE_ANN)
+    assert counts.classes == {"car": 2, "person": 1}
+    assert counts.tags == {"day": 1, "parked": 1}
+
+
+@pytest.mark.parametrize(
+    "classes, tags, min_objects, expected",
+    [
+        ([], [], 3, True),
+        ([], [], 4, False),
+        (["car"], [], 2, True),
+        (["car"], [], 3, False),
+        (["truck"], [], 0, False),
+        (["car"], ["parked"], 0, True),
+        (["car"], ["night"], 0, False),
+        ([], ["day", "night"], 0, True),
+    ],
+)
+def test_match(classes, tags, min_objects, expected):
+    selector = ItemSelector(classes, tags, min_objects)
+    assert selector.match(count_annotation(IMAGE_ANN)) is expected
+    assert (selector.selected, selector.not_selected) == ((1, 0) if expected else (0, 1))
+
+
+def test_prune_removes_objects_and_their_figures():
+    pruned = prune_ann_json(VIDEO_ANN, {"car"})
+    assert pruned["objects"] == [{"key": "o1", "classTitle": "car"}]
+    assert [frame["figures"] for frame in pruned["frames"]] == [[{"objectKey": "o1"}], []]
+    assert len(VIDEO_ANN["objects"]) == 2  # source annotation is not changed
+
+
+def test_pointcloud_figures_are_pruned():
+    ann = {"objects": VIDEO_ANN["objects"], "figures": [{"objectKey": "o2"}]}
+    assert prune_ann_json(ann, {"car"})["figures"] == []
+
+
+def test_prune_meta_and_options():
+    meta = sly.ProjectMeta(
+        obj_classes=[sly.ObjClass("car", sly.Rectangle), sly.ObjClass("person", sly.Rectangle)]
+    )
+    selector = ItemSelector(["car"], [], prune=True)
+    assert [obj_class.name for obj_class in selector.prune_meta(meta).obj_classes] == ["car"]
+    assert selector.get_options() == {
+        "classes": ["car"],
+        "tags": [],
+        "min_objects": 0,
+        "prune": True,
+    }
+    # without classes there is nothing to prune by
+    assert ItemSelector([], ["day"], prune=True).prune_ann_json(IMAGE_ANN) is IMAGE_ANN
+
+
+def test_validate_raises_if_no_selected_class_exists():
+    meta = sly.ProjectMeta(obj_classes=[sly.ObjClass("car", sly.Rectangle)])
+    ItemSelector(["car", "truck"], []).validate(meta)
+    with pytest.raises(RuntimeError):
+        ItemSelector(["truck"], []).validate(meta)
+
+
+def test_parse_names():
+    assert parse_names(" car, person ,") == ["car", "person"]
+    assert parse_names('["car, red", "person"]') == ["car, red", "person"]
+    assert parse_names(None) == []
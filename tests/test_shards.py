@@ -0,0 +1,53 @@
+import os
+import tarfile
+
+import numpy as np
+
+from selection import AnnotationCounts
+from shards import ShardWriter
+
+
+def read_at(path: str, offset: int, size: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def write_samples(tmp_path, count: int):
+    sealed = []
+    writer = ShardWriter(str(tmp_path / "shards"), 4096, sealed.append)
+    item_path = tmp_path / "item.bin"
+    for item_id in range(count):
+        item_path.write_bytes(bytes([item_id]) * (700 + item_id))
+        ann = f'{{"id": {item_id}}}'.encode()
+        counts = AnnotationCounts({"car": item_id}, {})
+        files = [("jpg", str(item_path)), ("json", ann)]
+        writer.add_sample(str(item_id), files, item_id, f"{item_id}.jpg", "ds", counts)
+    return writer, sealed
+
+
+def test_offsets_point_to_data_in_shards(tmp_path):
+    writer, sealed = write_samples(tmp_path, 10)
+    shards = writer.close()
+    assert len(shards) > 1
+    assert sealed == shards
+    for record in writer.records:
+        path = os.path.join(writer.shards_dir, record.shard)
+        item_id = record.item_id
+        assert read_at(path, record.offset, record.size) == bytes([item_id]) * (700 + item_id)
+        assert read_at(path, record.ann_offset, record.ann_size) == f'{{"id": {item_id}}}'.encode()
+    with tarfile.open(shards[0]) as tar:
+        assert tar.getnames()[:2] == ["0.jpg", "0.json"]
+    assert writer.bytes_written == sum(os.path.getsize(path) for path in shards)
+
+
+def test_npz_index(tmp_path):
+    writer, _ = write_samples(tmp_path, 3)
+    writer.close()
+    path = writer.dump_index(str(tmp_path / "index"), "npz", ["car", "person"])
+    index = np.load(path)
+    assert index["item_id"].tolist() == [0, 1, 2]
+    assert index["key"].tolist() == ["0", "1", "2"]
+    assert index["objects/car"].tolist() == [0, 1, 2]
+    assert index["objects/person"].tolist() == [0, 0, 0]
+    assert index["offset"].tolist() == [r.offset for r in writer.records]
@@ -0,0 +1,57 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from tar_stream import SplitFileWriter, TarWriter
+
+
+def join_parts(parts: list) -> bytes:
+    data = b""
+    for path in parts:
+        with open(path, "rb") as f:
+            data += f.read()
+    return data
+
+
+def test_data_is_split_into_parts(tmp_path):
+    sealed = []
+    writer = SplitFileWriter(str(tmp_path / "archive.tar"), 10, sealed.append)
+    writer.write(b"0123456789abcdef")
+    writer.write(b"ghij")
+    writer.write(b"k")
+    writer.close()
+    assert sealed == [str(tmp_path / f"archive.tar.{idx:03d}") for idx in range(1, 4)]
+    assert [os.path.getsize(path) for path in sealed] == [10, 10, 1]
+    assert join_parts(sealed) == b"0123456789abcdefghijk"
+    assert writer.bytes_written == 21
+
+
+def test_single_part_is_renamed(tmp_path):
+    sealed = []
+    writer = SplitFileWriter(str(tmp_path / "archive.tar"), 100, sealed.append)
+    writer.write(b"data")
+    writer.close()
+    assert sealed == writer.parts == [str(tmp_path / "archive.tar")]
+
+
+@pytest.mark.parametrize("compression, mode", [("store", "r:"), ("gzip", "r:gz")])
+def test_parts_make_one_archive(tmp_path, compression, mode):
+    src = tmp_path / "item.bin"
+    src.write_bytes(os.urandom(5000))
+    sealed = []
+    writer = TarWriter(str(tmp_path / "archive.tar"), 2048, sealed.append, compression)
+    writer.add_bytes("project/meta.json", b"{}")
+    writer.add_file("project/ds/img/a.jpg", str(src))
+    writer.add_link("project/ds/img/b.jpg", "project/ds/img/a.jpg")
+    parts = writer.close()
+    assert len(parts) > 1
+    assert sealed == parts
+    with tarfile.open(fileobj=io.BytesIO(join_parts(parts)), mode=mode) as tar:
+        assert tar.getnames() == [
+            "project/meta.json",
+            "project/ds/img/a.jpg",
+            "project/ds/img/b.jpg",
+        ]
+        assert tar.extractfile("project/ds/img/b.jpg").read() == src.read_bytes()
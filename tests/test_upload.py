@@ -0,0 +1,56 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from upload import PartUploader, UploadError
+
+
+class FileApi:
+    """Team Files API that fails uploads of the files with the given names."""
+
+    def __init__(self, failing: set):
+        self.failing = failing
+        self.uploaded = []
+        self._lock = threading.Lock()
+
+    def upload(self, team_id: int, path: str, remote_path: str):
+        if remote_path.rsplit("/", 1)[-1] in self.failing:
+            raise ConnectionError("server is not available")
+        with self._lock:
+            self.uploaded.append(remote_path)
+
+
+def make_parts(tmp_path, count: int) -> list:
+    paths = []
+    for idx in range(count):
+        path = tmp_path / f"archive.tar.{idx:03d}"
+        path.write_bytes(b"0" * 10)
+        paths.append(str(path))
+    return paths
+
+
+def make_uploader(failing: set) -> PartUploader:
+    api = SimpleNamespace(file=FileApi(failing))
+    return PartUploader(api, 1, "/export", workers=2, attempts=2, backoff=0)
+
+
+def test_parts_are_uploaded_and_removed(tmp_path):
+    uploader = make_uploader(set())
+    paths = make_parts(tmp_path, 3)
+    for path in paths:
+        uploader.submit(path)
+    uploader.wait()
+    assert sorted(uploader.api.file.uploaded) == [f"/export/archive.tar.{i:03d}" for i in range(3)]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_part_stops_next_submit(tmp_path):
+    uploader = make_uploader({"archive.tar.000"})
+    first, second = make_parts(tmp_path, 2)
+    uploader.submit(first)
+    uploader._futures[0].exception()  # waits for the failed upload
+    with pytest.raises(UploadError) as exc_info:
+        uploader.submit(second)
+    assert isinstance(exc_info.value.__cause__, ConnectionError)
+    assert (tmp_path / "archive.tar.000").exists()